@@ -0,0 +1,76 @@
+from stupendous_cow.db.main import Database
+from util.cmd_line_args import SimpleCmdLineArgs, parse_args_and_exec
+
+COMMANDS = ('status', 'create', 'rebuild', 'check', 'drop')
+
+class CmdLineArgs(SimpleCmdLineArgs):
+    def __init__(self):
+        SimpleCmdLineArgs.__init__(self,
+                                   (('--db', 'Database file', True,
+                                     'database_filename'),
+                                    ('', 'Command', True, 'command')))
+
+def run(args):
+    if args.command not in COMMANDS:
+        print 'ERROR: The command must be one of %s' % ', '.join(COMMANDS)
+        exit(1)
+
+    db = Database(args.database_filename)
+    try:
+        counts = db.article_counts
+        if (args.command in ('rebuild', 'check')) and not counts.available:
+            print 'ERROR: The database has no article counts.  Use the ' + \
+                  '"create" command to add them'
+            exit(1)
+
+        if args.command == 'status':
+            print 'Article counts are %s' % \
+                ('maintained' if counts.available else 'not maintained')
+        elif args.command == 'create':
+            counts.create()
+            db.commit()
+            print 'Created article counts'
+        elif args.command == 'rebuild':
+            num_rows = counts.rebuild()
+            db.commit()
+            print 'Rebuilt article counts: %d rows' % num_rows
+        elif args.command == 'check':
+            differences = counts.check()
+            for (venue_id, year, category_id, article_type_id, is_read,
+                 num_articles, num_counted) in differences:
+                print 'venue_id=%s year=%s category_id=%s ' \
+                      'article_type_id=%s is_read=%s: %d articles, ' \
+                      '%d counted' % (venue_id, year, category_id,
+                                      article_type_id, is_read, num_articles,
+                                      num_counted)
+            if differences:
+                print 'ERROR: %d article counts are wrong.  Use the ' \
+                      '"rebuild" command to correct them' % len(differences)
+                exit(1)
+            print 'Article counts are correct'
+        else:
+            counts.drop()
+            db.commit()
+            print 'Dropped article counts'
+    finally:
+        db.close()
+
+def usage(args = None):
+    print """article_counts.py --db <file> <command>
+  <command>             One of
+                          status   Tell whether the database maintains
+                                   article counts
+                          create   Add the article counts table and the
+                                   triggers that keep it up to date
+                          rebuild  Recompute the article counts from the
+                                   articles
+                          check    Compare the article counts with the
+                                   articles, listing the differences.  Exits
+                                   with status 1 if there are any
+                          drop     Remove the article counts and their
+                                   triggers
+  --db <file>           Database file
+"""
+
+if __name__ == '__main__':
+    parse_args_and_exec(CmdLineArgs(), run, usage)
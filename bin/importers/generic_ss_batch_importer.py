@@ -0,0 +1,146 @@
+from stupendous_cow.db.main import Database
+from stupendous_cow.importer.generic_ss.batch import BatchImporter, \
+    load_manifest
+from stupendous_cow.importer.extractors import DEFAULT_EXTRACTION_TIMEOUT, \
+    DOCUMENT_EXTRACTOR_FACTORIES
+from stupendous_cow.importer.metrics import run_report
+from stupendous_cow.importer.supervision import default_quarantine_filename
+from stupendous_cow.profiling import start_profiling_from_environment
+from util.cmd_line_args import SimpleCmdLineArgs, parse_args_and_exec
+import datetime
+import json
+import logging
+import os.path
+import sys
+
+LOGGING_LEVEL_MAP = { 'TRACE' : logging.NOTSET, 'DEBUG' : logging.DEBUG,
+                      'INFO' : logging.INFO, 'WARN' : logging.WARNING,
+                      'ERROR' : logging.ERROR, 'OFF' : logging.CRITICAL }
+
+class CmdLineArgs(SimpleCmdLineArgs):
+    def __init__(self):
+        SimpleCmdLineArgs.__init__(self,
+                                   (('--log-file', 'Log file', False,
+                                     'logging_filename'),
+                                    ('--log-level', 'Logging level', False,
+                                     tuple(LOGGING_LEVEL_MAP)),
+                                    ('--workers', 'Number of worker processes',
+                                     False, 'num_workers'),
+                                    ('--deadline', 'Extraction deadline',
+                                     False, 'deadline'),
+                                    ('--fallback', 'Fallback extractor',
+                                     False, 'fallback'),
+                                    ('--quarantine', 'Quarantine file', False,
+                                     'quarantine_filename'),
+                                    ('--report', 'Run report file', False,
+                                     'report_filename'),
+                                    ('--db', 'Database file', True,
+                                     'database_filename'),
+                                    ('', 'Manifest file', True,
+                                     'manifest_filename')))
+    def _init(self, args):
+        SimpleCmdLineArgs._init(args)
+        args.log_level = LOGGING_LEVEL_MAP['OFF']
+
+def run(args):
+    logging_args = { 'format' : '%(asctime)s %(process)d %(levelname)s ' + \
+                                '%(message)s',
+                     'datefmt' : '%Y-%m-%d %H:%M:%S',
+                     'level' : LOGGING_LEVEL_MAP[args.logging_level] }
+    if hasattr(args, 'logging_filename'):
+        logging_args['filename'] = args.logging_filename
+    else:
+        logging_args['stream'] = sys.stdout
+    logging.basicConfig(**logging_args)
+    start_profiling_from_environment()
+
+    num_workers = None
+    if hasattr(args, 'num_workers'):
+        try:
+            num_workers = int(args.num_workers)
+        except ValueError:
+            num_workers = 0
+        if num_workers < 1:
+            print 'ERROR: --workers must be a positive integer'
+            exit(1)
+
+    deadline = DEFAULT_EXTRACTION_TIMEOUT
+    if hasattr(args, 'deadline'):
+        try:
+            deadline = float(args.deadline)
+        except ValueError:
+            deadline = 0
+        if deadline <= 0:
+            print 'ERROR: --deadline must be a positive number of seconds'
+            exit(1)
+
+    fallback = getattr(args, 'fallback', None)
+    if fallback and (fallback not in DOCUMENT_EXTRACTOR_FACTORIES):
+        print 'ERROR: --fallback must be one of %s' % \
+            ', '.join(sorted(DOCUMENT_EXTRACTOR_FACTORIES))
+        exit(1)
+
+    entries = load_manifest(args.manifest_filename)
+    quarantine_filename = getattr(args, 'quarantine_filename',
+                                  default_quarantine_filename())
+    importer = BatchImporter(args.database_filename, entries, num_workers,
+                             deadline = deadline, fallback = fallback,
+                             quarantine_filename = quarantine_filename)
+    started_at = datetime.datetime.now()
+    try:
+        report = importer.run()
+    except ValueError as e:
+        print 'ERROR: %s' % e
+        exit(1)
+    print report.format()
+
+    report_run = run_report('generic_ss_batch_importer', started_at,
+                            report.elapsed, report.total, report.metrics,
+                            report.extraction_stats,
+                            manifest = os.path.abspath(args.manifest_filename),
+                            num_workers = importer.num_workers,
+                            num_groups_failed = report.num_groups_failed)
+    db = Database(args.database_filename)
+    try:
+        db.import_runs.add(report_run)
+        db.commit()
+    finally:
+        db.close()
+    if hasattr(args, 'report_filename'):
+        with open(args.report_filename, 'w') as output:
+            json.dump(report_run, output, indent = 2, sort_keys = True)
+
+def usage(args = None):
+    print """generic_ss_batch_importer.py [--log-file <file>]
+                             [--log-level <level>] [--workers <n>]
+                             [--deadline <seconds>] [--fallback <extractor>]
+                             [--quarantine <file>] [--report <file>]
+                             --db <file> <manifest>
+  <manifest>            YAML list of Config/Workbook pairs to import, e.g.
+                          - Config: nips2018.yaml
+                            Workbook: nips2018.ods
+  --db <file>           Database file
+  --workers <n>         Number of worker processes.  The default is one per
+                        CPU
+  --deadline <seconds>  Time allowed for extracting one document before the
+                        extractor is killed.  The default is %d
+  --fallback <extractor>
+                        Extractor to try, once, on documents that still
+                        cannot be extracted after a retry, such as
+                        first_pages_pdf.  Articles it extracts are imported
+                        again by the next run, and never replace the content
+                        of an article that already has some.  The default is
+                        to have no fallback
+  --quarantine <file>   File listing the documents that keep failing to
+                        extract, which are skipped.  The default is
+                        %s
+  --report <file>       Write a JSON report of the run, with the time spent
+                        in each stage, to this file.  The report is also
+                        added to the database's import_runs table
+  --log-file <file>     Log file.  Default is to write the log to stdout
+  --log-level <level>   Logging level (TRACE, DEBUG, INFO, WARN, ERROR, OFF).
+                        The default is OFF
+""" % (DEFAULT_EXTRACTION_TIMEOUT, default_quarantine_filename())
+
+if __name__ == '__main__':
+    parse_args_and_exec(CmdLineArgs(), run, usage)
@@ -1,11 +1,23 @@
 from stupendous_cow.db.main import Database
-from stupendous_cow.importers.generic_ss.configuration \
+from stupendous_cow.importer.generic_ss.configuration \
     import ConfigurationFileParser
-from stupendous_cow.importers.generic_ss.directors import Director
-from stupendous_cow.importers.spreadsheets import Workbook
+from stupendous_cow.importer.generic_ss.director import Director
+from stupendous_cow.importer.extractors import DEFAULT_EXTRACTION_TIMEOUT, \
+    DOCUMENT_EXTRACTOR_FACTORIES
+from stupendous_cow.importer.metrics import ImportMetrics, run_report
+from stupendous_cow.importer.spreadsheets import Workbook
+from stupendous_cow.importer.supervision import ExtractionSupervisor, \
+    Quarantine, default_quarantine_filename
+from stupendous_cow.profiling import PROFILE_ENVIRONMENT_VARIABLE, \
+    PROFILE_MODES, start_profiling, start_profiling_from_environment, \
+    stop_profiling
 from util.cmd_line_args import SimpleCmdLineArgs, parse_args_and_exec
+import datetime
+import json
 import logging
+import os.path
 import sys
+import time
 
 LOGGING_LEVEL_MAP = { 'TRACE' : logging.NOTSET, 'DEBUG' : logging.DEBUG,
                       'INFO' : logging.INFO, 'WARN' : logging.WARNING,
@@ -18,6 +30,18 @@ class CmdLineArgs(SimpleCmdLineArgs):
                                      'logging_filename'),
                                     ('--log-level', 'Logging level', False,
                                      tuple(LOGGING_LEVEL_MAP)),
+                                    ('--deadline', 'Extraction deadline',
+                                     False, 'deadline'),
+                                    ('--fallback', 'Fallback extractor',
+                                     False, 'fallback'),
+                                    ('--quarantine', 'Quarantine file', False,
+                                     'quarantine_filename'),
+                                    ('--report', 'Run report file', False,
+                                     'report_filename'),
+                                    ('--profile', 'Profiling mode', False,
+                                     'profile_mode'),
+                                    ('--profile-file', 'Profile file', False,
+                                     'profile_filename'),
                                     ('--config', 'Configuration file', True,
                                      'configuration_filename'),
                                     ('--db', 'Database file', True,
@@ -37,32 +61,135 @@ def run(args):
     else:
         logging_args['stream'] = sys.stdout
     logging.basicConfig(**logging_args)
-    
+
+    deadline = parse_deadline(args)
+    fallback = parse_fallback(args)
+    quarantine = Quarantine(getattr(args, 'quarantine_filename',
+                                    default_quarantine_filename()))
+    supervisor = ExtractionSupervisor(deadline, fallback = fallback,
+                                      quarantine = quarantine)
+
     config_file_parser = ConfigurationFileParser()
     configuration = config_file_parser.load(args.configuration_filename)
 
     db = Database(args.database_filename)
-    if not venue:
-        print 'ERROR: No such venue "%s"' % args.venue_name
+    if not db.venues.with_abbreviation(configuration.venue):
+        print 'ERROR: No such venue "%s"' % configuration.venue
+        exit(1)
+
+    if hasattr(args, 'profile_mode'):
+        if args.profile_mode not in PROFILE_MODES:
+            print 'ERROR: --profile must be one of %s' % \
+                ', '.join(PROFILE_MODES)
+            exit(1)
+        extension = 'prof' if args.profile_mode == 'cprofile' else 'folded'
+        if os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, '').strip():
+            logging.warn('Ignoring %s because --profile was given' % \
+                             PROFILE_ENVIRONMENT_VARIABLE)
+        start_profiling(args.profile_mode,
+                        getattr(args, 'profile_filename',
+                                'generic_ss_importer.' + extension))
+    else:
+        start_profiling_from_environment()
+
+    started_at = datetime.datetime.now()
+    start = time.time()
+    metrics = ImportMetrics()
+    try:
+        workbook = Workbook(args.workbook_filename)
+        try:
+            director = Director(configuration, db, supervisor = supervisor,
+                                metrics = metrics)
+            counts = director.process(workbook, db)
+        finally:
+            workbook.close()
+    finally:
+        profile_filename = stop_profiling()
+    elapsed = time.time() - start
+
+    report = run_report('generic_ss_importer', started_at, elapsed, counts,
+                        metrics, supervisor.stats,
+                        configuration = \
+                            os.path.abspath(args.configuration_filename),
+                        workbook = os.path.abspath(args.workbook_filename))
+    db.import_runs.add(report)
+    db.commit()
+    if hasattr(args, 'report_filename'):
+        with open(args.report_filename, 'w') as output:
+            json.dump(report, output, indent = 2, sort_keys = True)
+
+    print 'Imported %d articles from %d groups' % \
+        (counts.num_imported, len(configuration.document_groups))
+    print '%d articles were unchanged' % counts.num_unchanged
+    print '%d articles failed to load' % counts.num_failed
+    print '%d spreadsheet rows had no matching row in another sheet' % \
+        counts.num_unmatched
+    print 'Created %d article types and categories' % \
+        counts.num_enum_values_created
+    print supervisor.stats.format()
+    print 'Processed %d rows in %.1f seconds (%.1f rows/sec)' % \
+        (report['num_rows'], elapsed, report['rows_per_second'])
+    print metrics.format()
+    if profile_filename:
+        print 'Wrote the profile to %s' % profile_filename
+
+def parse_deadline(args):
+    if not hasattr(args, 'deadline'):
+        return DEFAULT_EXTRACTION_TIMEOUT
+    try:
+        deadline = float(args.deadline)
+    except ValueError:
+        deadline = 0
+    if deadline <= 0:
+        print 'ERROR: --deadline must be a positive number of seconds'
         exit(1)
+    return deadline
 
-    workbook = Workbook(args.workbook_filename)
-    director = Director(configuration, db)
-    (num_imported, num_failed) = director.process(workbook, db)
-    print 'Imported %d articles from %d groups' % (num_imported,
-                                                   len(configuration.groups))
-    print '%d articles failed to load' % num_failed
+def parse_fallback(args):
+    fallback = getattr(args, 'fallback', None)
+    if fallback and (fallback not in DOCUMENT_EXTRACTOR_FACTORIES):
+        print 'ERROR: --fallback must be one of %s' % \
+            ', '.join(sorted(DOCUMENT_EXTRACTOR_FACTORIES))
+        exit(1)
+    return fallback
 
 def usage(args = None):
     print """generic_ss_importer.py [--log-file <file>] [--log-level <level>]
+                       [--deadline <seconds>] [--fallback <extractor>]
+                       [--quarantine <file>] [--report <file>]
+                       [--profile <mode>] [--profile-file <file>]
                        --config <file> --db <file> <workbook>
   <workbook>            File with spreadsheet
   --config <file>       Configuration file
   --db <file>           Database file
+  --deadline <seconds>  Time allowed for extracting one document before the
+                        extractor is killed.  The default is %d
+  --fallback <extractor>
+                        Extractor to try, once, on documents that still
+                        cannot be extracted after a retry, such as
+                        first_pages_pdf.  Articles it extracts are imported
+                        again by the next run, and never replace the content
+                        of an article that already has some.  The default is
+                        to have no fallback
+  --quarantine <file>   File listing the documents that keep failing to
+                        extract, which are skipped.  The default is
+                        %s
+  --report <file>       Write a JSON report of the run, with the time spent
+                        in each stage, to this file.  The report is also
+                        added to the database's import_runs table
+  --profile <mode>      Profile the import.  "cprofile" writes cProfile
+                        statistics and "sample" writes folded stacks for a
+                        flame graph.  Without --profile, setting
+                        STUPENDOUS_COW_PROFILE to the mode, optionally
+                        followed by ":<file>", does the same.  --profile
+                        takes precedence over it
+  --profile-file <file> File to write the profile to.  The default is
+                        generic_ss_importer.prof (cprofile) or
+                        generic_ss_importer.folded (sample)
   --log-file <file>     Log file.  Default is to write the log to stdout
   --log-level <level>   Logging level (TRACE, DEBUG, INFO, WARN, ERROR, OFF).
                         The default is OFF
-"""
+""" % (DEFAULT_EXTRACTION_TIMEOUT, default_quarantine_filename())
 
 if __name__ == '__main__':
     parse_args_and_exec(CmdLineArgs(), run, usage)
@@ -0,0 +1,43 @@
+"""Benchmarks for the stupendous_cow libraries and the helpers they share.
+Each benchmark is a module that can be run with "python -m"."""
+
+from stupendous_cow.db.main import Database
+import math
+import sqlite3
+import time
+
+def create_memory_database():
+    """Returns a Database in memory with the default article types,
+    categories and venues."""
+    connection = sqlite3.connect(':memory:')
+    cursor = connection.cursor()
+    try:
+        Database._create_tables(cursor)
+    finally:
+        cursor.close()
+    db = Database(':memory:', connection)
+    Database._populate_article_types(db)
+    Database._populate_categories(db)
+    Database._populate_venues(db)
+    db.commit()
+    return db
+
+def best_time(run, repeat = 3):
+    """Calls run() repeat times and returns the fastest time in seconds."""
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        if (best is None) or (elapsed < best):
+            best = elapsed
+    return best
+
+def percentile(values, p):
+    """Returns the value below which p percent of values fall (nearest
+    rank), or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
@@ -0,0 +1,130 @@
+"""Measures how fast a NIPS abstracts file can be parsed, comparing the
+line-at-a-time NipsAbstractLineReader with the memory-mapped
+NipsAbstractFileReader, serially and in parallel chunks, and how fast
+titles can be matched approximately against the abstracts' titles.
+
+Usage: python -m stupendous_cow.bench.abstracts [--abstracts N]
+           [--processes N] [--queries N] [--repeat N]"""
+
+from stupendous_cow.bench import best_time
+from stupendous_cow.importer.abstracts import NipsAbstractFileReader, \
+    NipsAbstractLineReader
+from stupendous_cow.importer.matching import TitleMatcher, jaccard, trigrams
+import argparse
+import os
+import os.path
+import random
+import shutil
+import tempfile
+
+_WORDS = ('cows', 'penguins', 'deep', 'learning', 'networks', 'policy',
+          'reinforcement', 'optimization', 'graph', 'sparse', 'bayesian',
+          u'na\xefve', u'caf\xe9', 'inference', 'adversarial', 'the', 'of')
+
+def write_abstracts_file(filename, num_abstracts, seed = 1):
+    """Writes num_abstracts abstracts shaped like the NIPS website's to
+    filename."""
+    rng = random.Random(seed)
+    def words(n):
+        return ' '.join(rng.choice(_WORDS) for i in xrange(n))
+
+    with open(filename, 'wb') as output:
+        for n in xrange(num_abstracts):
+            lines = [ u'#%d [%s] %s' % (10000 + n,
+                                        rng.choice(('Poster', 'Oral')),
+                                        words(8).title()),
+                      u'  ' + u' \xb7 '.join(words(2).title() \
+                                                 for i in xrange(4)) ]
+            lines.extend(u'  ' + words(14) for i in xrange(rng.randint(3, 9)))
+            lines.append(u'  ')
+            lines.append(u'')
+            output.write(u'\n'.join(lines).encode('utf-8') + '\n')
+
+def read_all(reader):
+    return sum(1 for a in reader)
+
+def random_titles(rng, num_titles, vocabulary_size = 3000):
+    """Returns num_titles distinct titles drawn from a vocabulary of random
+    words, which is closer to real titles than _WORDS."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [ ''.join(rng.choice(letters) \
+                               for i in xrange(rng.randint(3, 10))) \
+                       for n in xrange(vocabulary_size) ]
+    titles = set()
+    while len(titles) < num_titles:
+        titles.add(' '.join(rng.choice(vocabulary) \
+                                for i in xrange(rng.randint(4, 12))))
+    return list(titles)
+
+def misspell(rng, title):
+    """Returns title with one character replaced."""
+    i = rng.randrange(len(title))
+    return title[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + title[i + 1:]
+
+def scan_all(titles, queries, threshold):
+    title_grams = [ (t, trigrams(t)) for t in titles ]
+    for q in queries:
+        grams = trigrams(q)
+        scores = [ (jaccard(grams, g), t) for (t, g) in title_grams ]
+        best = max(scores)
+        if best[0] < threshold:
+            best = None
+
+def match_all(matcher, queries):
+    for q in queries:
+        matcher.best_match(q)
+
+def run(num_abstracts, num_processes, num_queries, repeat):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, 'abstracts.txt')
+        write_abstracts_file(filename, num_abstracts)
+        size = os.path.getsize(filename) / 1048576.0
+
+        line_time = best_time(\
+            lambda: read_all(NipsAbstractLineReader(filename)), repeat)
+        mapped_time = best_time(\
+            lambda: read_all(NipsAbstractFileReader(filename)), repeat)
+        parallel_time = best_time(\
+            lambda: read_all(NipsAbstractFileReader(filename, num_processes)),
+            repeat)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    rng = random.Random(2)
+    titles = random_titles(rng, num_abstracts)
+    queries = [ misspell(rng, rng.choice(titles)) \
+                    for i in xrange(num_queries) ]
+    matcher = TitleMatcher(titles, 0.8)
+    build_time = best_time(lambda: TitleMatcher(titles, 0.8), repeat)
+    match_time = best_time(lambda: match_all(matcher, queries), repeat)
+    scan_time = best_time(lambda: scan_all(titles, queries, 0.8), 1)
+    print 'Parsed %d abstracts (%.1f MB, best of %d)' % (num_abstracts, size,
+                                                        repeat)
+    print '  Line reader:            %8.3f sec  %8.1f MB/sec' % \
+        (line_time, size / line_time)
+    print '  Memory-mapped:          %8.3f sec  %8.1f MB/sec  (%.2fx)' % \
+        (mapped_time, size / mapped_time, line_time / mapped_time)
+    print '  %2d processes:           %8.3f sec  %8.1f MB/sec  (%.2fx)' % \
+        (num_processes, parallel_time, size / parallel_time,
+         line_time / parallel_time)
+    print 'Matched %d misspelled titles against %d titles' % (num_queries,
+                                                             len(titles))
+    print '  Building the index:     %8.3f sec' % build_time
+    print '  Exhaustive scan:        %8.3f sec  %8.3f ms/title' % \
+        (scan_time, 1000.0 * scan_time / num_queries)
+    print '  Trigram index:          %8.3f sec  %8.3f ms/title  (%.1fx)' % \
+        (match_time, 1000.0 * match_time / num_queries,
+         scan_time / match_time)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--abstracts', type = int, default = 20000)
+    parser.add_argument('--processes', type = int, default = 4)
+    parser.add_argument('--queries', type = int, default = 200)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+    run(args.abstracts, args.processes, args.queries, args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measures how many spreadsheet rows per second the generic importer can bind
+to ArticleBuilders, comparing the per-row PropertyBinder objects with a
+compiled RowBindingPlan.
+
+Usage: python -m stupendous_cow.bench.binding [--rows N] [--repeat N]"""
+
+from stupendous_cow.bench import best_time, create_memory_database
+from stupendous_cow.data_model import ArticleType, Category
+from stupendous_cow.importer.builders import ArticleBuilder, \
+    BooleanPropertyBinder, DatabasePropertyBinder, IntPropertyBinder, \
+    PropertyBinder, SpreadsheetPropertyBinder, SpreadsheetPropertyExtractor, \
+    ConstantPropertyBinder
+from stupendous_cow.importer.extractors import ExtractedDocument
+from stupendous_cow.importer.generic_ss.configuration import \
+    DocumentGroupConfiguration
+from stupendous_cow.importer.generic_ss.director import \
+    DocumentGroupProcessor
+from stupendous_cow.importer.spreadsheets import SpreadsheetPath, Worksheet
+import argparse
+import pyexcel
+
+COLUMNS = ('TITLE', 'PRIORITY', 'TYPE', 'AREA', 'SUMMARY', 'IS_READ',
+           'DOWNLOADED_AS')
+_TYPES = ('Oral', 'Poster', 'Spotlight')
+_AREAS = ('Architecture', 'RL', 'GANs', 'Clustering', 'NLP')
+
+def synthetic_papers(num_rows):
+    """Returns the cells of a "Papers" sheet with num_rows rows, header
+    included, shaped like the sheets the generic importer reads."""
+    rows = [ list(COLUMNS) ]
+    for i in xrange(num_rows):
+        rows.append([ 'Synthetic Paper Number %d' % i, i % 10,
+                      _TYPES[i % len(_TYPES)], _AREAS[i % len(_AREAS)],
+                      'Summary of synthetic paper %d' % i,
+                      'Y' if i % 3 else 'N', 'Paper%05d' % i ])
+    return rows
+
+class SyntheticWorkbook:
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def __getitem__(self, name):
+        return Worksheet(pyexcel.Sheet(self._sheets[name], name = name))
+
+def papers_configuration():
+    def path(column):
+        return SpreadsheetPath('Papers', column)
+    return DocumentGroupConfiguration('DocumentGroup_1', path('TITLE'), None,
+                                      [ '.' ], path('PRIORITY'),
+                                      path('DOWNLOADED_AS'), path('TYPE'),
+                                      path('AREA'), None, path('SUMMARY'),
+                                      path('IS_READ'), None, None, None)
+
+def bind_with_binders(db, venue, rows, document):
+    def path(column):
+        return SpreadsheetPath('Papers', column)
+
+    def ss(column, default_value):
+        return SpreadsheetPropertyExtractor(path(column), default_value)
+
+    binders = (SpreadsheetPropertyBinder(path('TITLE'), 'title', ''),
+               ConstantPropertyBinder('abstract', ''),
+               IntPropertyBinder('priority', ss('PRIORITY', 0)),
+               DatabasePropertyBinder('article_type', db.article_types,
+                                      ss('TYPE', ''), ArticleType),
+               DatabasePropertyBinder('category', db.categories,
+                                      ss('AREA', ''), Category),
+               SpreadsheetPropertyBinder(path('SUMMARY'), 'summary', ''),
+               BooleanPropertyBinder('is_read', ss('IS_READ', False)))
+    for (n, row) in enumerate(rows):
+        ss_rows = { 'Papers' : row }
+        builder = ArticleBuilder(db)
+        builder.set_ss_info('Papers', n + 2)
+        builder.set_year(2018)
+        builder.set_venue(venue)
+        for bind in binders:
+            bind(ss_rows, document, builder)
+        builder.build()
+
+def bind_with_plan(plan, rows, document):
+    for (n, row) in enumerate(rows):
+        builder = plan.bind({ 'Papers' : row }, document)
+        builder.set_ss_info('Papers', n + 2)
+        builder.build()
+
+def run(num_rows, repeat):
+    db = create_memory_database()
+    venue = db.venues.with_abbreviation('ICML')
+    workbook = SyntheticWorkbook({ 'Papers' : synthetic_papers(num_rows) })
+    processor = DocumentGroupProcessor(papers_configuration(), db, venue,
+                                       2018, None, incremental = False)
+    processor.resolve_enum_values(workbook)
+    rows = list(workbook['Papers'])
+    document = ExtractedDocument('', (), '', '')
+
+    binder_time = best_time(lambda: bind_with_binders(db, venue, rows,
+                                                      document), repeat)
+    (plan, _) = processor.compile(workbook)
+    plan_time = best_time(lambda: bind_with_plan(plan, rows, document),
+                          repeat)
+
+    print 'Bound %d rows (best of %d)' % (num_rows, repeat)
+    print '  PropertyBinders:  %10.0f rows/sec' % (num_rows / binder_time)
+    print '  RowBindingPlan:   %10.0f rows/sec' % (num_rows / plan_time)
+    print '  Speedup:          %10.2fx' % (binder_time / plan_time)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--rows', type = int, default = 10000)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+if __name__ == '__main__':
+    main()
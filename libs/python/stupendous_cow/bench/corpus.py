@@ -0,0 +1,134 @@
+"""Generates synthetic corpora of articles for the database benchmarks.
+
+Articles are spread over the seeded venues, article types and categories
+(plus any extra categories asked for), with skewed popularity so some enum
+values are referred to far more than others.  Content and abstract lengths
+are drawn from log-normal distributions, some titles are reused across
+venues and years, and some articles are unread or already indexed, as in a
+real library."""
+
+from stupendous_cow.data_model import Article, Category
+import datetime
+import math
+import random
+
+class CorpusParameters:
+    def __init__(self, num_articles = 10000, seed = 1, content_words = 500,
+                 content_sigma = 0.6, abstract_words = 150,
+                 title_collisions = 0.02, unread = 0.7, indexed = 0.9,
+                 num_categories = 20, first_year = 2010, num_years = 10,
+                 batch_size = 1000):
+        self.num_articles = num_articles
+        self.seed = seed
+        self.content_words = content_words      # Median words of content
+        self.content_sigma = content_sigma      # Sigma of the log-normal
+        self.abstract_words = abstract_words    # Median words of an abstract
+        self.title_collisions = title_collisions  # Fraction of reused titles
+        self.unread = unread                    # Fraction of unread articles
+        self.indexed = indexed                  # Fraction not needing reindex
+        self.num_categories = num_categories    # Categories to add
+        self.first_year = first_year
+        self.num_years = num_years
+        self.batch_size = batch_size
+
+    def to_dict(self):
+        return dict(vars(self))
+
+class _TextPool:
+    """A long run of random words that text is cut from, which is much
+    faster than choosing every word of every article."""
+    def __init__(self, rng, vocabulary, num_words = 200000):
+        self.words = vocabulary
+        self.text = ' '.join(rng.choice(vocabulary) \
+                                 for i in xrange(num_words))
+        self._mean_word_size = float(len(self.text)) / num_words
+
+    def cut(self, rng, num_words):
+        size = int(num_words * self._mean_word_size)
+        if size >= len(self.text):
+            return self.text
+        start = self.text.find(' ', rng.randint(0, len(self.text) - size)) + 1
+        return self.text[start:start + size].rsplit(' ', 1)[0]
+
+def _vocabulary(rng, size = 5000):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [ ''.join(rng.choice(letters) for i in xrange(rng.randint(2, 11))) \
+                 for n in xrange(size) ]
+
+def _skewed_choice(rng, items, skew = 1.1):
+    # Zipf-like: the first items are chosen far more often than the last
+    weights = [ 1.0 / (n + 1) ** skew for n in xrange(len(items)) ]
+    total = sum(weights)
+    def choose():
+        x = rng.random() * total
+        for (item, weight) in zip(items, weights):
+            x -= weight
+            if x < 0:
+                return item
+        return items[-1]
+    return choose
+
+def generate_articles(db, parameters):
+    """Yields the articles of a corpus described by parameters, unsaved.
+    The venues, article types and categories come from db, which must
+    already hold any extra categories."""
+    p = parameters
+    rng = random.Random(p.seed)
+    pool = _TextPool(rng, _vocabulary(rng))
+    choose_venue = _skewed_choice(rng, db.venues.all)
+    choose_type = _skewed_choice(rng, db.article_types.all)
+    choose_category = _skewed_choice(rng, db.categories.all)
+    indexed_at = datetime.datetime.now() + datetime.timedelta(days = 1)
+    content_mu = math.log(max(p.content_words, 1))
+    abstract_mu = math.log(max(p.abstract_words, 1))
+
+    titles = [ ]
+    keys = set()
+    for n in xrange(p.num_articles):
+        venue = choose_venue()
+        year = p.first_year + rng.randrange(p.num_years)
+        if titles and (rng.random() < p.title_collisions):
+            title = rng.choice(titles)
+        else:
+            title = ' '.join(rng.choice(pool.words) \
+                                 for i in xrange(rng.randint(4, 12))).title()
+            titles.append(title)
+        # The venue, year and title identify an article, so a reused title
+        # goes to a venue and year it is not in yet, or gets a new one
+        while (venue.id, year, title) in keys:
+            year += p.num_years
+        keys.add((venue.id, year, title))
+
+        content_words = int(rng.lognormvariate(content_mu, p.content_sigma))
+        abstract_words = int(rng.lognormvariate(abstract_mu, 0.3))
+        yield Article(title, pool.cut(rng, abstract_words),
+                      pool.cut(rng, content_words), year, rng.randint(0, 9),
+                      'Paper%07d' % n, 'papers/Paper%07d.pdf' % n,
+                      choose_type(), choose_category(), venue,
+                      summary = pool.cut(rng, rng.randint(0, 30)),
+                      is_read = rng.random() >= p.unread,
+                      last_indexed_at = indexed_at \
+                          if rng.random() < p.indexed else None)
+
+def generate_corpus(db, parameters):
+    """Adds the extra categories and the articles of a corpus described by
+    parameters to db, in batches, and commits.  Returns the number of
+    articles added."""
+    existing = set(c.name for c in db.categories.all)
+    names = [ 'Category %d' % (n + 1) \
+                  for n in xrange(parameters.num_categories) ]
+    db.categories.add_all([ Category(name) for name in names \
+                                if name not in existing ])
+    db.commit()
+
+    num_added = 0
+    batch = [ ]
+    for article in generate_articles(db, parameters):
+        batch.append(article)
+        if len(batch) >= parameters.batch_size:
+            num_added += len(db.articles.add_all(batch))
+            batch = [ ]
+    if batch:
+        num_added += len(db.articles.add_all(batch))
+    db.commit()
+    return num_added
@@ -0,0 +1,349 @@
+"""Measures the latency of the database layer's operations on a synthetic
+corpus, and compares the results of two runs to find regressions.
+
+"run" generates a corpus (see stupendous_cow.bench.corpus), times each
+operation and prints a table of the results, which --output also writes as
+JSON.  "compare" reads a baseline and a new set of results and flags every
+operation whose mean latency grew by more than the tolerance; it exits with
+status 1 if there are any.
+
+Usage: python -m stupendous_cow.bench.database run [--articles N] [--ops N]
+           [--scans N] [--memory] [--article-counts] [--output <file>]
+           [--seed N] [--content-words N] [--title-collisions F] [--unread F]
+       python -m stupendous_cow.bench.database compare <baseline> <results>
+           [--tolerance F]"""
+
+from stupendous_cow.bench import create_memory_database, percentile
+from stupendous_cow.bench.corpus import CorpusParameters, generate_articles, \
+    generate_corpus
+from stupendous_cow.data_model import Category
+from stupendous_cow.db.main import Database
+from stupendous_cow.util import normalize_title
+import argparse
+import datetime
+import json
+import os
+import os.path
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+def _timed(num_calls, call):
+    latencies = [ ]
+    for i in xrange(num_calls):
+        start = time.time()
+        call(i)
+        latencies.append(time.time() - start)
+    return latencies
+
+class _Context:
+    """What the operations share: the database, the ids of the corpus's
+    articles and the articles the "add" operation created."""
+    def __init__(self, db, parameters, num_ops, num_scans):
+        self.db = db
+        self.parameters = parameters
+        self.num_ops = num_ops
+        self.num_scans = num_scans
+        self.rng = random.Random(parameters.seed + 1)
+        self.ids = db.articles.ids
+        self.added = [ ]
+
+    def sample(self):
+        """Returns num_ops articles chosen at random from the corpus."""
+        return [ self.db.articles.with_id(self.rng.choice(self.ids)) \
+                     for i in xrange(self.num_ops) ]
+
+def bench_add(context):
+    parameters = CorpusParameters(**context.parameters.to_dict())
+    parameters.num_articles = context.num_ops
+    parameters.seed += 1000
+    parameters.first_year += parameters.num_years   # No natural key clashes
+    articles = list(generate_articles(context.db, parameters))
+    def add(i):
+        context.added.append(context.db.articles.add(articles[i]).id)
+    latencies = _timed(len(articles), add)
+    context.db.commit()
+    return latencies
+
+def bench_with_id(context):
+    ids = [ context.rng.choice(context.ids) for i in xrange(context.num_ops) ]
+    return _timed(len(ids), lambda i: context.db.articles.with_id(ids[i]))
+
+def bench_retrieve(context):
+    keys = [ (normalize_title(a.title), a.year, a.venue) \
+                 for a in context.sample() ]
+    def retrieve(i):
+        (normalized_title, year, venue) = keys[i]
+        with context.db.articles.retrieve(normalized_title = normalized_title,
+                                          year = year, venue = venue) as rs:
+            list(rs)
+    return _timed(len(keys), retrieve)
+
+def bench_count(context):
+    venues = context.db.venues.all
+    p = context.parameters
+    criteria = [ (context.rng.choice(venues),
+                  p.first_year + context.rng.randrange(p.num_years)) \
+                     for i in xrange(context.num_ops) ]
+    def count(i):
+        (venue, year) = criteria[i]
+        return context.db.articles.count(venue = venue, year = year)
+    return _timed(len(criteria), count)
+
+def bench_catalog_select(context):
+    # Loads the catalog outside the timings, then times the same filters as
+    # "count", with the catalog's per-value indexes built by the first
+    catalog = context.db.article_catalog()
+    venues = context.db.venues.all
+    p = context.parameters
+    criteria = [ (context.rng.choice(venues),
+                  p.first_year + context.rng.randrange(p.num_years)) \
+                     for i in xrange(context.num_ops) ]
+    def select(i):
+        (venue, year) = criteria[i]
+        return catalog.select(venue = venue, year = year)
+    return _timed(len(criteria), select)
+
+def _report_keys(context):
+    p = context.parameters
+    return [ (venue, year) for venue in context.db.venues.all \
+                 for year in xrange(p.first_year, p.first_year + p.num_years) ]
+
+def bench_report_loop(context):
+    # The number of articles and of read articles per venue and year, the
+    # way the reports used to count them: two queries per venue and year
+    keys = _report_keys(context)
+    articles = context.db.articles
+    def report(i):
+        return [ (venue, year, articles.count(venue = venue, year = year),
+                  articles.count(venue = venue, year = year, is_read = True)) \
+                     for (venue, year) in keys ]
+    return _timed(context.num_scans, report)
+
+def bench_report_aggregate(context):
+    # The same report as "report_loop" from one GROUP BY query
+    articles = context.db.articles
+    def report(i):
+        return articles.aggregate(group_by = ('venue', 'year'),
+                                  metrics = ('count', 'sum(is_read)'))
+    return _timed(context.num_scans, report)
+
+def bench_update(context):
+    articles = context.sample()
+    def update(i):
+        article = articles[i]
+        article.summary = 'Updated %d' % i
+        article.is_read = not article.is_read
+        context.db.articles.update(article)
+    latencies = _timed(len(articles), update)
+    context.db.commit()
+    return latencies
+
+def bench_delete(context):
+    # Deletes the articles "add" created, so the corpus is left as it was
+    ids = context.added
+    latencies = _timed(len(ids), lambda i: context.db.articles.delete(ids[i]))
+    context.db.commit()
+    context.added = [ ]
+    return latencies
+
+def bench_scan_all(context):
+    return _timed(context.num_scans, lambda i: context.db.articles.all)
+
+def bench_scan_ids(context):
+    return _timed(context.num_scans, lambda i: context.db.articles.ids)
+
+def bench_need_reindexing(context):
+    return _timed(context.num_scans,
+                  lambda i: list(context.db.articles.need_reindexing()))
+
+def bench_enum_lookup(context):
+    venues = context.db.venues
+    names = [ context.rng.choice(venues.all).name \
+                  for i in xrange(context.num_ops) ]
+    return _timed(len(names), lambda i: venues.with_name(names[i]))
+
+def bench_enum_count_references(context):
+    db = context.db
+    items = [ (table, item) \
+                  for table in (db.article_types, db.categories, db.venues) \
+                  for item in table.all ]
+    def count(i):
+        (table, item) = items[i % len(items)]
+        return table.count_references_to(item)
+    return _timed(context.num_ops, count)
+
+def bench_enum_reference_counts(context):
+    # Counts the references to every item of a table at once, where
+    # "enum_count_references" counts them one item at a time
+    db = context.db
+    tables = (db.article_types, db.categories, db.venues)
+    return _timed(context.num_scans,
+                  lambda i: [ t.reference_counts() for t in tables ])
+
+def bench_enum_add_delete(context):
+    categories = context.db.categories
+    def add_delete(i):
+        categories.delete(categories.add(Category('Benchmark %d' % i)))
+    latencies = _timed(context.num_ops, add_delete)
+    context.db.commit()
+    return latencies
+
+# In the order they run
+OPERATIONS = (('add', bench_add), ('with_id', bench_with_id),
+              ('retrieve', bench_retrieve), ('count', bench_count),
+              ('catalog_select', bench_catalog_select),
+              ('report_loop', bench_report_loop),
+              ('report_aggregate', bench_report_aggregate),
+              ('update', bench_update), ('delete', bench_delete),
+              ('scan_all', bench_scan_all), ('scan_ids', bench_scan_ids),
+              ('need_reindexing', bench_need_reindexing),
+              ('enum_lookup', bench_enum_lookup),
+              ('enum_count_references', bench_enum_count_references),
+              ('enum_reference_counts', bench_enum_reference_counts),
+              ('enum_add_delete', bench_enum_add_delete))
+
+def summarize(latencies):
+    total = sum(latencies)
+    if not latencies:
+        return { 'count' : 0, 'seconds' : 0.0 }
+    return { 'count' : len(latencies), 'seconds' : total,
+             'ops_per_second' : len(latencies) / total if total else None,
+             'mean_ms' : 1000.0 * total / len(latencies),
+             'p50_ms' : 1000.0 * percentile(latencies, 50),
+             'p95_ms' : 1000.0 * percentile(latencies, 95),
+             'max_ms' : 1000.0 * max(latencies) }
+
+def run(parameters, num_ops, num_scans, in_memory, operations = None,
+        article_counts = False):
+    """Generates a corpus, runs the operations named in operations (all of
+    them if None) and returns the results as a dict that can be written as
+    JSON.  If article_counts is True, the database maintains the
+    article_counts summary."""
+    tmp_dir = None
+    if in_memory:
+        db = create_memory_database()
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        db = Database.create_new(os.path.join(tmp_dir, 'bench.db'))
+    try:
+        start = time.time()
+        generate_corpus(db, parameters)
+        corpus_seconds = time.time() - start
+        if article_counts:
+            db.article_counts.create()
+            db.commit()
+
+        context = _Context(db, parameters, num_ops, num_scans)
+        results = { }
+        for (name, bench) in OPERATIONS:
+            if (operations is None) or (name in operations):
+                results[name] = summarize(bench(context))
+    finally:
+        db.close()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+    return { 'benchmark' : 'database',
+             'created_at' : datetime.datetime.now().replace(\
+                 microsecond = 0).isoformat(),
+             'corpus' : parameters.to_dict(),
+             'corpus_seconds' : corpus_seconds,
+             'in_memory' : in_memory,
+             'article_counts' : article_counts,
+             'sqlite_version' : sqlite3.sqlite_version,
+             'operations' : results }
+
+def format_results(results):
+    lines = [ '%-22s %8s %12s %10s %10s %10s' % \
+                  ('Operation', 'Count', 'Ops/sec', 'Mean ms', 'p95 ms',
+                   'Max ms') ]
+    for (name, bench) in OPERATIONS:
+        r = results['operations'].get(name)
+        if r and r['count']:
+            lines.append('%-22s %8d %12.1f %10.3f %10.3f %10.3f' % \
+                             (name, r['count'], r['ops_per_second'] or 0.0,
+                              r['mean_ms'], r['p95_ms'], r['max_ms']))
+    return '\n'.join(lines)
+
+def compare(baseline, results, tolerance = 0.2, min_change_ms = 0.005):
+    """Compares the mean latency of each operation in results with
+    baseline's.  Returns a list of (operation, baseline mean ms, mean ms,
+    is regression) tuples, in the order the operations run.  Changes of less
+    than min_change_ms are timer noise, not regressions."""
+    comparison = [ ]
+    for (name, bench) in OPERATIONS:
+        old = baseline['operations'].get(name)
+        new = results['operations'].get(name)
+        if not (old and new and old.get('mean_ms') and new.get('mean_ms')):
+            continue
+        comparison.append((name, old['mean_ms'], new['mean_ms'],
+                           (new['mean_ms'] > old['mean_ms'] * (1 + tolerance)) \
+                               and (new['mean_ms'] - old['mean_ms'] > \
+                                        min_change_ms)))
+    return comparison
+
+def format_comparison(comparison):
+    lines = [ '%-22s %12s %12s %8s' % ('Operation', 'Baseline ms', 'Now ms',
+                                       'Change') ]
+    for (name, old, new, is_regression) in comparison:
+        lines.append('%-22s %12.3f %12.3f %+7.1f%%%s' % \
+                         (name, old, new, 100.0 * (new - old) / old,
+                          '  REGRESSION' if is_regression else ''))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest = 'command')
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--articles', type = int, default = 10000)
+    run_parser.add_argument('--ops', type = int, default = 1000)
+    run_parser.add_argument('--scans', type = int, default = 3)
+    run_parser.add_argument('--memory', action = 'store_true')
+    run_parser.add_argument('--article-counts', action = 'store_true')
+    run_parser.add_argument('--output')
+    run_parser.add_argument('--operation', action = 'append',
+                            choices = [ name for (name, b) in OPERATIONS ])
+    run_parser.add_argument('--seed', type = int, default = 1)
+    run_parser.add_argument('--content-words', type = int, default = 500)
+    run_parser.add_argument('--title-collisions', type = float, default = 0.02)
+    run_parser.add_argument('--unread', type = float, default = 0.7)
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--tolerance', type = float, default = 0.2)
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline) as input:
+            baseline = json.load(input)
+        with open(args.results) as input:
+            results = json.load(input)
+        for key in ('corpus', 'in_memory', 'article_counts'):
+            if baseline.get(key) != results.get(key):
+                print 'WARNING: The baseline and the results were run with ' \
+                      'different %s settings' % key
+        comparison = compare(baseline, results, args.tolerance)
+        print format_comparison(comparison)
+        if any(is_regression for (n, o, r, is_regression) in comparison):
+            sys.exit(1)
+        return
+
+    parameters = CorpusParameters(args.articles, seed = args.seed,
+                                  content_words = args.content_words,
+                                  title_collisions = args.title_collisions,
+                                  unread = args.unread)
+    results = run(parameters, args.ops, args.scans, args.memory,
+                  args.operation, args.article_counts)
+    print '%d articles generated in %.1f sec' % \
+        (args.articles, results['corpus_seconds'])
+    print format_results(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent = 2, sort_keys = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Measures what extracting only the first pages of a PDF file costs compared
+with extracting all of it, using generated papers.  Needs pdftotext on the
+PATH.
+
+Usage: python -m stupendous_cow.bench.extractors [--documents N]
+           [--pages N] [--repeat N]"""
+
+from stupendous_cow.bench import best_time
+from stupendous_cow.importer.extractors import DefaultPdfExtractor, \
+    FirstPagesPdfExtractor
+import argparse
+import os
+import os.path
+import random
+import shutil
+import tempfile
+
+_WORDS = ('cows', 'penguins', 'deep', 'learning', 'networks', 'policy',
+          'reinforcement', 'optimization', 'graph', 'sparse', 'bayesian',
+          'inference', 'adversarial', 'the', 'of', 'a', 'we', 'show', 'that')
+_LINES_PER_PAGE = 55
+
+def write_pdf(filename, pages):
+    """Writes a PDF file with one page of Helvetica text for each list of
+    lines in pages.  Lines must be ASCII."""
+    objects = [ '<< /Type /Catalog /Pages 2 0 R >>', None,
+                '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>' ]
+    kids = [ ]
+    for lines in pages:
+        text = ' T* '.join('(%s) Tj' % _escape(line) for line in lines)
+        stream = 'BT /F1 10 Tf 12 TL 72 740 Td %s ET' % text
+        objects.append('<< /Length %d >>\nstream\n%s\nendstream' % \
+                       (len(stream), stream))
+        objects.append('<< /Type /Page /Parent 2 0 R ' + \
+                       '/MediaBox [0 0 612 792] ' + \
+                       '/Resources << /Font << /F1 3 0 R >> >> ' + \
+                       '/Contents %d 0 R >>' % len(objects))
+        kids.append('%d 0 R' % len(objects))
+    objects[1] = '<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join(kids),
+                                                              len(kids))
+
+    with open(filename, 'wb') as output:
+        output.write('%PDF-1.4\n')
+        offsets = [ ]
+        for (n, obj) in enumerate(objects):
+            offsets.append(output.tell())
+            output.write('%d 0 obj\n%s\nendobj\n' % (n + 1, obj))
+        xref = output.tell()
+        output.write('xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        for offset in offsets:
+            output.write('%010d 00000 n \n' % offset)
+        output.write('trailer\n<< /Size %d /Root 1 0 R >>\n' % \
+                     (len(objects) + 1))
+        output.write('startxref\n%d\n%%%%EOF\n' % xref)
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def paper_pages(rng, num_pages):
+    """Returns the lines of each page of a paper with a title, authors,
+    abstract and num_pages pages in all."""
+    def sentence(n):
+        return ' '.join(rng.choice(_WORDS) for i in xrange(n))
+
+    front = [ sentence(8).title(), '',
+              'Alice Cow, Bob Bull and Carol Calf', 'University of Pasture',
+              '', 'Abstract' ]
+    front.extend(sentence(14) for i in xrange(8))
+    front.extend(('', '1 Introduction'))
+    pages = [ front + [ sentence(14) \
+                            for i in xrange(_LINES_PER_PAGE - len(front)) ] ]
+    for n in xrange(num_pages - 1):
+        pages.append([ sentence(14) for i in xrange(_LINES_PER_PAGE) ])
+    return pages
+
+def extract_all(extractor, filenames):
+    for filename in filenames:
+        extractor.extract(filename)
+
+def run(num_documents, num_pages, repeat):
+    rng = random.Random(1)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filenames = [ ]
+        for n in xrange(num_documents):
+            filenames.append(os.path.join(tmp_dir, 'paper_%d.pdf' % n))
+            write_pdf(filenames[-1], paper_pages(rng, num_pages))
+
+        full_time = best_time(\
+            lambda: extract_all(DefaultPdfExtractor(), filenames), repeat)
+        first_pages = FirstPagesPdfExtractor()
+        first_pages_time = best_time(\
+            lambda: extract_all(first_pages, filenames), repeat)
+        document = first_pages.extract(filenames[0])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print 'Extracted %d documents of %d pages (best of %d)' % \
+        (num_documents, num_pages, repeat)
+    print '  All pages:           %8.3f sec  %8.2f ms/document' % \
+        (full_time, 1000.0 * full_time / num_documents)
+    print '  First %d pages:       %8.3f sec  %8.2f ms/document  (%.2fx)' % \
+        (first_pages.num_pages, first_pages_time,
+         1000.0 * first_pages_time / num_documents,
+         full_time / first_pages_time)
+    print '  Title: %s' % document.title
+    print '  Authors: %s' % ', '.join(document.authors)
+    print '  Abstract: %d characters' % len(document.abstract)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--documents', type = int, default = 50)
+    parser.add_argument('--pages', type = int, default = 12)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+    run(args.documents, args.pages, args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Measures the generic spreadsheet importer end to end on fabricated data:
+a workbook with one sheet per document group, a configuration that reads
+it, a tree of content directories holding a "PDF" for every row and a fake
+pdftotext on PATH whose latency and output size can be tuned.  The import
+runs Director.process() in its own process, so its peak RSS is its own,
+and reports articles/sec, the time spent in each stage and peak RSS.
+
+Usage: python -m stupendous_cow.bench.importer [--rows N] [--groups N]
+           [--content-dirs N] [--latency SEC] [--jitter SEC]
+           [--output-kb N] [--format ods|csv] [--output <file>]"""
+
+from stupendous_cow.bench.binding import COLUMNS
+from stupendous_cow.bench.workbooks import peak_rss_kb
+from stupendous_cow.db.main import Database
+from stupendous_cow.importer.generic_ss.configuration import \
+    ConfigurationFileParser
+from stupendous_cow.importer.generic_ss.director import Director
+from stupendous_cow.importer.metrics import ImportMetrics, run_report
+from stupendous_cow.importer.spreadsheets import Workbook
+from stupendous_cow.importer.supervision import ExtractionSupervisor
+import argparse
+import collections
+import datetime
+import json
+import os
+import os.path
+import pyexcel_io
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+VENUE = 'NIPS'
+YEAR = 2017
+
+# Prints the "PDF" (a few lines of front matter) followed by filler text,
+# after sleeping for the configured latency.  With -l it prints only the
+# front matter, like pdftotext asked for the first pages.  It is a shell
+# script because starting Python would cost more than many real extractions.
+FAKE_PDFTOTEXT = """#!/bin/sh
+for arg; do file=$previous; previous=$arg; done
+%(sleep)s
+cat "$file"
+case " $* " in *" -l "*) exit 0 ;; esac
+yes 'the cows are in the field and the penguins are on the ice' | \\
+    head -c %(output_size)d
+"""
+
+FAKE_SLEEP = """sleep $(awk -v seed=$$ 'BEGIN { srand(seed);
+    d = %(latency)r + (2 * rand() - 1) * %(jitter)r
+    print (d > 0) ? d : 0 }')"""
+
+def write_fake_pdftotext(directory, latency = 0.0, jitter = 0.0,
+                         output_kb = 64):
+    """Writes a fake pdftotext to directory and returns its path.  Each call
+    takes latency seconds, give or take up to jitter, and prints about
+    output_kb KB."""
+    if latency or jitter:
+        sleep = FAKE_SLEEP % { 'latency' : latency, 'jitter' : jitter }
+    else:
+        sleep = ''
+    filename = os.path.join(directory, 'pdftotext')
+    with open(filename, 'w') as output:
+        output.write(FAKE_PDFTOTEXT % { 'sleep' : sleep,
+                                        'output_size' : output_kb * 1024 })
+    os.chmod(filename, stat.S_IRWXU)
+    return filename
+
+def papers_sheet(group, num_rows):
+    """Returns the cells of one group's sheet, header included."""
+    rows = [ list(COLUMNS) ]
+    for n in xrange(num_rows):
+        rows.append([ 'Benchmark Paper %d of Group %d' % (n, group), n % 10,
+                      ('Oral', 'Poster', 'Spotlight')[n % 3],
+                      ('Architecture', 'RL', 'GANs', 'NLP')[n % 4],
+                      'Summary of paper %d' % n, 'Y' if n % 3 else 'N',
+                      'G%dPaper%06d' % (group, n) ])
+    return rows
+
+def create_fixture(directory, num_rows, num_groups = 1, num_content_dirs = 4,
+                   file_format = 'ods'):
+    """Writes the workbook, the configuration and the content directories of
+    an import of num_rows rows split between num_groups document groups to
+    directory.  Each group's PDFs are spread over num_content_dirs
+    directories.  Returns the names of the configuration and workbook
+    files."""
+    if file_format == 'csv':
+        num_groups = 1      # A CSV file holds one sheet
+    workbook_filename = os.path.join(directory, 'papers.' + file_format)
+    sheets = collections.OrderedDict()
+    configuration = [ 'Venue: %s' % VENUE, 'Year: %d' % YEAR ]
+    for group in xrange(1, num_groups + 1):
+        if file_format == 'csv':
+            sheet_name = os.path.basename(workbook_filename)
+        else:
+            sheet_name = 'Papers%d' % group
+        rows = papers_sheet(group, num_rows // num_groups)
+        sheets[sheet_name] = rows
+
+        content_dirs = [ os.path.join(directory, 'content', 'group%d' % group,
+                                      'dir%d' % n) \
+                             for n in xrange(num_content_dirs) ]
+        for content_dir in content_dirs:
+            os.makedirs(content_dir)
+        for (n, row) in enumerate(rows[1:]):
+            path = os.path.join(content_dirs[n % num_content_dirs],
+                                row[-1] + '.pdf')
+            with open(path, 'w') as output:
+                output.write('%s\nAda Lovelace, Alan Turing\n\nAbstract\n' \
+                             'What %s is about.\n\n1 Introduction\n' % \
+                                 (row[0], row[0]))
+
+        def column(name):
+            return '"@%s[%s]"' % (sheet_name, name)
+        configuration.extend([
+            'DocumentGroup_%d:' % group,
+            '  Title: ' + column('TITLE'),
+            '  ContentDir: [ %s ]' % ', '.join(content_dirs),
+            '  DownloadedAs: ' + column('DOWNLOADED_AS'),
+            '  Priority: ' + column('PRIORITY'),
+            '  ArticleType: ' + column('TYPE'),
+            '  Category: ' + column('AREA'),
+            '  IsRead: ' + column('IS_READ'),
+            '  Extractor: default_pdf' ])
+
+    if file_format == 'csv':
+        pyexcel_io.save_data(workbook_filename, sheets.values()[0])
+    else:
+        pyexcel_io.save_data(workbook_filename, sheets)
+    configuration_filename = os.path.join(directory, 'configuration.yaml')
+    with open(configuration_filename, 'w') as output:
+        output.write('\n'.join(configuration) + '\n')
+    return (configuration_filename, workbook_filename)
+
+def measure(configuration_filename, workbook_filename, db_filename):
+    """Imports the workbook into a new database and returns the run report,
+    with the articles imported per second and peak RSS added."""
+    configuration = ConfigurationFileParser().load(configuration_filename)
+    db = Database.create_new(db_filename)
+    supervisor = ExtractionSupervisor()
+    metrics = ImportMetrics()
+    started_at = datetime.datetime.now()
+    start = time.time()
+    workbook = Workbook(workbook_filename)
+    try:
+        counts = Director(configuration, db, supervisor = supervisor,
+                          metrics = metrics).process(workbook, db)
+    finally:
+        workbook.close()
+    elapsed = time.time() - start
+    db.close()
+    return run_report('bench.importer', started_at, elapsed, counts, metrics,
+                      supervisor.stats,
+                      articles_per_second = \
+                          counts.num_imported / elapsed if elapsed else 0.0,
+                      peak_rss_kb = peak_rss_kb())
+
+def run(num_rows, num_groups, num_content_dirs, latency, jitter, output_kb,
+        file_format):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        bin_dir = os.path.join(tmp_dir, 'bin')
+        os.mkdir(bin_dir)
+        write_fake_pdftotext(bin_dir, latency, jitter, output_kb)
+        (configuration_filename, workbook_filename) = \
+            create_fixture(tmp_dir, num_rows, num_groups, num_content_dirs,
+                           file_format)
+
+        env = dict(os.environ)
+        env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+        args = [ sys.executable, '-m', 'stupendous_cow.bench.importer',
+                 '--measure', configuration_filename, workbook_filename,
+                 os.path.join(tmp_dir, 'bench.db') ]
+        report = json.loads(subprocess.check_output(args, env = env))
+    finally:
+        shutil.rmtree(tmp_dir)
+    report['parameters'] = { 'num_rows' : num_rows, 'num_groups' : num_groups,
+                             'num_content_dirs' : num_content_dirs,
+                             'latency' : latency, 'jitter' : jitter,
+                             'output_kb' : output_kb, 'format' : file_format }
+    return report
+
+def format_report(report):
+    stages = ImportMetrics()
+    for (name, stage) in report['stages'].iteritems():
+        stages.add_time(name, stage['seconds'], stage['calls'])
+    counts = report['counts']
+    return '\n'.join([
+        'Imported %d articles (%d failed) in %.2f sec: %.1f articles/sec' % \
+            (counts['num_imported'], counts['num_failed'], report['elapsed'],
+             report['articles_per_second']),
+        'Peak RSS %.1f MB' % (report['peak_rss_kb'] / 1024.0),
+        stages.format() ])
+
+def main():
+    if (len(sys.argv) == 5) and (sys.argv[1] == '--measure'):
+        print json.dumps(measure(*sys.argv[2:]))
+        return
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--rows', type = int, default = 1000)
+    parser.add_argument('--groups', type = int, default = 2)
+    parser.add_argument('--content-dirs', type = int, default = 4)
+    parser.add_argument('--latency', type = float, default = 0.0)
+    parser.add_argument('--jitter', type = float, default = 0.0)
+    parser.add_argument('--output-kb', type = int, default = 64)
+    parser.add_argument('--format', choices = ('ods', 'csv'), default = 'ods')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    report = run(args.rows, args.groups, args.content_dirs, args.latency,
+                 args.jitter, args.output_kb, args.format)
+    print format_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent = 2, sort_keys = True)
+
+if __name__ == '__main__':
+    main()
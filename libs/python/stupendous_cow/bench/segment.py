@@ -0,0 +1,201 @@
+"""Measures what it costs each of several query worker processes to get at
+the articles' metadata, either by loading it from the database (an
+ArticleCatalog, the enums and a dict of titles, as each worker does now) or
+by mapping a metadata segment (see stupendous_cow.db.segment).
+
+The workers run at the same time, so pages of the segment they share are
+counted once in their proportional set size (PSS) rather than once per
+worker, as they are in RSS.  "Startup" is the time from starting a worker
+to it having read all the metadata once, "load" the part of that spent
+loading or mapping it and "scan" the part spent reading it.  A worker that
+loads nothing gives the cost of the interpreter itself.  On a machine with
+fewer CPUs than workers the workers start one after another, so the startup
+times include waiting for a CPU.
+
+Usage: python -m stupendous_cow.bench.segment [--articles N] [--workers N]
+           [--output <file>]"""
+
+from stupendous_cow.bench.corpus import CorpusParameters, generate_corpus
+from stupendous_cow.db.main import Database
+from stupendous_cow.db.segment import COLUMNS, MetadataSegment
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import os.path
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ('none', 'database', 'segment')
+
+def memory_kb():
+    """Returns the RSS, PSS and private memory of this process in KB, from
+    /proc/self/smaps_rollup, or just the RSS if it is not available."""
+    fields = { 'Rss' : 'rss_kb', 'Pss' : 'pss_kb',
+               'Private_Clean' : 'private_kb', 'Private_Dirty' : 'private_kb' }
+    memory = { 'rss_kb' : 0, 'pss_kb' : None, 'private_kb' : None }
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                name = line.split(':')[0]
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = (memory[key] or 0) + int(line.split()[1])
+    except IOError:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    memory['rss_kb'] = int(line.split()[1])
+    return memory
+
+def load_database(filename):
+    db = Database(filename)
+    connection = sqlite3.connect(filename)
+    try:
+        titles = dict(connection.execute('SELECT id, title FROM articles'))
+    finally:
+        connection.close()
+    return (db, db.article_catalog(), db.article_types.all, db.categories.all,
+            db.venues.all, titles)
+
+def scan_database(loaded):
+    (db, catalog, article_types, categories, venues, titles) = loaded
+    return sum(sum(catalog._columns[c]) for c in catalog.columns) + \
+               sum(len(t) for t in titles.itervalues())
+
+def load_segment(filename):
+    return MetadataSegment(filename)
+
+def scan_segment(segment):
+    return sum(sum(segment.column(c)) for c in COLUMNS) + \
+               sum(len(segment.title(i)) for i in xrange(len(segment)))
+
+def worker(mode, filename):
+    """Loads the metadata the way mode says and reads all of it, as
+    answering queries over all the articles would, then prints how long
+    that took and how much memory the worker uses and waits for its input
+    to close."""
+    start = time.time()
+    if mode == 'database':
+        loaded = load_database(filename)
+    elif mode == 'segment':
+        loaded = load_segment(filename)
+    load_seconds = time.time() - start
+    if mode == 'database':
+        scan_database(loaded)
+    elif mode == 'segment':
+        scan_segment(loaded)
+    report = memory_kb()
+    report['load_seconds'] = load_seconds
+    report['scan_seconds'] = time.time() - start - load_seconds
+    print json.dumps(report)
+    sys.stdout.flush()
+    sys.stdin.read()
+
+def run_workers(mode, filename, num_workers):
+    """Starts num_workers workers at once and returns their reports, once
+    all of them have loaded the metadata."""
+    processes = [ ]
+    for i in xrange(num_workers):
+        args = [ sys.executable, '-m', 'stupendous_cow.bench.segment',
+                 '--worker', mode, filename ]
+        processes.append((time.time(),
+                          subprocess.Popen(args, stdin = subprocess.PIPE,
+                                           stdout = subprocess.PIPE)))
+    reports = [ ]
+    try:
+        for (started_at, process) in processes:
+            report = json.loads(process.stdout.readline())
+            report['startup_seconds'] = time.time() - started_at
+            reports.append(report)
+    finally:
+        for (started_at, process) in processes:
+            process.stdin.close()
+            process.wait()
+    return reports
+
+def _mean(values):
+    values = [ v for v in values if v is not None ]
+    return float(sum(values)) / len(values) if values else None
+
+def run(num_articles, num_workers):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_filename = os.path.join(tmp_dir, 'bench.db')
+        db = Database.create_new(db_filename)
+        try:
+            generate_corpus(db, CorpusParameters(num_articles,
+                                                 content_words = 50,
+                                                 abstract_words = 20))
+            segment_filename = os.path.join(tmp_dir, 'metadata.seg')
+            start = time.time()
+            db.export_segment(segment_filename)
+            export_seconds = time.time() - start
+            segment_size_kb = os.path.getsize(segment_filename) / 1024.0
+        finally:
+            db.close()
+
+        results = { }
+        for mode in MODES:
+            filename = segment_filename if mode == 'segment' else db_filename
+            reports = run_workers(mode, filename, num_workers)
+            results[mode] = dict((key, _mean(r[key] for r in reports)) \
+                                     for key in reports[0])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return { 'benchmark' : 'segment',
+             'created_at' : datetime.datetime.now().replace(\
+                 microsecond = 0).isoformat(),
+             'num_articles' : num_articles, 'num_workers' : num_workers,
+             'num_cpus' : multiprocessing.cpu_count(),
+             'segment_size_kb' : segment_size_kb,
+             'export_seconds' : export_seconds,
+             'modes' : results }
+
+def format_results(results):
+    def kb(x):
+        return '%10.1f' % (x / 1024.0) if x is not None else '%10s' % '-'
+    lines = [ '%d articles, %d workers, %d CPUs' % \
+                  (results['num_articles'], results['num_workers'],
+                   results['num_cpus']),
+              'Segment of %.1f MB exported in %.1f ms' % \
+                  (results['segment_size_kb'] / 1024.0,
+                   1000.0 * results['export_seconds']),
+              'Per worker means:',
+              '%-10s %12s %10s %10s %10s %10s %10s' % \
+                  ('Mode', 'Startup ms', 'Load ms', 'Scan ms', 'RSS MB',
+                   'PSS MB', 'Private MB') ]
+    for mode in MODES:
+        r = results['modes'][mode]
+        lines.append('%-10s %12.1f %10.1f %10.1f %s %s %s' % \
+                         (mode, 1000.0 * r['startup_seconds'],
+                          1000.0 * r['load_seconds'],
+                          1000.0 * r['scan_seconds'], kb(r['rss_kb']),
+                          kb(r['pss_kb']), kb(r['private_kb'])))
+    return '\n'.join(lines)
+
+def main():
+    if (len(sys.argv) == 4) and (sys.argv[1] == '--worker'):
+        worker(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--articles', type = int, default = 50000)
+    parser.add_argument('--workers', type = int, default = 4)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = run(args.articles, args.workers)
+    print format_results(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent = 2, sort_keys = True)
+
+if __name__ == '__main__':
+    main()
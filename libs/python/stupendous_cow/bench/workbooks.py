@@ -0,0 +1,125 @@
+"""Compares the peak memory use and time taken to read some of the sheets
+of a large workbook with pyexcel.get_book(), which loads every sheet, and
+with Workbook.  Each sheet is read twice, as the importer's enum pre-pass
+and then its import do.  Each measurement runs in its own process so that
+peak RSS is not shared between them.
+
+Usage: python -m stupendous_cow.bench.workbooks [--sheets N] [--rows N]
+                                                [--read-sheets N]
+                                                [--format ods|csv]"""
+
+from stupendous_cow.bench.binding import synthetic_papers
+from stupendous_cow.importer.spreadsheets import Workbook, Worksheet
+import argparse
+import collections
+import os
+import os.path
+import pyexcel
+import pyexcel_io
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ('get_book', 'workbook')
+
+def create_workbook(filename, num_sheets, num_rows, num_read):
+    """Writes a workbook of num_sheets sheets of num_rows rows each to
+    filename and returns the names of the last num_read of them."""
+    sheets = collections.OrderedDict()
+    for i in xrange(num_sheets):
+        sheets['Papers %d' % (i + 1)] = synthetic_papers(num_rows)
+    if filename.endswith('.csv'):
+        # A CSV file holds one sheet
+        pyexcel_io.save_data(filename, sheets.values()[0])
+        return [ os.path.basename(filename) ]
+    pyexcel_io.save_data(filename, sheets)
+    return sheets.keys()[-num_read:]
+
+def read_sheets(mode, filename, sheet_names):
+    """Reads every row of each of the sheets sheet_names twice and returns
+    the number of rows read."""
+    if mode == 'get_book':
+        book = pyexcel.get_book(file_name = filename)
+        sheets = [ Worksheet(book[name]) for name in sheet_names ]
+    else:
+        workbook = Workbook(filename)
+        sheets = [ workbook[name] for name in sheet_names ]
+    try:
+        return sum(sum(1 for row in sheet) for sheet in sheets + sheets)
+    finally:
+        if mode != 'get_book':
+            workbook.close()
+
+def peak_rss_kb():
+    # ru_maxrss survives fork() and exec(), so a child would report its
+    # parent's peak.  VmHWM belongs to the process's own address space.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(mode, filename, sheet_names):
+    start = time.time()
+    num_rows = read_sheets(mode, filename, sheet_names)
+    elapsed = time.time() - start
+    print '%d %f %d' % (num_rows, elapsed, peak_rss_kb())
+
+def measure_baseline():
+    print '0 0 %d' % peak_rss_kb()
+
+def run(num_sheets, num_rows, num_read, file_format):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, 'workbook.' + file_format)
+        sheet_names = create_workbook(filename, num_sheets, num_rows,
+                                      num_read)
+        if file_format == 'csv':
+            num_sheets = 1
+        size = os.path.getsize(filename)
+        print 'Read %d sheets of %d rows twice from a %d-sheet %s ' \
+              'workbook (%.1f MB)' % (len(sheet_names), num_rows, num_sheets,
+                                      file_format, size / 1048576.0)
+
+        # Baseline: the interpreter and the imports, with nothing read
+        baseline = None
+        for mode in ('baseline', ) + MODES:
+            args = [ sys.executable, '-m', 'stupendous_cow.bench.workbooks',
+                     '--measure', mode, filename ] + sheet_names
+            output = subprocess.check_output(args, env = os.environ)
+            (rows, elapsed, peak_kb) = output.split()
+            if mode == 'baseline':
+                baseline = int(peak_kb)
+                continue
+            print '  %-10s %8.2f sec  peak RSS %8.1f MB (+%.1f MB over ' \
+                  'baseline), %s rows' % \
+                  (mode, float(elapsed), int(peak_kb) / 1024.0,
+                   (int(peak_kb) - baseline) / 1024.0, rows)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def main():
+    if (len(sys.argv) >= 5) and (sys.argv[1] == '--measure'):
+        (mode, filename) = sys.argv[2:4]
+        if mode == 'baseline':
+            measure_baseline()
+        else:
+            measure(mode, filename, sys.argv[4:])
+        return
+
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--sheets', type = int, default = 10)
+    parser.add_argument('--rows', type = int, default = 5000)
+    parser.add_argument('--read-sheets', type = int, default = 3)
+    parser.add_argument('--format', choices = ('ods', 'csv'), default = 'ods')
+    args = parser.parse_args()
+    run(args.sheets, args.rows, args.read_sheets, args.format)
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,9 @@ class _EnumeratedConstant(_EnumeratedConstantTuple):
     def __new__(_cls, name, id = None):
         return _EnumeratedConstantTuple.__new__(_cls, id, name)
 
+    def __getnewargs__(self):
+        return (self.name, self.id)
+
     def __str__(self):
         return self.name
 
@@ -28,6 +31,9 @@ class Venue(_Venue):
     def __new__(_cls, name, abbreviation, id = None):
         return _Venue.__new__(_cls, id, name, abbreviation)
 
+    def __getnewargs__(self):
+        return (self.name, self.abbreviation, self.id)
+
     def __str__(self):
         return self.abbreviation
 
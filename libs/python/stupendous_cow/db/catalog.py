@@ -0,0 +1,329 @@
+"""An in-memory, column-oriented copy of the articles' metadata -- year,
+priority, venue, category, article type and is_read -- for filtering the
+whole collection without a round trip to the database.
+
+Each column is an array module array of integers, with NULL stored as
+NULL_VALUE, and filters are built from the same constraints Table.retrieve()
+takes.  When NumPy is installed the filters run on NumPy views of the
+arrays; without it they run as bitwise operations on a bitset per distinct
+value of a column, which gives the same answers.
+
+    catalog = db.article_catalog()
+    ids = catalog.select(year = InRange(2015, 2018), is_read = False,
+                         venue = [ icml, nips ])
+    ...
+    catalog.refresh()       # Picks up articles added, changed or deleted"""
+
+from stupendous_cow.db.core import prepare_variable
+import array
+import itertools
+import operator
+import string
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NULL_VALUE = -sys.maxint - 1
+
+class _BitsetColumns:
+    """Evaluates filters with bitsets: Python longs whose bit i is set if
+    article i in the catalog matches.  The columns have few distinct
+    values, so each column is indexed by a bitset per value the first time
+    a filter uses it, and every filter is then a handful of bitwise
+    operations on those."""
+    _OPERATORS = { '>' : operator.gt, '>=' : operator.ge,
+                   '<' : operator.lt, '<=' : operator.le,
+                   '=' : operator.eq }
+    _TO_FLAGS = string.maketrans('01', '\0\1')
+
+    def __init__(self, ids, columns):
+        self._ids = ids
+        self._columns = columns
+        self._bitsets = { }
+
+    def everything(self):
+        return (1 << len(self._ids)) - 1
+
+    def compare(self, column, op, value):
+        compare = self._OPERATORS[op]
+        return self._union(b for (x, b) in self._get_bitsets(column).iteritems()
+                               if (x != NULL_VALUE) and compare(x, value))
+
+    def one_of(self, column, values):
+        bitsets = self._get_bitsets(column)
+        return self._union(bitsets.get(v, 0) for v in set(values) \
+                               if v != NULL_VALUE)
+
+    def is_null(self, column):
+        return self._get_bitsets(column).get(NULL_VALUE, 0)
+
+    def is_not_null(self, column):
+        return self.everything() & ~self.is_null(column)
+
+    def both(self, mask1, mask2):
+        return mask1 & mask2
+
+    def ids(self, mask):
+        # bin() puts article 0 last, so reverse it and drop the "0b"
+        flags = bin(mask)[:1:-1].translate(self._TO_FLAGS)
+        return list(itertools.compress(self._ids, bytearray(flags)))
+
+    def count(self, mask):
+        return bin(mask).count('1')
+
+    def _get_bitsets(self, column):
+        bitsets = self._bitsets.get(column)
+        if bitsets is None:
+            positions = { }
+            for (i, x) in enumerate(self._columns[column]):
+                positions.setdefault(x, [ ]).append(i)
+            bitsets = dict((x, self._to_bitset(p)) \
+                               for (x, p) in positions.iteritems())
+            self._bitsets[column] = bitsets
+        return bitsets
+
+    def _to_bitset(self, positions):
+        bits = bytearray('0' * len(self._ids))
+        for i in positions:
+            bits[-1 - i] = '1'
+        return long(str(bits), 2)
+
+    @staticmethod
+    def _union(bitsets):
+        result = 0
+        for b in bitsets:
+            result |= b
+        return result
+
+class _NumpyColumns:
+    """Evaluates filters over NumPy views of the columns.  A mask is a
+    NumPy array of bools."""
+    _OPERATORS = { '>' : operator.gt, '>=' : operator.ge,
+                   '<' : operator.lt, '<=' : operator.le,
+                   '=' : operator.eq }
+
+    def __init__(self, ids, columns):
+        def view(a):
+            return numpy.frombuffer(a, dtype = 'i%d' % a.itemsize) \
+                       if len(a) else numpy.zeros(0, dtype = int)
+        self._ids = view(ids)
+        self._columns = dict((n, view(c)) for (n, c) in columns.iteritems())
+
+    def everything(self):
+        return numpy.ones(len(self._ids), dtype = bool)
+
+    def compare(self, column, op, value):
+        values = self._columns[column]
+        return self._OPERATORS[op](values, value) & (values != NULL_VALUE)
+
+    def one_of(self, column, values):
+        values = [ v for v in values if v != NULL_VALUE ]
+        return numpy.in1d(self._columns[column], values)
+
+    def is_null(self, column):
+        return self._columns[column] == NULL_VALUE
+
+    def is_not_null(self, column):
+        return self._columns[column] != NULL_VALUE
+
+    def both(self, mask1, mask2):
+        return mask1 & mask2
+
+    def ids(self, mask):
+        return self._ids[mask].tolist()
+
+    def count(self, mask):
+        return int(numpy.count_nonzero(mask))
+
+class ArticleCatalog:
+    """The metadata of every article in the database connection db, one
+    array per column, in the order the articles were loaded.  Articles are
+    identified by id, and articles is the database's articles table, which
+    interprets the criteria."""
+    columns = ('year', 'priority', 'is_read', 'article_type_id',
+               'category_id', 'venue_id')
+
+    def __init__(self, db, articles, use_numpy = None):
+        if use_numpy and not numpy:
+            raise ValueError('Cannot use NumPy -- it is not installed')
+        self._db = db
+        self._articles = articles
+        self._use_numpy = (numpy is not None) if use_numpy is None \
+                              else use_numpy
+        self.load()
+
+    @property
+    def uses_numpy(self):
+        return self._use_numpy
+
+    @property
+    def ids(self):
+        return self._ids.tolist()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, article_id):
+        return article_id in self._positions
+
+    def get(self, article_id):
+        """Returns a dict of the metadata of the article with article_id,
+        with None for NULL, or None if the catalog does not have it."""
+        i = self._positions.get(article_id)
+        if i is None:
+            return None
+        def value(column):
+            x = self._columns[column][i]
+            if x == NULL_VALUE:
+                return None
+            return (x == 1) if column == 'is_read' else x
+        return dict((c, value(c)) for c in self.columns)
+
+    def load(self):
+        """Reads the metadata of every article, replacing what the catalog
+        held before."""
+        self._ids = array.array('l')
+        self._columns = dict((c, array.array('l')) for c in self.columns)
+        self._positions = { }
+        self._updated_at = None
+        self._evaluator = None
+        self._read_rows(self._select('', ()))
+
+    def refresh(self):
+        """Brings the catalog up to date with the database and returns the
+        number of articles added, changed or deleted since the last load or
+        refresh.  Only the articles updated since the newest last_updated_at
+        the catalog has seen are read again; deletions are found by
+        comparing the number of articles and then their ids."""
+        if self._updated_at is None:
+            num_changed = self._read_rows(self._select('', ()))
+        else:
+            num_changed = self._read_rows(\
+                self._select('WHERE last_updated_at >= ?',
+                             (self._updated_at, )))
+
+        cursor = self._db.cursor()
+        try:
+            cursor.execute('SELECT COUNT(*) FROM articles')
+            (num_articles, ) = cursor.fetchone()
+            if num_articles != len(self._ids):
+                cursor.execute('SELECT id FROM articles')
+                num_changed += self._remove_missing(\
+                    set(id for (id, ) in cursor.fetchall()))
+        finally:
+            cursor.close()
+        return num_changed
+
+    def select(self, **criteria):
+        """Returns the ids of the articles that meet every one of criteria,
+        in the order they are in the catalog.  Criteria are the same as for
+        Table.retrieve(), limited to the catalog's columns: a value, a list
+        or tuple of values, None or a constraint from
+        stupendous_cow.db.constraints.  Venues, categories and article types
+        may be given as objects, and is_read as a bool."""
+        evaluator = self._get_evaluator()
+        return evaluator.ids(self._mask(evaluator, criteria))
+
+    def count(self, **criteria):
+        """Returns the number of articles that meet every one of criteria."""
+        evaluator = self._get_evaluator()
+        return evaluator.count(self._mask(evaluator, criteria))
+
+    def _select(self, where, variables):
+        sql = 'SELECT id, last_updated_at, %s FROM articles %s' % \
+                  (', '.join(self.columns), where)
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(sql, variables)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _read_rows(self, rows):
+        is_read = self.columns.index('is_read')
+        num_changed = 0
+        for row in rows:
+            (article_id, updated_at) = row[:2]
+            values = [ NULL_VALUE if v is None else v for v in row[2:] ]
+            values[is_read] = int(row[2 + is_read] == 'Y')
+            i = self._positions.get(article_id)
+            if i is None:
+                self._positions[article_id] = len(self._ids)
+                self._ids.append(article_id)
+                for (column, v) in zip(self.columns, values):
+                    self._columns[column].append(v)
+                num_changed += 1
+            elif any(self._columns[c][i] != v \
+                         for (c, v) in zip(self.columns, values)):
+                for (column, v) in zip(self.columns, values):
+                    self._columns[column][i] = v
+                num_changed += 1
+            if (updated_at is not None) and \
+                   ((self._updated_at is None) or \
+                        (updated_at > self._updated_at)):
+                self._updated_at = updated_at
+        if num_changed:
+            self._evaluator = None
+        return num_changed
+
+    def _remove_missing(self, ids):
+        keep = [ i for (i, article_id) in enumerate(self._ids) \
+                     if article_id in ids ]
+        num_removed = len(self._ids) - len(keep)
+        if num_removed:
+            self._ids = array.array('l', (self._ids[i] for i in keep))
+            for column in self.columns:
+                values = self._columns[column]
+                self._columns[column] = \
+                    array.array('l', (values[i] for i in keep))
+            self._positions = dict((article_id, i) \
+                                       for (i, article_id) \
+                                           in enumerate(self._ids))
+            self._evaluator = None
+        return num_removed
+
+    def _get_evaluator(self):
+        if not self._evaluator:
+            if self._use_numpy:
+                self._evaluator = _NumpyColumns(self._ids, self._columns)
+            else:
+                self._evaluator = _BitsetColumns(self._ids, self._columns)
+        return self._evaluator
+
+    def _mask(self, evaluator, criteria):
+        mask = None
+        normalized = self._articles._normalize_criteria(criteria)
+        for (column, value) in normalized.iteritems():
+            if column not in self._columns:
+                msg = 'Invalid Article constraint "%s" -- the catalog ' + \
+                      'only has the columns %s'
+                raise ValueError(msg % (column, ', '.join(self.columns)))
+            if column == 'is_read':
+                value = int(value == 'Y')
+            if value is None:
+                column_mask = evaluator.is_null(column)
+            elif isinstance(value, tuple) or isinstance(value, list):
+                column_mask = evaluator.one_of(column, [ self._number(column, v)
+                                                         for v in value ])
+            elif hasattr(value, 'to_mask'):
+                column_mask = value.to_mask(column, evaluator)
+            else:
+                column_mask = evaluator.compare(column, '=',
+                                                self._number(column, value))
+            mask = column_mask if mask is None \
+                       else evaluator.both(mask, column_mask)
+        return evaluator.everything() if mask is None else mask
+
+    @staticmethod
+    def _number(column, value):
+        v = prepare_variable(value)
+        if v is None:
+            return NULL_VALUE
+        if not (isinstance(v, int) or isinstance(v, long) or \
+                    isinstance(v, float)):
+            msg = 'Invalid Article constraint "%s" -- %r is not a number'
+            raise ValueError(msg % (column, value))
+        return v
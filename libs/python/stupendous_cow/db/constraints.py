@@ -9,6 +9,10 @@ class ColumnConstraint:
         variables = (prepare_variable(self.value), )
         return (sql, variables)
 
+    def to_mask(self, column, columns):
+        return columns.compare(column, self._operator,
+                               prepare_variable(self.value))
+
 class GreaterThan(ColumnConstraint):
     _operator = '>'
 
@@ -42,14 +46,24 @@ class InRange:
         variables = low_variables + high_variables
         return (sql, variables)
 
+    def to_mask(self, column, columns):
+        return columns.both(self._low_constraint.to_mask(column, columns),
+                            self._high_constraint.to_mask(column, columns))
+
 class _IsNull:
     def to_sql(self, column):
         return ('%s IS NULL' % column, ())
 
+    def to_mask(self, column, columns):
+        return columns.is_null(column)
+
 IsNull = _IsNull()
 
 class _NotNull:
     def to_sql(self, column):
         return ('%s IS NOT NULL' % column, ())
 
+    def to_mask(self, column, columns):
+        return columns.is_not_null(column)
+
 NotNull = _NotNull()
@@ -1,3 +1,4 @@
+from stupendous_cow.profiling import span
 import datetime
 
 class ResultSet:
@@ -131,6 +132,16 @@ def construct_count_statement(table, criteria):
     stmt = 'SELECT count(*) FROM %s%s' % (table, where_clause)
     return (stmt, variables)
 
+def construct_aggregate_statement(table, group_columns, metrics, criteria):
+    (where_clause, variables) = construct_where_clause(criteria)
+    stmt = 'SELECT %s FROM %s%s' % (', '.join(tuple(group_columns) + \
+                                              tuple(metrics)),
+                                     table, where_clause)
+    if group_columns:
+        group_by = ', '.join(group_columns)
+        stmt += ' GROUP BY %s ORDER BY %s' % (group_by, group_by)
+    return (stmt, variables)
+
 def construct_insert_statement(table, values):
     cols = ', '.join(values)
     values = ', '.join(format_for_sql(values[k]) for k in values)
@@ -156,11 +167,24 @@ def execute_count(db, table, criteria):
         count.init(stmt, variables)
         return next(count)
 
+@span('execute_aggregate')
+def execute_aggregate(db, table, group_columns, metrics, criteria):
+    (stmt, variables) = construct_aggregate_statement(table, group_columns,
+                                                      metrics, criteria)
+    cursor = db.cursor()
+    try:
+        cursor.execute(stmt, variables)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+@span('execute_select')
 def execute_select(db, table, columns, criteria,
                     create_result = lambda **x: x):
     (stmt, variables) = construct_select_statement(table, columns, criteria)
     return ResultSet(db.cursor(), create_result).init(stmt, columns, variables)
 
+@span('execute_dml')
 def execute_dml(db, stmt, variables):
     cursor = db.cursor()
     try:
@@ -175,6 +199,16 @@ def execute_insert(db, table, values):
     (stmt, variables) = construct_insert_statement(table, values)
     execute_dml(db, stmt, variables)
 
+def execute_insert_many(db, table, columns, rows):
+    stmt = 'INSERT INTO %s(%s) VALUES (%s)' % (table, ', '.join(columns),
+                                                ', '.join('?' for c in columns))
+    cursor = db.cursor()
+    try:
+        cursor.executemany(stmt, ([ prepare_variable(v) for v in r ] \
+                                      for r in rows))
+    finally:
+        cursor.close()
+
 def execute_update(db, table, columns, criteria):
     (stmt, variables) = construct_update_statement(table, columns, criteria)
     execute_dml(db, stmt, variables)
@@ -183,7 +217,12 @@ def execute_delete(db, table, criteria):
     (stmt, variables) = construct_delete_statement(table, criteria)
     execute_dml(db, stmt, variables)
 
+@span('next_item_id')
 def next_item_id(db, table_name):
+    return next_item_ids(db, table_name, 1)
+
+def next_item_ids(db, table_name, count):
+    """Reserves count consecutive ids for table_name and returns the first."""
     cursor = db.cursor()
     try:
         cursor.execute("BEGIN TRANSACTION")
@@ -192,12 +231,12 @@ def next_item_id(db, table_name):
         try:
             next_id = next(cursor)[0]
             cursor.execute(
-                "UPDATE id_sequence SET id = id + 1 WHERE table_name = ?;",
-                (table_name,))
+                "UPDATE id_sequence SET id = id + ? WHERE table_name = ?;",
+                (count, table_name))
         except StopIteration:
             next_id = 1
             cursor.execute("INSERT INTO id_sequence VALUES(?, ?)",
-                           (table_name, next_id + 1))
+                           (table_name, next_id + count))
         db.commit()
         return next_id
     finally:
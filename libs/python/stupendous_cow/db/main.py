@@ -1,16 +1,41 @@
 from stupendous_cow.data_model import Article, ArticleType, Venue, Category
 from stupendous_cow.util import normalize_title
-from stupendous_cow.db.core import OneColumnResultSet, create_id_sequence_table
+from stupendous_cow.db.catalog import ArticleCatalog
+from stupendous_cow.db.core import OneColumnResultSet, ResultSet, \
+    create_id_sequence_table, execute_aggregate, execute_count, \
+    execute_delete, execute_dml, execute_insert
+from stupendous_cow.db.segment import write_segment
 from stupendous_cow.db.tables import Table, EnumTable
+from stupendous_cow.db.tracing import tracer_from_environment
 
 import datetime
+import json
+import logging
 import os
 import os.path
 import sqlite3
 
+# The (name, abbreviation) of the venues every new database starts with
+_SEEDED_VENUES = (
+    ('Association for Computational Linguistics', 'ACL'),
+    ('ACM International Conference on Information and Knowledge Management',
+     'CIKM'),
+    ('International Conference on Learning Representations', 'ICLR'),
+    ('International Conference on Machine Learning', 'ICML'),
+    ('ACM SIGKDD Conference On Knowledge Discovery and Data Mining', 'KDD'),
+    ('Conference of the North American Chapter of the Association for ' \
+         'Computational Linguistics', 'NAACL'),
+    ('Neural Information Processing Systems', 'NIPS'),
+    ('International ACM SIGIR Conference on Research and Development in ' \
+         'Information Retrieval', 'SIGIR'))
+
     
 class _Articles(Table):
     _UNIX_EPOCH = datetime.datetime.utcfromtimestamp(0)
+    # Also the condition of the articles_needing_reindexing index, which
+    # SQLite only uses for queries with the same condition
+    _NEEDS_REINDEXING = \
+        "(last_updated_at > last_indexed_at) OR (last_indexed_at IS NULL)"
     table_columns = ('id', 'title', 'normalized_title', 'abstract',
                      'content', 'year', 'priority', 'downloaded_as', 'pdf_file',
                      'summary', 'is_read', 'created_at',
@@ -35,11 +60,18 @@ class _Articles(Table):
         self._id_columns = { 'article_type' : ArticleType,
                              'category' : Category,
                              'venue' : Venue }
+        self._counts = None
+
+    def count(self, **criteria):
+        criteria = self._normalize_criteria(criteria)
+        if self._counts and self._counts.can_answer((), criteria):
+            n = self._counts.count(criteria)
+            if n is not None:
+                return n
+        return execute_count(self._db, self._table_name, criteria)
 
     def need_reindexing(self):
-        sql = "SELECT id FROM articles " + \
-              "WHERE (last_updated_at > last_indexed_at) OR " + \
-                    "(last_indexed_at IS NULL)"
+        sql = "SELECT id FROM articles WHERE " + self._NEEDS_REINDEXING
         rs = OneColumnResultSet(self._db.cursor(), lambda x: x)
         return rs.init(sql, ())
 
@@ -102,6 +134,34 @@ class _Articles(Table):
         return dict(normalize_constraint(n, v) \
                         for (n, v) in criteria.iteritems())
 
+    def _aggregate_column(self, name):
+        if name in self._id_columns:
+            return name + '_id'
+        elif name == 'is_read':
+            return "(is_read = 'Y')"
+        return Table._aggregate_column(self, name)
+
+    def _execute_aggregate(self, group_columns, metrics, criteria):
+        expressions = list(group_columns) + [ c for (f, c) in metrics \
+                                                  if c != '*' ]
+        if self._counts and self._counts.can_answer(expressions, criteria):
+            rows = self._counts.aggregate(group_columns, metrics, criteria)
+            if rows is not None:
+                return rows
+        return Table._execute_aggregate(self, group_columns, metrics,
+                                        criteria)
+
+    def _group_value(self, name, value):
+        if name == 'article_type':
+            return self._article_types.with_id(value)
+        elif name == 'category':
+            return self._categories.with_id(value)
+        elif name == 'venue':
+            return self._venues.with_id(value)
+        elif (name == 'is_read') and (value is not None):
+            return bool(value)
+        return value
+
     def _set_defaults_for_write(self, values):
         now = datetime.datetime.now().replace(microsecond = 0)
         if not values['normalized_title']:
@@ -137,6 +197,27 @@ class _Articles(Table):
                 FOREIGN KEY(venue_id) REFERENCES venues(id)
             );""")
 
+    @staticmethod
+    def create_indexes(cursor):
+        # The importers look articles up by venue, year and normalized
+        # title, the enum tables count the articles that refer to them and
+        # the catalog refreshes the articles updated since it last looked
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS articles_by_venue_year_title
+                ON articles(venue_id, year, normalized_title)""")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS articles_by_article_type
+                ON articles(article_type_id)""")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS articles_by_category
+                ON articles(category_id)""")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS articles_by_last_updated_at
+                ON articles(last_updated_at)""")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS articles_needing_reindexing
+                ON articles(id) WHERE """ + _Articles._NEEDS_REINDEXING)
+
 class _ArticleTypes(EnumTable):
     def __init__(self, db):
         EnumTable.__init__(self, 'ArticleType', db, 'article_types',
@@ -146,6 +227,13 @@ class _ArticleTypes(EnumTable):
     def _count_references_to(self, article_type_id):
         return self._articles.count(article_type_id = article_type_id)
 
+    def _count_all_references(self):
+        return self._articles.aggregate(group_by = 'article_type_id')
+
+    def _is_protected(self, item):
+        # ArticleBuilder falls back on the one named ''
+        return item.name == ''
+
     @staticmethod
     def create_table(cursor):
         cursor.execute("""
@@ -171,6 +259,12 @@ class _Venues(EnumTable):
     def _count_references_to(self, venue_id):
         return self._articles.count(venue_id = venue_id)
 
+    def _count_all_references(self):
+        return self._articles.aggregate(group_by = 'venue_id')
+
+    def _is_protected(self, item):
+        return any(item.abbreviation == a for (n, a) in _SEEDED_VENUES)
+
     @staticmethod
     def create_table(cursor):
         cursor.execute("""
@@ -190,6 +284,13 @@ class _Categories(EnumTable):
     def _count_references_to(self, category_id):
         return self._articles.count(category_id = category_id)
 
+    def _count_all_references(self):
+        return self._articles.aggregate(group_by = 'category_id')
+
+    def _is_protected(self, item):
+        # ArticleBuilder falls back on the one named ''
+        return item.name == ''
+
     @staticmethod
     def create_table(cursor):
         cursor.execute("""
@@ -199,15 +300,308 @@ class _Categories(EnumTable):
                 PRIMARY KEY (id)
             )""")
 
-class Database:
-    __slots__ = ('filename', '_db', '_articles', '_venues', '_categories')
+class _ArticleFingerprints:
+    """Fingerprints of the source data each article was imported from.
+
+    The importers use these to skip rows that have not changed since the
+    last import.  Fingerprints for articles that no longer exist are
+    ignored."""
+    def __init__(self, db):
+        self._db = db
+
+    def current(self, venue, year):
+        sql = "SELECT f.fingerprint FROM article_fingerprints f " + \
+              "JOIN articles a ON a.id = f.article_id " + \
+              "WHERE (a.venue_id = ?) AND (a.year = ?)"
+        with OneColumnResultSet(self._db.cursor(), lambda x: x) as rs:
+            rs.init(sql, (venue.id, year))
+            return set(rs)
+
+    def set(self, article_id, fingerprint):
+        self.delete(article_id)
+        execute_insert(self._db, 'article_fingerprints',
+                       { 'article_id' : article_id,
+                         'fingerprint' : fingerprint })
+
+    def delete(self, article_id):
+        execute_delete(self._db, 'article_fingerprints',
+                       { 'article_id' : article_id })
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_fingerprints (
+                article_id NUMBER,
+                fingerprint VARCHAR(64) NOT NULL,
+                PRIMARY KEY(article_id),
+                FOREIGN KEY(article_id) REFERENCES articles(id)
+            )""")
+
+class _ArticleCounts:
+    """An optional summary of the articles table: the number of articles
+    for each combination of venue, year, category, article type and
+    is_read, kept exact by triggers on articles.  When it exists, counting
+    and aggregating articles by those columns alone reads it instead of
+    the articles themselves.
+
+    create() adds the table and its triggers and fills it, rebuild() fills
+    it again from the articles and check() compares the two.  Whether it
+    exists is decided when the database is opened.  If another connection
+    drops it, count() and aggregate() find that out, mark it unavailable
+    and return None, so the articles are read instead.  One created by
+    another connection is not used until the database is opened again."""
+    columns = ('venue_id', 'year', 'category_id', 'article_type_id',
+               'is_read')
+    # What Table.aggregate() may group by or compute metrics of, since the
+    # summary has the same columns the expressions refer to
+    _EXPRESSIONS = frozenset(columns + ("(is_read = 'Y')", ))
+    _TRIGGERS = ('article_counts_insert', 'article_counts_delete',
+                 'article_counts_update')
+
+    def __init__(self, db):
+        self._db = db
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT count(*) FROM sqlite_master " + \
+                           "WHERE type = 'table' AND name = 'article_counts'")
+            self._available = bool(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+
+    @property
+    def available(self):
+        return self._available
+
+    def create(self):
+        """Creates the summary and its triggers, if they do not exist, and
+        fills it.  Call commit() on the database afterwards."""
+        cursor = self._db.cursor()
+        try:
+            self._create_table(cursor)
+        finally:
+            cursor.close()
+        self._available = True
+        self.rebuild()
+
+    def drop(self):
+        cursor = self._db.cursor()
+        try:
+            for trigger in self._TRIGGERS:
+                cursor.execute('DROP TRIGGER IF EXISTS ' + trigger)
+            cursor.execute('DROP TABLE IF EXISTS article_counts')
+        finally:
+            cursor.close()
+        self._available = False
+
+    def rebuild(self):
+        """Recomputes the summary from the articles and returns the number
+        of rows it has."""
+        columns = ', '.join(self.columns)
+        cursor = self._db.cursor()
+        try:
+            cursor.execute('DELETE FROM article_counts')
+            cursor.execute('INSERT INTO article_counts(%s, num_articles) ' \
+                           'SELECT %s, count(*) FROM articles GROUP BY %s' % \
+                               (columns, columns, columns))
+            cursor.execute('SELECT count(*) FROM article_counts')
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def check(self):
+        """Compares the summary with the articles and returns a list of
+        (venue_id, year, category_id, article_type_id, is_read, number of
+        articles, number in the summary) tuples for every combination where
+        they differ.  The list is empty if the summary is exact."""
+        columns = ', '.join(self.columns)
+        cursor = self._db.cursor()
+        try:
+            cursor.execute('SELECT %s, count(*) FROM articles GROUP BY %s' % \
+                               (columns, columns))
+            truth = dict((row[:-1], row[-1]) for row in cursor.fetchall())
+            cursor.execute('SELECT %s, num_articles FROM article_counts' % \
+                               columns)
+            summary = { }
+            for row in cursor.fetchall():
+                # A key in the summary twice is as wrong as a wrong count
+                summary[row[:-1]] = summary.get(row[:-1], 0) + row[-1]
+        finally:
+            cursor.close()
+        return sorted(key + (truth.get(key, 0), summary.get(key, 0)) \
+                          for key in set(truth) | set(summary) \
+                              if truth.get(key, 0) != summary.get(key, 0))
+
+    def can_answer(self, expressions, criteria):
+        """Returns True if the summary exists and the aggregate of the
+        articles grouped by or computing metrics of the column expressions
+        and constrained by criteria can be computed from it."""
+        return self._available and \
+                   all(e in self._EXPRESSIONS for e in expressions) and \
+                   all(c in self.columns for c in criteria)
+
+    def count(self, criteria):
+        rows = self.aggregate([ ], [ ('count', '*') ], criteria)
+        return None if rows is None else rows[0][0]
+
+    def aggregate(self, group_columns, metrics, criteria):
+        """Computes the metrics, (function, column) pairs as
+        Table._parse_metric() returns them, of the articles grouped by
+        group_columns and constrained by criteria from the summary, or
+        returns None if the summary no longer exists."""
+        def weighted(function, column):
+            counted = 'CASE WHEN %s IS NOT NULL THEN num_articles END' % \
+                          column
+            if (function == 'count') and (column == '*'):
+                return 'coalesce(sum(num_articles), 0)'
+            elif function == 'count':
+                return 'coalesce(sum(%s), 0)' % counted
+            elif function in ('sum', 'total'):
+                return '%s(%s * num_articles)' % (function, column)
+            elif function == 'avg':
+                return 'total(%s * num_articles) / sum(%s)' % (column, counted)
+            return '%s(%s)' % (function, column)
+        try:
+            return execute_aggregate(self._db, 'article_counts',
+                                     group_columns,
+                                     [ weighted(*m) for m in metrics ],
+                                     criteria)
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            logging.warn('The article_counts summary is gone -- counting ' + \
+                         'the articles instead')
+            self._available = False
+            return None
 
-    def __init__(self, filename, db = None):
+    @staticmethod
+    def _create_table(cursor):
+        columns = ', '.join(_ArticleCounts.columns)
+        # IS rather than = so NULLs match
+        def values(row):
+            return ', '.join('%s.%s' % (row, c) \
+                                 for c in _ArticleCounts.columns)
+        def match(row):
+            return ' AND '.join('(%s IS %s.%s)' % (c, row, c) \
+                                    for c in _ArticleCounts.columns)
+        def add(row):
+            return """
+                INSERT INTO article_counts(%s, num_articles)
+                    SELECT %s, 0 WHERE NOT EXISTS
+                        (SELECT 1 FROM article_counts WHERE %s);
+                UPDATE article_counts SET num_articles = num_articles + 1
+                    WHERE %s;""" % (columns, values(row), match(row),
+                                    match(row))
+        def remove(row):
+            return """
+                UPDATE article_counts SET num_articles = num_articles - 1
+                    WHERE %s;
+                DELETE FROM article_counts
+                    WHERE (num_articles <= 0) AND %s;""" % (match(row),
+                                                            match(row))
+        changed = ' OR '.join('(OLD.%s IS NOT NEW.%s)' % (c, c) \
+                                  for c in _ArticleCounts.columns)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_counts (
+                venue_id NUMBER,
+                year NUMBER,
+                category_id NUMBER,
+                article_type_id NUMBER,
+                is_read CHAR(1),
+                num_articles NUMBER NOT NULL
+            )""")
+        # The enum tables count references by category and article type.
+        # Those indexes include num_articles so counting reads only them
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS article_counts_by_key
+                ON article_counts(%s)""" % columns)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS article_counts_by_category
+                ON article_counts(category_id, num_articles)""")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS article_counts_by_article_type
+                ON article_counts(article_type_id, num_articles)""")
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS article_counts_insert
+                AFTER INSERT ON articles
+            BEGIN %s
+            END""" % add('NEW'))
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS article_counts_delete
+                AFTER DELETE ON articles
+            BEGIN %s
+            END""" % remove('OLD'))
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS article_counts_update
+                AFTER UPDATE ON articles WHEN %s
+            BEGIN %s %s
+            END""" % (changed, remove('OLD'), add('NEW')))
+
+class _ImportRuns:
+    """Reports of importer runs, one per run, so their throughput can be
+    compared across runs and releases.  A report is a dict with at least
+    the "importer", "started_at" (ISO 8601), "elapsed" and "num_rows"
+    entries, such as run_report() in stupendous_cow.importer.metrics
+    returns.  It is stored as JSON."""
+    _columns = ('id', 'importer', 'started_at', 'elapsed', 'num_rows',
+                'report')
+
+    def __init__(self, db):
+        self._db = db
+
+    def add(self, report):
+        sql = "INSERT INTO import_runs(importer, started_at, elapsed, " + \
+              "num_rows, report) VALUES (?, ?, ?, ?, ?)"
+        execute_dml(self._db, sql, (report['importer'], report['started_at'],
+                                    report['elapsed'], report['num_rows'],
+                                    json.dumps(report, sort_keys = True)))
+
+    @property
+    def all(self):
+        """Returns the reports of all runs, oldest first, each with an "id"
+        entry added."""
+        def create_report(id, report, **columns):
+            report = json.loads(report)
+            report['id'] = id
+            return report
+
+        sql = "SELECT %s FROM import_runs ORDER BY id" % \
+                  ', '.join(self._columns)
+        with ResultSet(self._db.cursor(), create_report) as rs:
+            return list(rs.init(sql, self._columns, ()))
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS import_runs (
+                id INTEGER PRIMARY KEY,
+                importer VARCHAR(64) NOT NULL,
+                started_at VARCHAR(32) NOT NULL,
+                elapsed NUMBER,
+                num_rows NUMBER,
+                report TEXT
+            )""")
+
+class Database:
+    __slots__ = ('filename', 'tracer', '_db', '_articles', '_venues',
+                 '_categories', '_article_types', '_article_counts',
+                 '_article_fingerprints',
+                 '_import_runs')
+
+    def __init__(self, filename, db = None, tracer = None,
+                 upgrade_schema = True):
+        """Opens the database in filename, or uses the connection db if it is
+        given.  If tracer, a SqlTracer, is given or STUPENDOUS_COW_TRACE_SQL
+        is set, the statements the database runs are traced.  Tables added
+        since the database was created are created too, unless
+        upgrade_schema is False because another connection has done it."""
         self.filename = filename
-        if db:
-            self._db = db
-        else:
-            self._db = sqlite3.connect(filename)
+        if not db:
+            db = sqlite3.connect(filename)
+        self.tracer = tracer or tracer_from_environment()
+        if self.tracer:
+            db = self.tracer.trace(db)
+        self._db = db
         self._article_types = _ArticleTypes(self._db)
         self._categories = _Categories(self._db)
         self._venues = _Venues(self._db)
@@ -217,11 +611,30 @@ class Database:
         self._article_types._articles = self._articles
         self._categories._articles = self._articles
         self._venues._articles = self._articles
+        self._article_counts = _ArticleCounts(self._db)
+        self._articles._counts = self._article_counts
+        self._article_fingerprints = _ArticleFingerprints(self._db)
+        self._import_runs = _ImportRuns(self._db)
+
+        if upgrade_schema:
+            self._upgrade_schema()
 
     @property
     def articles(self):
         return self._articles
 
+    @property
+    def article_counts(self):
+        return self._article_counts
+
+    @property
+    def article_fingerprints(self):
+        return self._article_fingerprints
+
+    @property
+    def import_runs(self):
+        return self._import_runs
+
     @property
     def article_types(self):
         return self._article_types
@@ -234,6 +647,19 @@ class Database:
     def venues(self):
         return self._venues
 
+    def article_catalog(self, use_numpy = None):
+        """Returns an ArticleCatalog of the articles' metadata.  It uses NumPy
+        if use_numpy is True, or if it is None and NumPy is installed."""
+        return ArticleCatalog(self._db, self._articles, use_numpy)
+
+    def export_segment(self, filename):
+        """Writes the articles' metadata and the enums to the metadata
+        segment in filename, as a new generation that MetadataSegments
+        reading it switch to when they are refreshed.  Returns the
+        generation."""
+        return write_segment(self._db, filename, self._article_types.all,
+                             self._categories.all, self._venues.all)
+
     def commit(self):
         self._db.commit()
 
@@ -243,6 +669,15 @@ class Database:
     def close(self):
         self._db.close()
         self._db = None
+
+    def _upgrade_schema(self):
+        # Create tables added after the database was first created
+        cursor = self._db.cursor()
+        try:
+            Database._create_optional_tables(cursor)
+        finally:
+            cursor.close()
+        self._db.commit()
         
     @staticmethod
     def create_new(filename):
@@ -276,6 +711,13 @@ class Database:
         _Categories.create_table(cursor)
         _Venues.create_table(cursor)
         _Articles.create_table(cursor)
+        Database._create_optional_tables(cursor)
+
+    @staticmethod
+    def _create_optional_tables(cursor):
+        _ArticleFingerprints.create_table(cursor)
+        _ImportRuns.create_table(cursor)
+        _Articles.create_indexes(cursor)
 
     @staticmethod
     def _populate_article_types(db):
@@ -295,19 +737,5 @@ class Database:
     
     @staticmethod
     def _populate_venues(db):
-        db.venues.add(Venue(name = 'Association for Computational Linguistics',
-                            abbreviation = 'ACL'))
-        db.venues.add(Venue(name = 'ACM International Conference on Information and Knowledge Management',
-                            abbreviation = 'CIKM'))
-        db.venues.add(Venue(name = 'International Conference on Learning Representations',
-                            abbreviation = 'ICLR'))
-        db.venues.add(Venue(name = 'International Conference on Machine Learning',
-                            abbreviation = 'ICML'))
-        db.venues.add(Venue(name = 'ACM SIGKDD Conference On Knowledge Discovery and Data Mining',
-                            abbreviation = 'KDD'))
-        db.venues.add(Venue(name = 'Conference of the North American Chapter of the Association for Computational Linguistics',
-                            abbreviation = 'NAACL'))
-        db.venues.add(Venue(name = 'Neural Information Processing Systems',
-                            abbreviation = 'NIPS'))
-        db.venues.add(Venue(name = 'International ACM SIGIR Conference on Research and Development in Information Retrieval',
-                            abbreviation = 'SIGIR'))
+        for (name, abbreviation) in _SEEDED_VENUES:
+            db.venues.add(Venue(name = name, abbreviation = abbreviation))
@@ -0,0 +1,277 @@
+"""A file that holds the articles' metadata -- ids, years, priorities,
+is_read, article type, category and venue ids, and titles -- plus the
+article types, categories and venues, laid out so that query worker
+processes can map it read-only and share one copy of it.
+
+The file is written by write_segment() (see Database.export_segment()) to a
+temporary file that is then renamed over the old one, so a reader sees
+either the old generation or the new one, never a mixture.  A
+MetadataSegment maps the generation that is current when it is opened, and
+refresh() swaps it for the newest one.  Mappings of old generations stay
+valid for as long as something refers to them.
+
+Layout, in native byte order: a header (HEADER_FORMAT), then one column of
+8-byte integers per name in COLUMNS, each num_articles long, then the
+num_articles + 1 offsets of the titles in the title table, the title table
+(the titles, UTF-8 encoded, one after the other) and the enums as JSON.  The
+articles are in id order and NULL is stored as NULL_VALUE, as in an
+ArticleCatalog."""
+
+from stupendous_cow.data_model import ArticleType, Category, Venue
+from stupendous_cow.db.catalog import NULL_VALUE
+import bisect
+import json
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = 'SCOWMETA'
+VERSION = 1
+# Magic, version, generation, number of articles, offset and size of the
+# title table, offset and size of the enums
+HEADER_FORMAT = '=8sQQQQQQQ'
+COLUMNS = ('id', 'year', 'priority', 'is_read', 'article_type_id',
+           'category_id', 'venue_id')
+
+_HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+_ITEM_SIZE = 8
+_ITEM_FORMAT = '=q'
+_CHUNK_SIZE = 4096
+
+def _column_offset(index, num_articles):
+    return _HEADER_SIZE + index * num_articles * _ITEM_SIZE
+
+def _read_header(data):
+    if len(data) < _HEADER_SIZE:
+        raise ValueError('Not a metadata segment -- it is too short')
+    header = struct.unpack_from(HEADER_FORMAT, data)
+    if header[0] != MAGIC:
+        raise ValueError('Not a metadata segment -- bad magic number')
+    if header[1] != VERSION:
+        raise ValueError('Metadata segment version %d is not supported' % \
+                             header[1])
+    return header[2:]
+
+def segment_generation(filename):
+    """Returns the generation of the segment in filename, or 0 if there is
+    no segment there."""
+    try:
+        with open(filename, 'rb') as input:
+            return _read_header(input.read(_HEADER_SIZE))[0]
+    except (IOError, ValueError):
+        return 0
+
+def write_segment(db, filename, article_types, categories, venues):
+    """Writes the metadata of the articles in the database connection db
+    and the article types, categories and venues given as a new generation
+    of the segment in filename, and returns the generation."""
+    cursor = db.cursor()
+    try:
+        cursor.execute('SELECT %s, title FROM articles ORDER BY id' % \
+                           ', '.join(COLUMNS))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    is_read = COLUMNS.index('is_read')
+    def value(row, i):
+        if i == is_read:
+            return int(row[i] == 'Y')
+        return NULL_VALUE if row[i] is None else row[i]
+
+    titles = [ (r[-1] or u'').encode('utf-8') for r in rows ]
+    title_offsets = [ 0 ]
+    for title in titles:
+        title_offsets.append(title_offsets[-1] + len(title))
+    enums = json.dumps({
+        'article_types' : [ (t.id, t.name) for t in article_types ],
+        'categories' : [ (c.id, c.name) for c in categories ],
+        'venues' : [ (v.id, v.name, v.abbreviation) for v in venues ] })
+
+    generation = segment_generation(filename) + 1
+    num_articles = len(rows)
+    titles_offset = _column_offset(len(COLUMNS) + 1, num_articles) + \
+                        _ITEM_SIZE
+    enums_offset = titles_offset + title_offsets[-1]
+
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_filename, 'wb') as output:
+            output.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, generation,
+                                     num_articles, titles_offset,
+                                     title_offsets[-1], enums_offset,
+                                     len(enums)))
+            def write_column(values):
+                for start in xrange(0, len(values), _CHUNK_SIZE):
+                    chunk = values[start:start + _CHUNK_SIZE]
+                    output.write(struct.pack('=%dq' % len(chunk), *chunk))
+            for i in xrange(len(COLUMNS)):
+                write_column([ value(row, i) for row in rows ])
+            write_column(title_offsets)
+            output.write(''.join(titles))
+            output.write(enums)
+            output.flush()
+            os.fsync(output.fileno())
+        os.rename(tmp_filename, filename)
+    except:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    return generation
+
+class _MappedColumn:
+    """A read-only sequence of the 8-byte integers in a mapped segment,
+    read from the mapping as they are asked for.  Used when NumPy is not
+    installed."""
+    def __init__(self, data, offset, size):
+        self._data = data
+        self._offset = offset
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+        if not (0 <= i < self._size):
+            raise IndexError('Column index out of range')
+        return struct.unpack_from(_ITEM_FORMAT, self._data,
+                                  self._offset + i * _ITEM_SIZE)[0]
+
+    def __iter__(self):
+        for start in xrange(0, self._size, _CHUNK_SIZE):
+            n = min(_CHUNK_SIZE, self._size - start)
+            for x in struct.unpack_from('=%dq' % n, self._data,
+                                        self._offset + start * _ITEM_SIZE):
+                yield x
+
+    def tolist(self):
+        return list(self)
+
+class _Mapping:
+    """One generation of a segment, mapped into memory."""
+    def __init__(self, filename):
+        with open(filename, 'rb') as input:
+            status = os.fstat(input.fileno())
+            self.file_id = (status.st_dev, status.st_ino)
+            if not status.st_size:
+                raise ValueError('Not a metadata segment -- it is empty')
+            self.data = mmap.mmap(input.fileno(), 0, access = mmap.ACCESS_READ)
+        (self.generation, self.num_articles, self._titles_offset,
+         titles_size, enums_offset, enums_size) = _read_header(self.data)
+        if enums_offset + enums_size > len(self.data):
+            raise ValueError('Metadata segment is truncated')
+
+        self.columns = dict((name, self._column(i)) \
+                                for (i, name) in enumerate(COLUMNS))
+        self._title_offsets_offset = _column_offset(len(COLUMNS),
+                                                    self.num_articles)
+        enums = json.loads(self.data[enums_offset:enums_offset + enums_size])
+        self.article_types = [ ArticleType(n, i) \
+                                   for (i, n) in enums['article_types'] ]
+        self.categories = [ Category(n, i) for (i, n) in enums['categories'] ]
+        self.venues = [ Venue(n, a, i) for (i, n, a) in enums['venues'] ]
+
+    def _column(self, index):
+        offset = _column_offset(index, self.num_articles)
+        size = self.num_articles
+        if numpy is not None:
+            return numpy.frombuffer(self.data, dtype = '=i8', count = size,
+                                    offset = offset)
+        return _MappedColumn(self.data, offset, size)
+
+    def title(self, i):
+        if not (0 <= i < self.num_articles):
+            raise IndexError('Article index out of range')
+        (start, end) = struct.unpack_from('=2q', self.data,
+                                          self._title_offsets_offset + \
+                                              i * _ITEM_SIZE)
+        return self.data[self._titles_offset + start:
+                         self._titles_offset + end].decode('utf-8')
+
+class MetadataSegment:
+    """A read-only view of the newest generation of the segment in filename
+    at the time it was opened or last refreshed.  Columns are NumPy arrays
+    if NumPy is installed and sequences read straight from the mapping if
+    not; either way, nothing is copied out of the segment until it is
+    asked for."""
+    def __init__(self, filename):
+        self.filename = filename
+        self._mapping = _Mapping(filename)
+
+    @property
+    def generation(self):
+        return self._mapping.generation
+
+    @property
+    def ids(self):
+        return self._mapping.columns['id']
+
+    @property
+    def article_types(self):
+        return self._mapping.article_types
+
+    @property
+    def categories(self):
+        return self._mapping.categories
+
+    @property
+    def venues(self):
+        return self._mapping.venues
+
+    def __len__(self):
+        return self._mapping.num_articles
+
+    def __contains__(self, article_id):
+        return self.position(article_id) is not None
+
+    def column(self, name):
+        try:
+            return self._mapping.columns[name]
+        except KeyError:
+            raise ValueError('Metadata segment has no column "%s"' % name)
+
+    def position(self, article_id):
+        """Returns the index of the article with article_id in the columns,
+        or None if the segment does not have it."""
+        ids = self._mapping.columns['id']
+        i = bisect.bisect_left(ids, article_id)
+        if (i < len(ids)) and (ids[i] == article_id):
+            return i
+        return None
+
+    def title(self, i):
+        return self._mapping.title(i)
+
+    def get(self, article_id):
+        """Returns a dict of the metadata and title of the article with
+        article_id, with None for NULL, or None if the segment does not
+        have it."""
+        mapping = self._mapping
+        i = self.position(article_id)
+        if i is None:
+            return None
+        def value(column):
+            x = int(mapping.columns[column][i])
+            if x == NULL_VALUE:
+                return None
+            return (x == 1) if column == 'is_read' else x
+        metadata = dict((c, value(c)) for c in COLUMNS[1:])
+        metadata['title'] = mapping.title(i)
+        return metadata
+
+    def refresh(self):
+        """Maps the newest generation of the segment if it has changed since
+        it was mapped, and returns True if it has.  Columns taken from the
+        previous generation remain valid."""
+        status = os.stat(self.filename)
+        if (status.st_dev, status.st_ino) == self._mapping.file_id:
+            return False
+        self._mapping = _Mapping(self.filename)
+        return True
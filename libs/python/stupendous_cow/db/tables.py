@@ -1,8 +1,18 @@
 from stupendous_cow.db.core import \
-    execute_count, execute_select, execute_insert, execute_update, \
-    execute_delete, next_item_id, ResultSet, OneColumnResultSet
+    execute_aggregate, execute_count, execute_select, execute_insert, \
+    execute_insert_many, execute_update, execute_delete, next_item_id, \
+    next_item_ids, ResultSet, OneColumnResultSet
+from stupendous_cow.db.constraints import InRange
+import re
+
+# SQLite refuses statements with more than 999 host parameters, so
+# delete_unreferenced() deletes its ids this many at a time
+DELETE_CHUNK_SIZE = 500
 
 class Table:
+    _METRIC_FUNCTIONS = ('avg', 'count', 'max', 'min', 'sum', 'total')
+    _METRIC_RE = re.compile(r'^\s*(\w+)\s*\(\s*(\*|\w+)\s*\)\s*$')
+
     def __init__(self, type_name, db, table_name, columns, item_constructor,
                  column_value_extractor):
         self._type_name = type_name
@@ -37,6 +47,24 @@ class Table:
         return execute_count(self._db, self._table_name,
                              self._normalize_criteria(criteria))
 
+    def aggregate(self, group_by = (), metrics = ('count', ), **criteria):
+        """Computes metrics over the items that meet criteria in one query,
+        grouped by the columns in group_by.  A metric is "count" or a
+        function -- avg, count, max, min, sum or total -- of a column, as
+        in "sum(is_read)".  Returns a list of tuples of the group_by values
+        followed by the metric values, one per group, in group_by order."""
+        if isinstance(group_by, basestring):
+            group_by = (group_by, )
+        if isinstance(metrics, basestring):
+            metrics = (metrics, )
+        group_columns = [ self._aggregate_column(name) for name in group_by ]
+        metric_columns = [ self._parse_metric(metric) for metric in metrics ]
+        rows = self._execute_aggregate(group_columns, metric_columns,
+                                       self._normalize_criteria(criteria))
+        return [ tuple(self._group_value(n, v) \
+                           for (n, v) in zip(group_by, row)) + \
+                     row[len(group_by):] for row in rows ]
+
     def retrieve(self, **criteria):
         return execute_select(self._db, self._table_name, self._columns,
                               self._normalize_criteria(criteria),
@@ -64,6 +92,35 @@ class Table:
         execute_insert(self._db, self._table_name, values)
         return self.with_id(item_id)
 
+    def add_all(self, items):
+        """Adds several items at once, reserving their ids and inserting them
+        with one statement.  Returns the new items."""
+        for item in items:
+            if self._get_column_value(item, self._id_column):
+                msg = 'Cannot add %s if it already has an id' % \
+                          self._type_name
+                raise ValueError(msg)
+        if not items:
+            return [ ]
+
+        first_id = next_item_ids(self._db, self._table_name, len(items))
+        columns = self._columns[1:]
+        rows = [ ]
+        for (n, item) in enumerate(items):
+            values = self._get_column_values(item)
+            self._set_defaults_for_write(values)
+            rows.append([ first_id + n ] + [ values[c] for c in columns ])
+        execute_insert_many(self._db, self._table_name,
+                            (self._id_column, ) + tuple(columns), rows)
+
+        id_range = InRange(first_id, first_id + len(items))
+        with execute_select(self._db, self._table_name, self._columns,
+                            { self._id_column : id_range },
+                            self._create_item) as results:
+            return sorted(results,
+                          key = lambda x: self._get_column_value(\
+                              x, self._id_column))
+
     def update(self, item):
         item_id = self._get_column_value(item, self._id_column)
         if not item_id:
@@ -90,6 +147,44 @@ class Table:
     def _normalize_criteria(self, criteria):
         return criteria
 
+    def _aggregate_column(self, name):
+        """Returns the SQL for a column aggregate() groups by or computes
+        a metric of."""
+        if name not in self._columns:
+            msg = 'Cannot aggregate %s by "%s" -- it is not a column'
+            raise ValueError(msg % (self._type_name, name))
+        return name
+
+    def _group_value(self, name, value):
+        """Converts the value of the column name that aggregate() grouped
+        by to what it returns."""
+        return value
+
+    def _parse_metric(self, metric):
+        """Returns the function and the SQL of the column of a metric
+        aggregate() computes, with "*" for the column of count(*)."""
+        if metric.strip().lower() == 'count':
+            return ('count', '*')
+        match = self._METRIC_RE.match(metric)
+        if not match or (match.group(1).lower() not in self._METRIC_FUNCTIONS):
+            msg = 'Invalid %s metric "%s" -- must be "count" or one of ' + \
+                  '%s applied to a column'
+            raise ValueError(msg % (self._type_name, metric,
+                                    ', '.join(self._METRIC_FUNCTIONS)))
+        (function, column) = match.groups()
+        function = function.lower()
+        if column == '*':
+            if function != 'count':
+                msg = 'Invalid %s metric "%s" -- only count() takes "*"'
+                raise ValueError(msg % (self._type_name, metric))
+            return ('count', '*')
+        return (function, self._aggregate_column(column))
+
+    def _execute_aggregate(self, group_columns, metrics, criteria):
+        metric_sql = [ '%s(%s)' % (f, c) for (f, c) in metrics ]
+        return execute_aggregate(self._db, self._table_name, group_columns,
+                                 metric_sql, criteria)
+
     def _get_column_values(self, item):
         return dict((c, self._get_column_value(item, c)) \
                           for c in self._columns[1:])
@@ -134,6 +229,56 @@ class EnumTable:
         item_id = self._get_column_value(item, self._id_column)
         return self._count_references_to(item_id)
 
+    def reference_counts(self):
+        """Returns a dict from the id of every item to the number of
+        references to it."""
+        counts = dict((self._get_column_value(x, self._id_column), 0) \
+                          for x in self._all)
+        for (item_id, num_references) in self._count_all_references():
+            if item_id in counts:
+                counts[item_id] = num_references
+        return counts
+
+    def delete_unreferenced(self, keep = None):
+        """Deletes every item nothing refers to and returns them.  The
+        references are counted and the items deleted in one transaction, so
+        either all of them are deleted or none are.  Items the table
+        protects (see _is_protected()) and items for which keep(item) is
+        true are never deleted.  Like next_item_ids(), it commits any
+        pending changes before starting its transaction; like delete(), it
+        leaves committing the deletes to the caller."""
+        def id_for(x):
+            return self._get_column_value(x, self._id_column)
+
+        cursor = self._db.cursor()
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+        finally:
+            cursor.close()
+        try:
+            counts = self.reference_counts()
+            unreferenced = [ x for x in self._all \
+                                 if not counts[id_for(x)] and \
+                                     not self._is_protected(x) and \
+                                     not (keep and keep(x)) ]
+            ids = sorted(set(id_for(x) for x in unreferenced))
+            for start in xrange(0, len(ids), DELETE_CHUNK_SIZE):
+                chunk = ids[start:start + DELETE_CHUNK_SIZE]
+                execute_delete(self._db, self._table_name,
+                               { self._id_column : chunk })
+        except:
+            self._db.rollback()
+            raise
+        if not unreferenced:
+            return [ ]
+
+        ids = set(ids)
+        self._all = [ x for x in self._all if id_for(x) not in ids ]
+        for item in unreferenced:
+            del self._by_id[id_for(item)]
+            del self._by_name[self._get_column_value(item, self._name_column)]
+        return unreferenced
+
     def add(self, item):
         item_id = self._get_column_value(item, self._id_column)
         item_name = self._get_column_value(item, self._name_column)
@@ -163,6 +308,51 @@ class EnumTable:
 
         return new_item
 
+    def add_all(self, items):
+        """Adds several items at once, reserving their ids with one
+        id_sequence update and inserting them with one statement.  Like
+        add(), the ids are reserved in a transaction of their own, which is
+        committed; the inserts are left for the caller to commit.  Returns
+        the new items."""
+        names = set()
+        for item in items:
+            item_id = self._get_column_value(item, self._id_column)
+            item_name = self._get_column_value(item, self._name_column)
+            if item_id:
+                msg = '%s with id %s already exists' % (self._type_name,
+                                                        item_id)
+                raise ValueError(msg)
+            if (item_name in self._by_name) or (item_name in names):
+                msg = '%s with name "%s" already exists' % (self._type_name,
+                                                            item_name)
+                raise ValueError(msg)
+            names.add(item_name)
+        if not items:
+            return [ ]
+
+        first_id = next_item_ids(self._db, self._table_name, len(items))
+        columns = self._columns[1:]
+        values = [ [ first_id + n ] + \
+                   [ self._get_column_value(item, c) for c in columns ] \
+                       for (n, item) in enumerate(items) ]
+        execute_insert_many(self._db, self._table_name,
+                            (self._id_column, ) + tuple(columns), values)
+
+        id_range = InRange(first_id, first_id + len(items))
+        with execute_select(self._db, self._table_name, self._columns,
+                            { self._id_column : id_range },
+                            self._create_item) as results:
+            new_items = sorted(results,
+                               key = lambda x: self._get_column_value(\
+                                   x, self._id_column))
+        for new_item in new_items:
+            self._all.append(new_item)
+            self._by_id[self._get_column_value(new_item, self._id_column)] = \
+                new_item
+            self._by_name[self._get_column_value(new_item,
+                                                 self._name_column)] = new_item
+        return new_items
+
     def update(self, item):
         item_id = self._get_column_value(item, self._id_column)
         item_name = self._get_column_value(item, self._name_column)
@@ -231,5 +421,18 @@ class EnumTable:
         del self._by_id[item_id]
         del self._by_name[item_name]
 
+    def _is_protected(self, item):
+        """Returns True if delete_unreferenced() must never delete item,
+        even if nothing refers to it.  No item is protected by default."""
+        return False
+
     def _count_references_to(self, item_id):
         raise RuntimeError('_EnumTable._count_references_to not implemented')
+
+    def _count_all_references(self):
+        """Returns (item id, number of references) pairs.  Items that are
+        left out have none.  Subclasses that can count the references to
+        all their items at once should override this, since by default it
+        counts them one item at a time."""
+        return [ (item_id, self._count_references_to(item_id)) \
+                     for item_id in self._by_id ]
@@ -0,0 +1,308 @@
+"""Tracing of the SQL statements a Database runs.
+
+A SqlTracer wraps the Database's connection and times every statement run
+through it, grouping the statements by shape: the statement with its
+literals replaced by "?" and its whitespace collapsed, so the statements
+made from the same template are counted together however their values were
+bound.  For each shape it keeps the number of executions, the time spent
+executing them and fetching their results, and the number of rows returned
+(or changed, for INSERT, UPDATE and DELETE).  Statements slower than the
+tracer's threshold are logged with their query plan.
+
+Tracing is started by passing a tracer to Database or, for any program that
+uses the libraries, by setting STUPENDOUS_COW_TRACE_SQL to the slow
+statement threshold in milliseconds, optionally followed by ":" and the
+file to write the table of shapes to when the program exits (the default is
+standard error)."""
+
+import atexit
+import logging
+import os
+import re
+import sys
+import time
+
+TRACE_ENVIRONMENT_VARIABLE = 'STUPENDOUS_COW_TRACE_SQL'
+DEFAULT_SLOW_THRESHOLD = 0.1
+
+_STRING_LITERAL_REX = re.compile("'(?:[^']|'')*'")
+_NUMBER_LITERAL_REX = \
+    re.compile('(?<![\\w.])\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?\\b')
+_IN_LIST_REX = re.compile('\\bIN\\s*\\(\\s*\\?(?:\\s*,\\s*\\?)*\\s*\\)',
+                          re.IGNORECASE)
+_WHITESPACE_REX = re.compile('\\s+')
+_EXPLAINABLE_REX = \
+    re.compile('^\\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\\b',
+               re.IGNORECASE)
+
+def normalize_statement(sql):
+    """Returns the shape of the statement sql."""
+    shape = _STRING_LITERAL_REX.sub('?', sql)
+    shape = _NUMBER_LITERAL_REX.sub('?', shape)
+    shape = _IN_LIST_REX.sub('IN (...)', shape)
+    return _WHITESPACE_REX.sub(' ', shape).strip().rstrip(';')
+
+class StatementStats:
+    """Executions of the statements of one shape."""
+    __slots__ = ('count', 'total', 'max', 'rows')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, seconds, num_rows):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += num_rows
+
+class SqlTracer:
+    """Statistics of the statements run through the connections it traces,
+    by shape.  Statements that take longer than slow_threshold seconds are
+    logged with their EXPLAIN QUERY PLAN; None turns that off."""
+    _SORT_KEYS = { 'total' : lambda s: s.total, 'mean' : lambda s: s.mean,
+                   'max' : lambda s: s.max, 'count' : lambda s: s.count,
+                   'rows' : lambda s: s.rows }
+
+    def __init__(self, slow_threshold = DEFAULT_SLOW_THRESHOLD):
+        self.slow_threshold = slow_threshold
+        self.shapes = { }
+        self._shape_cache = { }
+
+    def trace(self, connection):
+        """Returns a connection that runs its statements on connection and
+        records them in this tracer."""
+        return TracedConnection(connection, self)
+
+    def record(self, connection, sql, variables, seconds, num_rows):
+        """Records one execution of sql.  connection is the (untraced)
+        connection it ran on, used to explain it if it was slow."""
+        shape = self._shape_cache.get(sql)
+        if shape is None:
+            if len(self._shape_cache) > 10000:
+                self._shape_cache.clear()
+            shape = normalize_statement(sql)
+            self._shape_cache[sql] = shape
+        try:
+            stats = self.shapes[shape]
+        except KeyError:
+            stats = StatementStats()
+            self.shapes[shape] = stats
+        stats.add(seconds, num_rows)
+
+        if (self.slow_threshold is not None) and \
+               (seconds > self.slow_threshold):
+            logging.warn('Slow SQL statement (%.1f ms, %d rows): %s\n%s' % \
+                             (1000.0 * seconds, num_rows, shape,
+                              explain(connection, sql, variables)))
+
+    def clear(self):
+        self.shapes = { }
+
+    def format(self, sort_by = 'total', limit = None):
+        """Returns a table of the statistics of each shape, sorted by
+        sort_by ("total", "mean", "max", "count" or "rows"), largest
+        first."""
+        try:
+            key = self._SORT_KEYS[sort_by]
+        except KeyError:
+            raise ValueError('Cannot sort SQL statistics by "%s" (must be ' \
+                             'one of %s)' % \
+                                 (sort_by, ', '.join(sorted(self._SORT_KEYS))))
+        ordered = sorted(self.shapes.iteritems(), key = lambda x: key(x[1]),
+                         reverse = True)
+        if limit is not None:
+            ordered = ordered[:limit]
+        lines = [ '%8s %10s %10s %10s %10s  %s' % \
+                      ('Count', 'Total s', 'Mean ms', 'Max ms', 'Rows',
+                       'Statement') ]
+        for (shape, stats) in ordered:
+            lines.append('%8d %10.3f %10.3f %10.3f %10d  %s' % \
+                             (stats.count, stats.total, 1000.0 * stats.mean,
+                              1000.0 * stats.max, stats.rows, shape))
+        return '\n'.join(lines)
+
+    def dump(self, filename = None, sort_by = 'total'):
+        """Writes the table format() returns to filename, or to standard
+        error if filename is None."""
+        if filename:
+            with open(filename, 'w') as output:
+                output.write(self.format(sort_by) + '\n')
+        else:
+            sys.stderr.write(self.format(sort_by) + '\n')
+
+    def dump_at_exit(self, filename = None, sort_by = 'total'):
+        atexit.register(self.dump, filename, sort_by)
+
+def query_plan(connection, sql, variables):
+    """Returns the steps of the EXPLAIN QUERY PLAN of sql, each indented by
+    two spaces per level below the top, or None if sql has no plan (or its
+    variables are not known, for executemany())."""
+    if (variables is None) or not _EXPLAINABLE_REX.match(sql):
+        return None
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, variables)
+        depths = { 0 : -1 }
+        steps = [ ]
+        for (step_id, parent_id, _, detail) in cursor:
+            depth = depths.get(parent_id, -1) + 1
+            depths[step_id] = depth
+            steps.append('  ' * depth + detail)
+        return steps
+    finally:
+        cursor.close()
+
+def explain(connection, sql, variables):
+    """Returns the EXPLAIN QUERY PLAN of sql as text, one step per line."""
+    try:
+        steps = query_plan(connection, sql, variables)
+    except Exception as e:
+        return '  (cannot explain: %s)' % e
+    if steps is None:
+        return '  (no query plan)'
+    return '\n'.join('  ' + step for step in steps)
+
+class TracedConnection(object):
+    """A connection that records the statements run through it in a
+    SqlTracer.  Everything but cursor(), execute() and commit() is passed to
+    the connection it wraps."""
+    def __init__(self, connection, tracer):
+        self.connection = connection
+        self.tracer = tracer
+
+    def cursor(self):
+        return TracedCursor(self.connection.cursor(), self)
+
+    def execute(self, sql, variables = ()):
+        return self.cursor().execute(sql, variables)
+
+    def commit(self):
+        start = time.time()
+        try:
+            self.connection.commit()
+        finally:
+            self.tracer.record(self.connection, 'COMMIT', None,
+                               time.time() - start, 0)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+class TracedCursor(object):
+    """A cursor that times its statements.  A statement's time includes
+    fetching its rows, so it is recorded when the statement is done: when
+    its rows run out, the cursor runs another statement or it is closed."""
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._statement = None      # (sql, variables) of the current one
+        self._seconds = 0.0
+        self._num_rows = 0
+
+    def execute(self, sql, variables = ()):
+        return self._run(self._cursor.execute, sql, variables, variables)
+
+    def executemany(self, sql, variables):
+        return self._run(self._cursor.executemany, sql, variables, None)
+
+    def fetchone(self):
+        start = time.time()
+        row = self._cursor.fetchone()
+        self._seconds += time.time() - start
+        if row is None:
+            self._finish()
+        else:
+            self._num_rows += 1
+        return row
+
+    def fetchmany(self, size = None):
+        start = time.time()
+        if size is None:
+            rows = self._cursor.fetchmany()
+        else:
+            rows = self._cursor.fetchmany(size)
+        self._seconds += time.time() - start
+        self._num_rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.time()
+        rows = self._cursor.fetchall()
+        self._seconds += time.time() - start
+        self._num_rows += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration()
+        return row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _run(self, execute, sql, variables, explain_variables):
+        self._finish()
+        start = time.time()
+        try:
+            execute(sql, variables)
+        except:
+            self._start(sql, explain_variables, time.time() - start)
+            self._finish()      # A failed statement is done already
+            raise
+        self._start(sql, explain_variables, time.time() - start)
+        return self
+
+    def _start(self, sql, variables, seconds):
+        self._statement = (sql, variables)
+        self._seconds = seconds
+        self._num_rows = 0
+
+    def _finish(self):
+        if self._statement is None:
+            return
+        (sql, variables) = self._statement
+        self._statement = None
+        num_rows = self._num_rows + max(self._cursor.rowcount, 0)
+        self._connection.tracer.record(self._connection.connection, sql,
+                                       variables, self._seconds,
+                                       num_rows)
+
+_environment_tracer = None
+
+def tracer_from_environment():
+    """Returns the tracer STUPENDOUS_COW_TRACE_SQL asks for, which all
+    databases opened in this process share, or None."""
+    global _environment_tracer
+    if _environment_tracer is not None:
+        return _environment_tracer
+    setting = os.environ.get(TRACE_ENVIRONMENT_VARIABLE, '').strip()
+    if not setting:
+        return None
+    (threshold, _, filename) = setting.partition(':')
+    try:
+        slow_threshold = float(threshold) / 1000.0 if threshold else \
+                             DEFAULT_SLOW_THRESHOLD
+    except ValueError:
+        logging.error('Ignoring %s: "%s" is not a number of milliseconds' % \
+                          (TRACE_ENVIRONMENT_VARIABLE, threshold))
+        return None
+    _environment_tracer = SqlTracer(slow_threshold)
+    _environment_tracer.dump_at_exit(filename or None)
+    return _environment_tracer
@@ -1,31 +1,45 @@
 """Classes and functions for working with abstract files or obtaining
 abstracts from sources other than the PDF file."""
 
-import codecs
+from stupendous_cow.importer.matching import TitleMatcher
+from stupendous_cow.util import normalize_title
+import hashlib
 import logging
+import mmap
+import multiprocessing
+import os
+import os.path
 import re
 
 class Abstract:
-    def __init__(self, start, title, authors, body):
+    def __init__(self, start, title, authors, body, span = None):
         self.start = start  # int; Line containing abstract's title
         self.title = title
         self.authors = authors
         self.body = body
+        self.span = span    # (byte offset, byte length) of body in the file
 
-class NipsAbstractFileReader:
-    configuration_name = 'nips'
-    _title_rex = re.compile('^#\\d+\\s+(?:\[[^\\]]*\\])?\\s*')
+_NIPS_TITLE_REX = re.compile('^#\\d+\\s+(?:\[[^\\]]*\\])?\\s*')
+
+class NipsAbstractLineReader:
+    """Reads a NIPS abstracts file one line at a time.  Slower than
+    NipsAbstractFileReader, but does not need to memory-map the file."""
+    _title_rex = _NIPS_TITLE_REX
 
     def __init__(self, filename):
         self.filename = filename
         self.line = 0
+        self.offset = 0       # Byte offset of the next line
+        self.line_offset = 0  # Byte offset of the last line read
 
     def __iter__(self):
-        with codecs.open(self.filename, 'r', 'utf-8') as input:
+        self.line = 0
+        self.offset = 0
+        with open(self.filename, 'rb') as input:
             (title, start) = self._find_first_title(input)
             while title:
-                (next_title, next_start, body) = self._read_body(input)
-                yield Abstract(start, title, (), body)
+                (next_title, next_start, body, span) = self._read_body(input)
+                yield Abstract(start, title, (), body, span)
                 title = next_title
                 start = next_start
 
@@ -33,8 +47,8 @@ class NipsAbstractFileReader:
         text = self._next_line(input)
 
         # Skip blank lines at top
-        while not text.strip():
-            text = self._next_line()
+        while text and not text.strip():
+            text = self._next_line(input)
 
         if not text:
             return (None, self.line)  # File is empty
@@ -44,14 +58,21 @@ class NipsAbstractFileReader:
     def _read_body(self, input):
         text = self._next_line(input)
         body = [ ]
+        body_offset = self.line_offset
         while text and text[0].isspace():
             body.append(text)
             text = self._next_line(input)
+            if len(body) == 1:
+                body_offset = self.line_offset
 
-        body = ''.join(body[1:]).strip()
+        raw_body = ''.join(body[1:])
+        body = raw_body.strip()
+        leading = raw_body[:len(raw_body) - len(raw_body.lstrip())]
+        span = (body_offset + len(leading.encode('utf-8')),
+                len(body.encode('utf-8')))
         if not text:
-            return (None, None, body)
-        return (self._extract_title(text), self.line, body)
+            return (None, None, body, span)
+        return (self._extract_title(text), self.line, body, span)
 
     def _extract_title(self, text):
         m = self._title_rex.match(text)
@@ -64,15 +85,313 @@ class NipsAbstractFileReader:
         return title
 
     def _next_line(self, input):
+        self.line_offset = self.offset
         text = input.readline()
         if text:
             self.line += 1
-        return text
+            self.offset += len(text)
+        try:
+            return text.decode('utf-8')
+        except UnicodeDecodeError:
+            self._error('Line is not valid UTF-8')
 
     def _error(self, details):
         raise IOError('Error on line %d of %s: %s' % (self.line, self.filename,
                                                       details))
 
+class NipsAbstractFileReader:
+    """Reads a NIPS abstracts file: a sequence of abstracts, each of which is
+    a "#<number> [<type>] <title>" line followed by indented lines holding
+    the authors and then the body.
+
+    The file is memory-mapped and the lines that start abstracts are found
+    with a single regular expression search, so only titles and bodies are
+    decoded.  With num_processes > 1, the file is split into that many
+    chunks at abstract boundaries and the chunks are parsed in parallel.
+    Produces the same Abstracts as NipsAbstractLineReader."""
+    configuration_name = 'nips'
+
+    # The newline before a line that starts with anything but whitespace.
+    # Searching for a literal first character is much faster than for "^".
+    _head_rex = re.compile('\\n(?=\\S)')
+
+    def __init__(self, filename, num_processes = 1):
+        self.filename = filename
+        self.num_processes = num_processes
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as input:
+            if not os.fstat(input.fileno()).st_size:
+                return
+            data = mmap.mmap(input.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            chunks = self._split(data)
+        finally:
+            data.close()
+
+        if len(chunks) == 1:
+            parsed = [ _parse_nips_chunk(self.filename, *chunks[0]) ]
+        else:
+            pool = multiprocessing.Pool(len(chunks))
+            try:
+                parsed = pool.map(_parse_nips_chunk_args,
+                                  [ (self.filename, ) + c for c in chunks ])
+            finally:
+                pool.close()
+                pool.join()
+
+        for abstracts in parsed:
+            for (line, title, body, span) in abstracts:
+                yield Abstract(line, title, (), body, span)
+
+    def _split(self, data):
+        """Returns (start, end, first line number) for each chunk of the
+        file.  Chunks after the first start at a line beginning with "#",
+        which can only be an abstract's title."""
+        size = len(data)
+        starts = [ 0 ]
+        for n in xrange(1, max(1, self.num_processes)):
+            i = data.find('\n#', max(starts[-1],
+                                      n * size // self.num_processes))
+            if i < 0:
+                break
+            if i + 1 > starts[-1]:
+                starts.append(i + 1)
+
+        chunks = [ ]
+        line = 1
+        for (start, end) in zip(starts, starts[1:] + [ size ]):
+            chunks.append((start, end, line))
+            if end < size:
+                line += data[start:end].count('\n')
+        return chunks
+
+def _parse_nips_chunk_args(args):
+    return _parse_nips_chunk(*args)
+
+def _parse_nips_chunk(filename, start, end, first_line):
+    """Parses bytes [start, end) of a NIPS abstracts file, which begin on
+    line first_line.  Returns a (line, title, body, span) tuple for each
+    abstract."""
+    def error(line, details):
+        raise IOError('Error on line %d of %s: %s' % (line, filename, details))
+
+    with open(filename, 'rb') as input:
+        mapped = mmap.mmap(input.fileno(), 0, access = mmap.ACCESS_READ)
+    try:
+        data = mapped[start:end]
+    finally:
+        mapped.close()
+
+    size = len(data)
+    heads = [ m.start() + 1 \
+                  for m in NipsAbstractFileReader._head_rex.finditer(data) ]
+    if size and not data[0].isspace():
+        heads.insert(0, 0)
+    heads = [ h for h in heads if not _starts_with_space(data, h) ]
+
+    # Only blank lines may precede the first abstract
+    prefix_end = heads[0] if heads else size
+    if data[:prefix_end].strip():
+        for (n, text) in enumerate(data[:prefix_end].split('\n')):
+            if text.decode('utf-8').strip():
+                error(first_line + n, 'Abstract title is missing')
+
+    abstracts = [ ]
+    line = first_line
+    last_head = 0
+    for (head, next_head) in zip(heads, heads[1:] + [ size ]):
+        line += data.count('\n', last_head, head)
+        last_head = head
+        eol = data.find('\n', head, next_head)
+        title_end = next_head if eol < 0 else eol + 1
+        try:
+            text = data[head:title_end].decode('utf-8')
+        except UnicodeDecodeError:
+            error(line, 'Line is not valid UTF-8')
+        m = _NIPS_TITLE_REX.match(text)
+        title = text[m.end():].strip() if m else None
+        if not title:
+            error(line, 'Abstract title is missing')
+
+        # The first line after the title holds the authors
+        authors_end = data.find('\n', title_end, next_head)
+        body_start = next_head if authors_end < 0 else authors_end + 1
+        try:
+            (body, body_start, body_end) = \
+                _strip_body(data, body_start, next_head)
+        except UnicodeDecodeError:
+            error(line + 2, 'Abstract body is not valid UTF-8')
+        abstracts.append((line, title, body,
+                          (start + body_start, body_end - body_start)))
+    return abstracts
+
+def _strip_body(data, start, end):
+    """Returns the stripped, decoded text of data[start:end] and the byte
+    range it came from."""
+    raw = data[start:end]
+    stripped = raw.strip()
+    if stripped:
+        start += len(raw) - len(raw.lstrip())
+        end = start + len(stripped)
+        body = stripped.decode('utf-8')
+        if not (body[0].isspace() or body[-1].isspace()):
+            return (body, start, end)
+    elif not raw:
+        return (u'', start, start)
+
+    # Unicode whitespace other than ASCII at either end; strip the slow way
+    raw = raw.decode('utf-8')
+    body = raw.strip()
+    leading = raw[:len(raw) - len(raw.lstrip())]
+    start += len(leading.encode('utf-8'))
+    return (body, start, start + len(body.encode('utf-8')))
+
+def _starts_with_space(data, i):
+    # \S only excludes ASCII whitespace, but a line starting with any
+    # Unicode whitespace continues the abstract before it.
+    c = data[i]
+    if (c < '\x80') and not ('\x1c' <= c <= '\x1f'):
+        return False
+    return data[i:i + 4].decode('utf-8', 'ignore')[:1].isspace()
+
 ABSTRACT_READER_FACTORIES = {
     'nips' : NipsAbstractFileReader
 }
+
+class AbstractIndex:
+    """Maps the normalized titles of the abstracts in a file to their
+    bodies.  Only the position of each body in the file is held in memory;
+    the body itself is read from the file when it is looked up."""
+    def __init__(self, filename, spans):
+        self.filename = filename
+        self._spans = spans
+        self._matchers = { }
+
+    @staticmethod
+    def build(reader):
+        """Reads all the abstracts from reader (e.g. a NipsAbstractFileReader)
+        and returns their index.  When two abstracts have the same
+        normalized title, the last one wins."""
+        spans = dict((normalize_title(a.title), a.span) for a in reader)
+        return AbstractIndex(reader.filename, spans)
+
+    @staticmethod
+    def load(index_filename, abstracts_filename, header):
+        """Returns the index saved in index_filename, or None if it does not
+        exist or was not saved with the same header."""
+        try:
+            with open(index_filename, 'rb') as input:
+                if input.readline() != header + '\n':
+                    return None
+                spans = { }
+                for line in input:
+                    (offset, length, title) = line[:-1].split('\t', 2)
+                    spans[title.decode('utf-8')] = (int(offset), int(length))
+        except (IOError, ValueError):
+            return None
+        return AbstractIndex(abstracts_filename, spans)
+
+    def save(self, index_filename, header):
+        """Writes the index to index_filename, after header, as one
+        "offset<TAB>length<TAB>normalized title" line per abstract."""
+        tmp_filename = '%s.%d.tmp' % (index_filename, os.getpid())
+        with open(tmp_filename, 'wb') as output:
+            output.write(header + '\n')
+            for (title, (offset, length)) in sorted(self._spans.iteritems()):
+                output.write('%d\t%d\t%s\n' % (offset, length,
+                                                title.encode('utf-8')))
+        os.rename(tmp_filename, index_filename)
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, title):
+        return title in self._spans
+
+    def __getitem__(self, title):
+        (offset, length) = self._spans[title]
+        with open(self.filename, 'rb') as input:
+            input.seek(offset)
+            return input.read(length).decode('utf-8')
+
+    def get(self, title, default = None):
+        try:
+            return self[title]
+        except KeyError:
+            return default
+
+    def find_similar(self, title, threshold):
+        """Returns (normalized title, similarity) for the abstract whose title
+        is most similar to the normalized title, or None if no abstract's
+        title is at least threshold similar (see TitleMatcher).  The title
+        index is built the first time it is needed."""
+        try:
+            matcher = self._matchers[threshold]
+        except KeyError:
+            matcher = TitleMatcher(self._spans, threshold)
+            self._matchers[threshold] = matcher
+        return matcher.best_match(title)
+
+class AbstractCache:
+    """The AbstractIndexes of the abstracts files used in an import, keyed by
+    (reader name, path, size, modification time, inode) so all the document
+    groups that share a file share its index.  Indexes are also saved in
+    cache_dir so later runs do not have to parse the file again.  The default
+    cache_dir is stupendous_cow/abstracts under $XDG_CACHE_HOME (~/.cache if
+    that is not set)."""
+    _INDEX_VERSION = 1
+
+    def __init__(self, cache_dir = None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self._indexes = { }
+
+    def get(self, reader_name, filename):
+        try:
+            create_reader = ABSTRACT_READER_FACTORIES[reader_name]
+        except KeyError:
+            raise ValueError('Unknown abstracts file reader "%s"' % reader_name)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            raise IOError('Cannot read abstracts file %s' % filename)
+
+        # The modification time is kept to the fraction of a second and the
+        # inode is included, so a file rewritten or replaced within the
+        # same second, with the same size, is not mistaken for the old one
+        key = (reader_name, os.path.abspath(filename), st.st_size,
+               repr(st.st_mtime), st.st_ino)
+        try:
+            return self._indexes[key]
+        except KeyError:
+            pass
+
+        header = 'stupendous_cow abstracts index %d %s' % \
+                     (self._INDEX_VERSION, repr(key))
+        index_filename = os.path.join(self.cache_dir,
+                                      hashlib.sha1(header).hexdigest() + '.idx')
+        index = AbstractIndex.load(index_filename, filename, header)
+        if index:
+            logging.info('Loaded index of %s from %s' % (filename,
+                                                         index_filename))
+        else:
+            index = AbstractIndex.build(create_reader(filename))
+            logging.info('Loaded abstracts from %s using %s' % (filename,
+                                                                reader_name))
+            self._save(index, index_filename, header)
+        self._indexes[key] = index
+        return index
+
+    def _save(self, index, index_filename, header):
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            index.save(index_filename, header)
+        except (IOError, OSError) as e:
+            msg = 'Could not save the index of %s to %s: %s'
+            logging.warn(msg % (index.filename, index_filename, e))
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME', None) or \
+                 os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'stupendous_cow', 'abstracts')
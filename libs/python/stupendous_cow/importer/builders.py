@@ -1,4 +1,5 @@
 from stupendous_cow.data_model import Article
+import copy
 import logging
 
 class ArticleBuilder:
@@ -93,27 +94,51 @@ class PropertyExtractionError(Exception):
     def reason(self):
         return self.args[0]
 
+def to_bool(value):
+    if isinstance(value, int) or isinstance(value, long) or \
+       isinstance(value, float):
+        return bool(value)
+    elif isinstance(value, str) or isinstance(value, unicode):
+        value = value.strip().lower()
+        if value in ('y', 'yes', 'true', 't'):
+            return True
+        elif value in ('', 'n', 'no', 'false', 'f'):
+            return False
+        else:
+            msg = 'Cannot convert value "%s" to a boolean'
+            arg = (value[0:17] + '...') if len(value) > 20 else value
+            raise PropertyExtractionError(msg % arg)
+    else:
+        msg = 'Cannot convert value of type %s to a boolean'
+        raise PropertyExtractionError(msg % value.__class__.__name__)
+
+def to_int(value):
+    if isinstance(value, int) or isinstance(value, long):
+        return value
+    elif isinstance(value, str) or isinstance(value, unicode):
+        try:
+            return int(value)
+        except ValueError:
+            msg = 'Cannot convert "%s" to an integer'
+            arg = (value[0:17] + '...') if len(value) > 20 else value
+            raise PropertyExtractionError(msg % arg)
+    elif isinstance(value, float):
+        if int(value) == value:
+            return int(value)
+        else:
+            msg = 'Cannot convert floating-point number to integer - ' + \
+                  'it would lose precision'
+            raise PropertyExtractionError(msg)
+    else:
+        msg = 'Cannot convert value of type %s to an integer'
+        raise PropertyExtractionError(msg % value.__class__.__name__)
+
 class BooleanPropertyExtractor:
     def __init__(self, base_extractor):
         self._get_base_value = base_extractor
 
     def __call__(self, ss_rows, document):
-        value = self._get_base_value(ss_rows, document)
-        if isinstance(value, int) or isinstance(value, long) or \
-           isinstance(value, float):
-            return bool(value)
-        elif isinstance(value, str) or isinstance(value, unicode):
-            value = value.strip().lower()
-            if value in ('y', 'yes', 'true', 't'):
-                return True
-            elif value in ('', 'n', 'no', 'false', 'f'):
-                return False
-            else:
-                msg = 'Cannot convert value "%s" to a boolean'
-                arg = (value[0:17] + '...') if len(value) > 20 else value
-                raise PropertyExtractionError(msg % arg)
-        else:
-            raise PropertyExtractionError(msg % value.__class__.__name__)
+        return to_bool(self._get_base_value(ss_rows, document))
             
 class ConstantPropertyExtractor:
     def __init__(self, value):
@@ -139,37 +164,33 @@ class DatabasePropertyExtractor:
         self._create_item = item_factory
 
     def __call__(self, ss_rows, document):
-        name = self._get_value_name(ss_rows, document)
+        return self.lookup(self._get_value_name(ss_rows, document))
+
+    def lookup(self, name):
         value = self.table.with_name(name)
         if not value:
             value = self.table.add(self._create_item(name))
         return value
 
+    def name_for(self, ss_rows, document):
+        return self._get_value_name(ss_rows, document)
+
+    def add_missing(self, names):
+        """Adds the names that are not in the table yet in a single batch and
+        returns how many were added.  Once every name a sheet can produce has
+        been added, __call__ never has to write to the database.  See
+        EnumTable.add_all() for what is committed."""
+        missing = sorted(set(n for n in names if not self.table.with_name(n)))
+        if missing:
+            self.table.add_all([ self._create_item(n) for n in missing ])
+        return len(missing)
+
 class IntPropertyExtractor:
     def __init__(self, base_extractor):
         self._get_base_value = base_extractor
 
     def __call__(self, ss_rows, document):
-        value = self._get_base_value(ss_rows, document)
-        if isinstance(value, int) or isinstance(value, long):
-            return value
-        elif isinstance(value, str) or isinstance(value, unicode):
-            try:
-                return int(value)
-            except ValueError:
-                msg = 'Cannot convert "%s" to an integer'
-                arg = (value[0:17] + '...') if len(value) > 20 else value
-                raise PropertyExtractionError(msg % arg)
-        elif isinstance(value, float):
-            if int(value) == value:
-                return int(value)
-            else:
-                msg = 'Cannot convert floating-point number to integer - ' + \
-                      'it would lose precision'
-                raise PropertyExtractionError(msg)
-        else:
-            msg = 'Cannot convert value of type %s to an integer'
-            raise PropertyExtractionError(msg % value.__class__.__name__)
+        return to_int(self._get_base_value(ss_rows, document))
 
 class SpreadsheetPropertyExtractor:
     def __init__(self, ss_path, default_value):
@@ -231,3 +252,61 @@ class SpreadsheetPropertyBinder(PropertyBinder):
         PropertyBinder.__init__(self, article_property,
                                 SpreadsheetPropertyExtractor(ss_path,
                                                              default_value))
+
+class RowBindingPlan:
+    """Sets the properties of ArticleBuilders from spreadsheet rows and
+    extracted documents, using steps worked out once per document group.
+    Column accessors, converters and constant values are resolved when the
+    plan is built, so binding a row is a loop over precomputed
+    (sheet, column accessor, converter, setter) steps.
+
+    The prototype is an ArticleBuilder holding the default and constant
+    property values; each row gets its own copy of it."""
+    def __init__(self, prototype):
+        self._prototype = prototype
+        self._column_steps = [ ]
+        self._document_steps = [ ]
+
+    def add_constant(self, article_property, value, convert = None):
+        if convert:
+            value = self._convert(article_property, convert, value)
+        self._setter_for(article_property)(self._prototype, value)
+
+    def add_column(self, article_property, sheet_name, get_value,
+                   default_value, convert = None):
+        """Sets article_property from the value get_value returns for the
+        row from sheet_name (see Worksheet.accessor), or to default_value
+        when there is no such row."""
+        self._column_steps.append((sheet_name, get_value, default_value,
+                                   convert,
+                                   self._setter_for(article_property),
+                                   article_property))
+
+    def add_document_field(self, article_property, source_field):
+        self._document_steps.append((source_field,
+                                     self._setter_for(article_property)))
+
+    def bind(self, ss_rows, document):
+        builder = copy.copy(self._prototype)
+        try:
+            for (sheet_name, get_value, default_value, convert, set_value,
+                 article_property) in self._column_steps:
+                row = ss_rows.get(sheet_name, None)
+                value = default_value if row is None else get_value(row)
+                set_value(builder, convert(value) if convert else value)
+        except PropertyExtractionError as e:
+            msg = 'Failed to extract value for %s: %s'
+            raise PropertyExtractionError(msg % (article_property, e.reason))
+        for (source_field, set_value) in self._document_steps:
+            set_value(builder, getattr(document, source_field))
+        return builder
+
+    def _setter_for(self, article_property):
+        return getattr(ArticleBuilder, 'set_' + article_property)
+
+    def _convert(self, article_property, convert, value):
+        try:
+            return convert(value)
+        except PropertyExtractionError as e:
+            msg = 'Failed to extract value for %s: %s'
+            raise PropertyExtractionError(msg % (article_property, e.reason))
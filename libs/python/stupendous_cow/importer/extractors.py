@@ -1,6 +1,11 @@
 """Classes to extract article content from PDF files."""
 
+import logging
+import os
+import re
 import subprocess
+import tempfile
+import threading
 
 class PdfExtractionError(Exception):
     def __init__(self, details):
@@ -10,31 +15,297 @@ class PdfExtractionError(Exception):
     def details(self):
         return self.args[0]
 
+class PdfExtractionTimeout(PdfExtractionError):
+    """Extraction was stopped because it took too long."""
+    pass
+
 class ExtractedDocument:
-    def __init__(self, title, authors, abstract, body):
+    """The text extracted from a document.  A degraded document holds less
+    than the extractor that was asked for would have given, such as the
+    text of only the first pages when the whole document could not be
+    extracted."""
+    def __init__(self, title, authors, abstract, body, degraded = False):
         self.title = title
-        self.authors = ()
+        self.authors = authors
         self.abstract = abstract
         self.body = body
+        self.degraded = degraded
+
+# Limits on what one call to execute_pdftotext() may produce or take.  The
+# timeout is also the default deadline of supervised extractions.
+DEFAULT_MAX_CONTENT_SIZE = 32 * 1048576
+DEFAULT_EXTRACTION_TIMEOUT = 120
 
 class DefaultPdfExtractor:
+    """Extracts the whole text of a PDF file as the document's body.  See
+    execute_pdftotext() for max_content_size and timeout."""
     configuration_name = 'default'
 
+    def __init__(self, max_content_size = DEFAULT_MAX_CONTENT_SIZE,
+                 timeout = DEFAULT_EXTRACTION_TIMEOUT):
+        self.max_content_size = max_content_size
+        self.timeout = timeout
+
     def extract(self, filename):
-        content = execute_pdftotext(filename)
+        content = execute_pdftotext(filename,
+                                    max_size = self.max_content_size,
+                                    timeout = self.timeout)
         return ExtractedDocument(title = '', authors = (), abstract = '',
                                  body = content)
 
-def execute_pdftotext(filename):
-    args = [ 'pdftotext', '-nopgbrk', filename, '-' ]
-    pdftotext = subprocess.Popen(args, stdout = subprocess.PIPE,
-                                 stderr = subprocess.PIPE)
-    (output, errors) = pdftotext.communicate()
-    if pdftotext.returncode:
-        msg = 'Extraction from %s failed (code %d): %s'
-        raise PdfExtractionError(msg % (filename, pdftotext.returncode, errors))
+class FirstPagesPdfExtractor:
+    """Extracts only the first num_pages pages of a PDF file, which is much
+    cheaper than extracting all of it, and fills in the title, authors and
+    abstract from them with parse_front_matter().  The body is the text of
+    those pages only."""
+    configuration_name = 'first_pages_pdf'
+
+    def __init__(self, num_pages = 2, max_content_size = 1048576,
+                 timeout = 60):
+        self.num_pages = num_pages
+        self.max_content_size = max_content_size
+        self.timeout = timeout
+
+    def extract(self, filename):
+        content = execute_pdftotext(filename, first_page = 1,
+                                    last_page = self.num_pages,
+                                    max_size = self.max_content_size,
+                                    timeout = self.timeout)
+        (title, authors, abstract) = \
+            parse_front_matter(content.decode('utf-8', 'replace'))
+        return ExtractedDocument(title = title, authors = authors,
+                                 abstract = abstract, body = content)
+
+class WhitespaceNormalizer:
+    """Normalizes whitespace in text that arrives a chunk at a time: runs of
+    spaces and tabs become one space, spaces at the start and end of lines
+    are removed and runs of blank lines become one blank line.  Whitespace
+    at the end of a chunk is held back until the next chunk or finish(),
+    so the result does not depend on where the chunks split."""
+    _line_end_rex = re.compile('[ \t\r\v]*\n[ \t\r\v]*')
+    _spaces_rex = re.compile('[ \t\r\v]+')
+    _blank_lines_rex = re.compile('\n{3,}')
+
+    def __init__(self):
+        self._pending = ''
+        self._at_start = True
+
+    def feed(self, chunk):
+        """Returns the normalized text of chunk that is complete."""
+        text = self._pending + chunk
+        stripped = text.rstrip()
+        self._pending = text[len(stripped):]
+        return self._normalize(stripped)
+
+    def finish(self):
+        """Returns the normalized text held back from the last chunk."""
+        text = self._normalize(self._pending)
+        self._pending = ''
+        return text
+
+    def _normalize(self, text):
+        if self._at_start and text:
+            # The first line has no line end before it to strip it
+            text = text.lstrip(' \t\r\v')
+            self._at_start = False
+        text = self._line_end_rex.sub('\n', text)
+        text = self._spaces_rex.sub(' ', text)
+        return self._blank_lines_rex.sub('\n\n', text)
+
+_READ_SIZE = 65536
+_MAX_ERROR_SIZE = 4096
+
+def execute_pdftotext(filename, first_page = None, last_page = None,
+                      max_size = None, timeout = None):
+    """Runs pdftotext on filename and returns its output, with whitespace
+    normalized by a WhitespaceNormalizer.  The output is normalized as it
+    is read, so no more than max_size bytes of it are ever held in memory:
+    if there is more, the text is cut at max_size bytes and pdftotext is
+    stopped.  If pdftotext runs for more than timeout seconds, it is
+    killed and PdfExtractionTimeout is raised."""
+    args = [ 'pdftotext', '-nopgbrk' ]
+    if first_page:
+        args.extend(('-f', str(first_page)))
+    if last_page:
+        args.extend(('-l', str(last_page)))
+    args.extend((filename, '-'))
+
+    with tempfile.TemporaryFile() as errors:
+        pdftotext = subprocess.Popen(args, stdout = subprocess.PIPE,
+                                     stderr = errors)
+        timed_out = threading.Event()
+        def expire():
+            # pdftotext may have finished since the deadline passed
+            if pdftotext.poll() is None:
+                timed_out.set()
+                _kill(pdftotext)
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+
+        truncated = True
+        try:
+            (output, truncated) = _read_pdftotext_output(pdftotext.stdout,
+                                                         max_size)
+        finally:
+            # Stop the timer before waiting, so a pdftotext that finished in
+            # time is never reported as timed out, and expire() is not
+            # polling the process while wait() reaps it
+            if timer:
+                timer.cancel()
+                timer.join()
+            if truncated:
+                _kill(pdftotext)
+            pdftotext.stdout.close()
+            returncode = pdftotext.wait()
+
+        if timed_out.is_set():
+            msg = 'Extraction from %s timed out after %s seconds'
+            raise PdfExtractionTimeout(msg % (filename, timeout))
+        if truncated:
+            msg = 'Text extracted from %s was cut off at %d bytes'
+            logging.warn(msg % (filename, max_size))
+        elif returncode:
+            errors.seek(0)
+            msg = 'Extraction from %s failed (code %d): %s'
+            raise PdfExtractionError(msg % (filename, returncode,
+                                            errors.read(_MAX_ERROR_SIZE)))
     return output
 
-ABSTRACT_READER_FACTORIES = {
-    'default_pdf' : DefaultPdfExtractor
+def _read_pdftotext_output(stream, max_size):
+    # Returns (output, True if the output was cut off at max_size bytes)
+    normalizer = WhitespaceNormalizer()
+    output = [ ]
+    size = 0
+    fd = stream.fileno()
+    while True:
+        chunk = os.read(fd, _READ_SIZE)
+        text = normalizer.feed(chunk) if chunk else normalizer.finish()
+        truncated = (max_size is not None) and (size + len(text) > max_size)
+        if truncated:
+            text = _truncate_utf8(text, max_size - size)
+        size += len(text)
+        output.append(text)
+        if truncated or not chunk:
+            break
+    return (''.join(output), truncated)
+
+def _truncate_utf8(text, size):
+    # Cut text at size bytes without splitting a UTF-8 sequence
+    while (0 < size < len(text)) and ((ord(text[size]) & 0xC0) == 0x80):
+        size -= 1
+    return text[:size]
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        pass    # Already exited
+
+# Lines at the top of a paper that are neither its title nor its authors
+_FRONT_MATTER_NOISE_REX = re.compile(\
+    u'^(arxiv:|published as|proceedings of|appearing in|in proceedings|' + \
+    u'under review|preprint|accepted (at|to|for)|copyright|\xa9|' + \
+    u'\\d+(st|nd|rd|th) (annual )?conference|advances in neural|\\d+$)',
+    re.IGNORECASE)
+_ABSTRACT_HEADING_REX = re.compile(\
+    u'^abstract(?:$|[\\s.:\u2014\u2013-]+(.*)$)', re.IGNORECASE)
+_ABSTRACT_END_REX = re.compile(\
+    u'^(1\\.?\\s+\\w|I\\.\\s+\\w|introduction$|keywords|index terms|' + \
+    u'ccs concepts|categories and subject descriptors)', re.IGNORECASE)
+_AFFILIATION_REX = re.compile(\
+    u'@|\\b(universit|institut|department|dept\\b|school|college|' + \
+    u'laborator|labs?\\b|research|inc\\b|corp|ltd\\b|cent(er|re)|' + \
+    u'google|microsoft|facebook|deepmind|openai|ibm\\b|amazon)',
+    re.IGNORECASE)
+_AUTHOR_SEPARATOR_REX = re.compile(u',|;|&|\\band\\b|\\s{2,}')
+_FOOTNOTE_MARK_REX = re.compile(u'[\\d*\u2217\u2020\u2021\xa7\xb6]+')
+_NAME_PARTICLES = frozenset((u'van', u'von', u'de', u'der', u'den', u'la',
+                             u'le', u'di', u'da', u'du', u'del'))
+_MAX_TITLE_LINES = 3
+
+def parse_front_matter(text):
+    """Guesses the title, authors and abstract of a paper from the text of
+    its first pages, as written by pdftotext.  The title is the first block
+    of lines that is not a running header such as an arXiv stamp, the
+    authors are the names found between the title and the "Abstract"
+    heading, and the abstract runs from that heading to the introduction or
+    the first numbered section.  Returns (title, authors, abstract), with
+    empty values for whatever could not be found."""
+    lines = [ line.strip() \
+                  for line in text.replace(u'\f', u'\n').split(u'\n') ]
+    lines = [ line for line in lines \
+                  if not _FRONT_MATTER_NOISE_REX.match(line) ]
+
+    start = 0
+    while (start < len(lines)) and not lines[start]:
+        start += 1
+    end = start
+    while (end < len(lines)) and lines[end] and \
+              (end - start < _MAX_TITLE_LINES) and \
+              not _ABSTRACT_HEADING_REX.match(lines[end]):
+        end += 1
+    title = u' '.join(lines[start:end])
+
+    for heading in xrange(end, len(lines)):
+        m = _ABSTRACT_HEADING_REX.match(lines[heading])
+        if m:
+            break
+    else:
+        # Without an abstract, only the block right after the title can be
+        # told apart from the body
+        heading = end
+        while (heading < len(lines)) and not lines[heading]:
+            heading += 1
+        while (heading < len(lines)) and lines[heading]:
+            heading += 1
+        return (title, _parse_authors(lines[end:heading]), u'')
+
+    abstract = [ m.group(1) or u'' ]
+    for line in lines[heading + 1:]:
+        if _ABSTRACT_END_REX.match(line):
+            break
+        abstract.append(line)
+    return (title, _parse_authors(lines[end:heading]),
+            _join_paragraphs(abstract))
+
+def _parse_authors(lines):
+    authors = [ ]
+    for line in lines:
+        if _AFFILIATION_REX.search(line):
+            continue
+        for name in _AUTHOR_SEPARATOR_REX.split(line):
+            name = u' '.join(_FOOTNOTE_MARK_REX.sub(u' ', name).split())
+            if _is_name(name) and (name not in authors):
+                authors.append(name)
+    return tuple(authors)
+
+def _is_name(text):
+    words = text.split()
+    if not (2 <= len(words) <= 5):
+        return False
+    return all(w[0].isupper() or (w in _NAME_PARTICLES) for w in words) and \
+           words[-1][0].isupper() and not any(c.isdigit() for c in text)
+
+def _join_paragraphs(lines):
+    """Joins lines into paragraphs, undoing hyphenation at line ends.  Blank
+    lines separate paragraphs."""
+    paragraphs = [ ]
+    current = u''
+    for line in lines + [ u'' ]:
+        if not line:
+            if current:
+                paragraphs.append(current)
+            current = u''
+        elif not current:
+            current = line
+        elif current.endswith(u'-') and line[0].islower():
+            current = current[:-1] + line
+        else:
+            current = current + u' ' + line
+    return u'\n\n'.join(paragraphs)
+
+DOCUMENT_EXTRACTOR_FACTORIES = {
+    'default_pdf' : DefaultPdfExtractor,
+    'first_pages_pdf' : FirstPagesPdfExtractor
 }
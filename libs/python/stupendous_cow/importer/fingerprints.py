@@ -0,0 +1,54 @@
+"""Functions that compute the fingerprints the importers store with each
+article, so later imports can skip source rows that have not changed."""
+
+import hashlib
+import os
+
+def file_identity(path):
+    """Returns (path, size, modification time) for the file at path, or None
+    if there is no such file.  Cheaper than hashing the file's content, and
+    good enough to notice when a PDF or abstracts file has been replaced."""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_size, int(st.st_mtime))
+
+def group_digest(configuration, venue, year):
+    """Digest of everything in a document group's configuration that affects
+    the articles imported from it."""
+    h = hashlib.sha1()
+    _update(h, (venue.abbreviation, year))
+    for name in sorted(vars(configuration)):
+        _update(h, (name, getattr(configuration, name)))
+    if configuration.abstract_source == 'file':
+        _update(h, file_identity(configuration.abstracts_file_name))
+    return h.hexdigest()
+
+class RowFingerprinter:
+    """Computes the fingerprint of one row of a document group: the cells of
+    the row in each of the group's sheets, the identity of the article's PDF
+    file and the digest of the group's configuration."""
+    def __init__(self, group_digest, sheet_names):
+        self._group_digest = group_digest
+        self._sheet_names = tuple(sorted(sheet_names))
+
+    def __call__(self, ss_rows, pdf_path):
+        h = hashlib.sha1(self._group_digest)
+        for name in self._sheet_names:
+            row = ss_rows.get(name, None)
+            if row is None:
+                _update(h, (name, None))
+            else:
+                _update(h, (name, tuple(row[i] for i in xrange(len(row)))))
+        _update(h, file_identity(pdf_path))
+        return h.hexdigest()
+
+def _update(h, value):
+    text = repr(value)
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    h.update(text)
+    h.update('\0')
@@ -0,0 +1,368 @@
+"""Imports several workbooks, each with its own configuration file, into one
+database in parallel.
+
+Worker processes read the workbooks, extract the documents and build the
+articles.  Only the process that runs the BatchImporter writes to the
+database, so the workers never contend for SQLite's write lock.  The import
+runs in two phases:
+
+  1. Each worker collects the article type and category names of one
+     document group at a time.  The writer adds the missing names in one
+     batch per table and commits.
+  2. Each worker builds the articles of one document group at a time and
+     sends them to the writer in batches.  The writer saves them.
+
+The workers of the second phase open their database connections after the
+first phase has committed, so they see the new article types and categories
+and never have to add any."""
+
+from stupendous_cow.data_model import ArticleType, Category
+from stupendous_cow.importer.abstracts import AbstractCache
+from stupendous_cow.db.main import Database
+from stupendous_cow.importer.builders import DatabasePropertyExtractor
+from stupendous_cow.importer.extractors import DEFAULT_EXTRACTION_TIMEOUT
+from stupendous_cow.importer.generic_ss.configuration import \
+    ConfigurationFileParser
+from stupendous_cow.importer.generic_ss.director import Director, \
+    ImportCounts, save_article
+from stupendous_cow.importer.metrics import ImportMetrics
+from stupendous_cow.importer.spreadsheets import Workbook
+from stupendous_cow.importer.supervision import ExtractionStats, \
+    ExtractionSupervisor, Quarantine
+from stupendous_cow.profiling import discard_profiling
+import codecs
+import logging
+import multiprocessing
+import os.path
+import Queue
+import time
+import traceback
+import yaml
+
+class ManifestEntry:
+    def __init__(self, configuration_filename, workbook_filename):
+        self.configuration_filename = configuration_filename
+        self.workbook_filename = workbook_filename
+
+    def __repr__(self):
+        return 'ManifestEntry(%s, %s)' % (repr(self.configuration_filename),
+                                          repr(self.workbook_filename))
+
+def load_manifest(filename):
+    """Reads a manifest: a YAML list of mappings with a "Config" and a
+    "Workbook" entry each.  Relative paths are relative to the directory
+    the manifest is in."""
+    def error(details):
+        raise IOError('Error reading %s: %s' % (filename, details))
+
+    with codecs.open(filename, 'r', 'utf-8') as input:
+        entries = yaml.safe_load(input)
+    if not isinstance(entries, list):
+        error('The manifest must be a list of Config/Workbook pairs')
+
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    manifest = [ ]
+    for (n, entry) in enumerate(entries):
+        paths = [ ]
+        for name in ('Config', 'Workbook'):
+            try:
+                value = entry[name]
+            except (KeyError, TypeError):
+                error('Entry %d has no %s' % (n + 1, name))
+            paths.append(os.path.join(base_dir, value))
+        manifest.append(ManifestEntry(*paths))
+    return manifest
+
+class BatchReport:
+    """What a batch import did, in total and for each manifest entry."""
+    def __init__(self, entries):
+        self.entries = entries
+        self.counts = [ ImportCounts() for e in entries ]
+        self.worker_seconds = [ 0.0 for e in entries ]
+        self.num_groups_failed = 0
+        self.num_enum_values_created = 0
+        self.extraction_stats = ExtractionStats()
+        self.metrics = ImportMetrics()
+        self.elapsed = 0.0
+
+    @property
+    def total(self):
+        total = ImportCounts(num_enum_values_created = \
+                                 self.num_enum_values_created)
+        for counts in self.counts:
+            total.add(counts)
+        return total
+
+    def format(self):
+        lines = [ ]
+        fmt = '%-40s %8s %8s %8s %8s %8s %9s'
+        lines.append(fmt % ('Workbook', 'Rows', 'Imported', 'Unchanged',
+                            'Failed', 'Unmatched', 'Worker s'))
+        for (entry, counts, seconds) in zip(self.entries, self.counts,
+                                            self.worker_seconds):
+            lines.append(fmt % (os.path.basename(entry.workbook_filename)[-40:],
+                                _num_rows(counts), counts.num_imported,
+                                counts.num_unchanged, counts.num_failed,
+                                counts.num_unmatched, '%.1f' % seconds))
+        total = self.total
+        lines.append(fmt % ('Total', _num_rows(total), total.num_imported,
+                            total.num_unchanged, total.num_failed,
+                            total.num_unmatched,
+                            '%.1f' % sum(self.worker_seconds)))
+        lines.append('')
+        lines.append('Created %d article types and categories' % \
+                         self.num_enum_values_created)
+        if self.num_groups_failed:
+            lines.append('%d document groups could not be imported' % \
+                             self.num_groups_failed)
+        lines.append(self.extraction_stats.format())
+        lines.append(self.metrics.format())
+        elapsed = max(self.elapsed, 1e-6)
+        lines.append('Processed %d rows in %.1f seconds (%.1f rows/sec, ' \
+                     '%.1f articles written/sec)' % \
+                         (_num_rows(total), self.elapsed,
+                          _num_rows(total) / elapsed,
+                          total.num_imported / elapsed))
+        return '\n'.join(lines)
+
+def _num_rows(counts):
+    return counts.num_imported + counts.num_unchanged + counts.num_failed
+
+class BatchImporter:
+    """Imports the workbooks in a manifest into the database in
+    db_filename using num_workers worker processes (one per CPU by
+    default).  Articles are sent to the writer in batches of batch_size.
+    The workers extract documents with the given deadline and fallback
+    extractor and share the quarantine in quarantine_filename (see
+    ExtractionSupervisor)."""
+    def __init__(self, db_filename, entries, num_workers = None,
+                 incremental = True, batch_size = 50,
+                 deadline = DEFAULT_EXTRACTION_TIMEOUT, fallback = None,
+                 quarantine_filename = None):
+        self.db_filename = db_filename
+        self.entries = entries
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.deadline = deadline
+        self.fallback = fallback
+        self.quarantine_filename = quarantine_filename
+
+    def run(self):
+        start = time.time()
+        report = BatchReport(self.entries)
+        metrics = report.metrics
+        db = Database(self.db_filename)
+        try:
+            tasks = self._tasks(db)
+
+            type_names = set()
+            category_names = set()
+            failed_tasks = set()
+            for (kind, task, payload) in self._run_workers('names', tasks):
+                if kind == 'names':
+                    type_names.update(payload[0])
+                    category_names.update(payload[1])
+                elif kind == 'error':
+                    self._log_failure(task, payload)
+                    failed_tasks.add(task)
+            report.num_enum_values_created = \
+                self._add_enum_values(db.article_types, ArticleType,
+                                      type_names) + \
+                self._add_enum_values(db.categories, Category, category_names)
+            db.commit()
+
+            tasks = [ t for t in tasks if t not in failed_tasks ]
+            for (kind, task, payload) in self._run_workers('articles', tasks):
+                counts = report.counts[task[0]]
+                if kind == 'articles':
+                    for (article, fingerprint) in payload:
+                        with metrics.stage('db_save'):
+                            saved = save_article(db, article, fingerprint)
+                        if saved:
+                            counts.num_imported += 1
+                        else:
+                            counts.num_failed += 1
+                    with metrics.stage('commit'):
+                        db.commit()
+                elif kind == 'done':
+                    (worker_counts, seconds, stats, worker_metrics) = payload
+                    counts.add(worker_counts)
+                    report.worker_seconds[task[0]] += seconds
+                    report.extraction_stats.add(stats)
+                    metrics.add(worker_metrics)
+                elif kind == 'error':
+                    self._log_failure(task, payload)
+                    failed_tasks.add(task)
+            db.commit()
+        finally:
+            db.close()
+
+        report.num_groups_failed = len(failed_tasks)
+        report.elapsed = time.time() - start
+        return report
+
+    def _tasks(self, db):
+        """Returns a (manifest entry index, document group index) pair for
+        each document group of each workbook, after checking that every
+        configuration can be read and names a known venue."""
+        tasks = [ ]
+        parser = ConfigurationFileParser()
+        for (n, entry) in enumerate(self.entries):
+            configuration = parser.load(entry.configuration_filename)
+            Director(configuration, db, self.incremental)
+            num_groups = len(configuration.document_groups)
+            tasks.extend((n, g) for g in xrange(num_groups))
+        return tasks
+
+    def _add_enum_values(self, table, item_factory, names):
+        extractor = DatabasePropertyExtractor(table, None, item_factory)
+        return extractor.add_missing(names)
+
+    def _log_failure(self, task, details):
+        entry = self.entries[task[0]]
+        msg = 'Failed to import document group %d of %s: %s'
+        logging.error(msg % (task[1] + 1, entry.workbook_filename, details))
+
+    def _run_workers(self, phase, tasks):
+        """Runs the tasks of a phase in new worker processes and yields the
+        (kind, task, payload) messages they send, until all have exited."""
+        task_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        for task in tasks:
+            task_queue.put(task)
+        num_workers = max(1, min(self.num_workers, len(tasks)))
+        for i in xrange(num_workers):
+            task_queue.put(None)
+
+        worker_args = (phase, self.db_filename, self.entries,
+                       self.incremental, self.batch_size, self.deadline,
+                       self.fallback, self.quarantine_filename, task_queue,
+                       result_queue)
+        workers = [ multiprocessing.Process(target = _run_worker,
+                                            args = worker_args) \
+                        for i in xrange(num_workers) ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            num_running = num_workers
+            while num_running:
+                try:
+                    message = result_queue.get(True, 1.0)
+                except Queue.Empty:
+                    if not any(w.is_alive() for w in workers):
+                        raise RuntimeError('Worker processes for the ' + \
+                                           '%s phase exited unexpectedly' % \
+                                               phase)
+                    continue
+                if message[0] == 'exit':
+                    num_running -= 1
+                else:
+                    yield message
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+def _run_worker(phase, db_filename, entries, incremental, batch_size,
+                deadline, fallback, quarantine_filename, task_queue,
+                result_queue):
+    # Forked from the writer, so a profiler it runs would never be written
+    discard_profiling()
+    worker = _Worker(db_filename, entries, incremental, batch_size,
+                     deadline, fallback, quarantine_filename)
+    try:
+        for task in iter(task_queue.get, None):
+            start = time.time()
+            try:
+                if phase == 'names':
+                    result_queue.put(('names', task,
+                                      worker.collect_names(task)))
+                else:
+                    counts = ImportCounts()
+                    for batch in worker.prepare(task, counts):
+                        result_queue.put(('articles', task, batch))
+                    result_queue.put(('done', task,
+                                      (counts, time.time() - start,
+                                       worker.take_extraction_stats(),
+                                       worker.metrics.take())))
+            except Exception:
+                result_queue.put(('error', task, traceback.format_exc()))
+    finally:
+        worker.close()
+        result_queue.put(('exit', None, None))
+
+class _Worker:
+    def __init__(self, db_filename, entries, incremental, batch_size,
+                 deadline = DEFAULT_EXTRACTION_TIMEOUT, fallback = None,
+                 quarantine_filename = None):
+        # The writer has upgraded the schema before starting the workers
+        self.db = Database(db_filename, upgrade_schema = False)
+        self.entries = entries
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.abstract_cache = AbstractCache()
+        self.supervisor = \
+            ExtractionSupervisor(deadline, fallback = fallback,
+                                 quarantine = Quarantine(quarantine_filename))
+        self.metrics = ImportMetrics()
+        self._directors = { }
+
+    def collect_names(self, task):
+        (processor, workbook) = self._open(task, enum_names_only = True)
+        try:
+            return processor.collect_enum_names(workbook)
+        finally:
+            workbook.close()
+
+    def prepare(self, task, counts):
+        (processor, workbook) = self._open(task)
+        try:
+            batch = [ ]
+            for prepared in processor.prepare(workbook, counts):
+                batch.append(prepared)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = [ ]
+            if batch:
+                yield batch
+        finally:
+            workbook.close()
+
+    def take_extraction_stats(self):
+        """Returns the extraction statistics since the last call and saves
+        the quarantine."""
+        stats = self.supervisor.stats
+        self.supervisor.stats = ExtractionStats()
+        self.supervisor.quarantine.save()
+        return stats
+
+    def close(self):
+        self.db.close()
+
+    def _open(self, task, enum_names_only = False):
+        (entry_index, group_index) = task
+        entry = self.entries[entry_index]
+        try:
+            (configuration, director) = self._directors[entry_index]
+        except KeyError:
+            configuration = \
+                ConfigurationFileParser().load(entry.configuration_filename)
+            director = Director(configuration, self.db, self.incremental,
+                                self.abstract_cache, self.supervisor,
+                                self.metrics)
+            self._directors[entry_index] = (configuration, director)
+
+        group = configuration.document_groups[group_index]
+        processor = director.processor_for(group, self.db, enum_names_only)
+        workbook = Workbook(entry.workbook_filename)
+        try:
+            with self.metrics.stage('workbook_load'):
+                processor.open_sheets(workbook, enum_names_only)
+        except:
+            workbook.close()
+            raise
+        return (processor, workbook)
@@ -16,7 +16,8 @@ class DocumentGroupConfiguration:
                  priority_source, downloaded_as_source, article_type_source,
                  category_source, summary_title_source, summary_content_source,
                  is_read_source, abstracts_file_reader, abstracts_file_name,
-                 article_extractor):
+                 article_extractor, join_keys = (),
+                 abstract_match_threshold = None):
         self.config_name = config_name
         self.title_source = title_source
         self.abstract_source = abstract_source
@@ -31,6 +32,8 @@ class DocumentGroupConfiguration:
         self.abstracts_file_reader = abstracts_file_reader
         self.abstracts_file_name = abstracts_file_name
         self.article_extractor = article_extractor
+        self.join_keys = join_keys
+        self.abstract_match_threshold = abstract_match_threshold
 
 class ConfigurationFileParser:
     _abstracts_file_spec_rex = re.compile('^([A-Za-z0-9_]+)\\("([^"]+)"\\)$')
@@ -125,6 +128,9 @@ class ConfigurationFileParser:
         extractor = self._parse_optional_entry(parameters, 'Extractor',
                                                ss_path_allowed = False,
                                                parents = parents)
+        join_keys = self._parse_join_keys(parameters, parents)
+        abstract_match_threshold = \
+            self._parse_abstract_match_threshold(parameters, parents)
 
         if not summary_title:
             if summary_text:
@@ -149,7 +155,8 @@ class ConfigurationFileParser:
                                           category, summary_title,
                                           summary_text, is_read,
                                           abstracts_file_reader,
-                                          abstracts_file_name, extractor)
+                                          abstracts_file_name, extractor,
+                                          join_keys, abstract_match_threshold)
 
     def _parse_document_group_index(self, name):
         try:
@@ -232,6 +239,42 @@ class ConfigurationFileParser:
             self._error(msg % parents[-1])
         return (m.group(1), m.group(2))
 
+    def _parse_join_keys(self, parameters, parents):
+        value = self._parse_optional_entry(parameters, 'JoinOn',
+                                           constants_allowed = False,
+                                           list_allowed = True,
+                                           parents = parents)
+        if not value:
+            return ()
+        if not isinstance(value, list):
+            return (value, )
+
+        join_keys = tuple(self._parse_value('JoinOn', v,
+                                            constants_allowed = False,
+                                            parents = parents) \
+                              for v in value)
+        sheets = [ k.sheet for k in join_keys ]
+        if len(set(sheets)) < len(sheets):
+            msg = 'In %s, JoinOn has more than one column for the same sheet'
+            self._error(msg % parents[-1])
+        return join_keys
+
+    def _parse_abstract_match_threshold(self, parameters, parents):
+        name = 'AbstractMatchThreshold'
+        value = self._parse_optional_entry(parameters, name,
+                                           ss_path_allowed = False,
+                                           parents = parents)
+        if value is None:
+            return None
+        try:
+            value = float(value)
+        except ValueError:
+            value = None
+        if (value is None) or not (0.0 < value <= 1.0):
+            msg = 'Value for %s must be a number greater than 0 and at most 1'
+            self._error(msg % self._full_name(name, parents))
+        return value
+
     def _parse_value(self, name, value, ss_path_allowed = True,
                      constants_allowed = True, list_allowed = False,
                      parents = ()):
@@ -240,7 +283,8 @@ class ConfigurationFileParser:
                 msg = 'A list is not a legal value for %s'
                 self._error(msg % self._full_name(name, parents))
             return value
-        elif isinstance(value, int) or isinstance(value, long):
+        elif isinstance(value, int) or isinstance(value, long) or \
+                 isinstance(value, float):
             if not constants_allowed:
                 msg = 'A constant is not a legal value for %s'
                 self._error(msg % self._full_name(name, parents))
@@ -248,7 +292,7 @@ class ConfigurationFileParser:
         elif not (isinstance(value, str) or isinstance(value, unicode)):
             full_name = self._full_name(name, parents)
             msg = 'A %s is not a legal value for %s'
-            self._error(msg % (value.__class__.name__, full_name))
+            self._error(msg % (value.__class__.__name__, full_name))
         elif value.startswith('@'):
             if not ss_path_allowed:
                 msg = 'A spreadsheet path is not a legal value for %s'
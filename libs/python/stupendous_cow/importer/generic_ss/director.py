@@ -1,105 +1,157 @@
 from stupendous_cow.data_model import Article, ArticleType, Category, Venue
-from stupendous_cow.extractors import ExtractedDocument
 from stupendous_cow.util import normalize_title
-from stupendous_cow.builders import ArticleBuilder, BooleanPropertyBinder, \
-    ConstantPropertyBinder, ConstantPropertyExtractor, \
-    DatabasePropertyBinder, DocumentPropertyBinder, IntPropertyBinder, \
-    PropertyBinder, PropertyExtractionError, SpreadsheetPropertyBinder, \
-    SpreadsheetPropertyExtractor
-from stupendous_cow.importers.generic_ss.configuration import Configuration
-from stupendous_cow.importers.abstracts import ABSTRACT_READER_FACTORIES
-from stupendous_cow.importers.extractors import DOCUMENT_EXTRACTOR_FACTORIES
-from stupendous_cow.importers.spreadsheets import SpreadsheetPath
+from stupendous_cow.importer.builders import ArticleBuilder, \
+    ConstantPropertyExtractor, DatabasePropertyExtractor, \
+    PropertyExtractionError, RowBindingPlan, SpreadsheetPropertyExtractor, \
+    to_bool, to_int
+from stupendous_cow.importer.generic_ss.configuration import Configuration
+from stupendous_cow.importer.abstracts import AbstractCache
+from stupendous_cow.importer.extractors import DOCUMENT_EXTRACTOR_FACTORIES, \
+    ExtractedDocument, PdfExtractionError
+from stupendous_cow.importer.fingerprints import RowFingerprinter, \
+    group_digest
+from stupendous_cow.importer.joins import KeyJoin, PositionalJoin, \
+    join_key, title_join_key
+from stupendous_cow.importer.metrics import ImportMetrics
+from stupendous_cow.importer.spreadsheets import SpreadsheetPath
+from stupendous_cow.importer.supervision import ExtractionSupervisor
+from stupendous_cow.profiling import span
 import logging
 import os.path
 
+# How similar a title must be to the title of an abstract in an abstracts
+# file (see TitleMatcher) for the abstract to be used when no abstract has
+# exactly the same title.
+DEFAULT_ABSTRACT_MATCH_THRESHOLD = 0.8
+
+class ImportCounts:
+    def __init__(self, num_imported = 0, num_unchanged = 0, num_failed = 0,
+                 num_enum_values_created = 0, num_unmatched = 0):
+        self.num_imported = num_imported
+        self.num_unchanged = num_unchanged
+        self.num_failed = num_failed
+        self.num_enum_values_created = num_enum_values_created
+        self.num_unmatched = num_unmatched
+
+    def add(self, other):
+        self.num_imported += other.num_imported
+        self.num_unchanged += other.num_unchanged
+        self.num_failed += other.num_failed
+        self.num_enum_values_created += other.num_enum_values_created
+        self.num_unmatched += other.num_unmatched
+        return self
+
+    def __repr__(self):
+        return 'ImportCounts(%d, %d, %d, %d, %d)' % \
+                   (self.num_imported, self.num_unchanged, self.num_failed,
+                    self.num_enum_values_created, self.num_unmatched)
+
+def save_article(db, article, fingerprint = None):
+    """Adds article to db, or updates the article with the same normalized
+    title, venue and year, and records its fingerprint.  An article saved
+    without a fingerprint is one whose document was not fully extracted, so
+    it does not replace the content of the article it updates if that has
+    any, and the article's old fingerprint is removed.  Returns the article's id, or None if it could not be saved."""
+    nt = normalize_title(article.title)
+    logging.debug('Save article with normalized title [%s]', nt)
+    with db.articles.retrieve(normalized_title = nt, year = article.year,
+                              venue = article.venue) as rs:
+        retrieved = [ x for x in rs ]
+    if not retrieved:
+        logging.debug('Write new article to database')
+        article_id = db.articles.add(article).id
+    elif len(retrieved) == 1:
+        logging.debug('Update existing article')
+        content = retrieved[0].content
+        retrieved[0].update(article)
+        if content and not fingerprint:
+            retrieved[0].content = content
+        db.articles.update(retrieved[0])
+        article_id = retrieved[0].id
+    else:
+        msg = 'Retrieved %d articles for %s %s with normalized title ' + \
+              '[%s].  This should not have happened.  The article was ' + \
+              'not updated.  Please investigate.'
+        logging.error(msg % (len(retrieved), article.venue.abbreviation,
+                             article.year, nt))
+        return None
+
+    if fingerprint:
+        db.article_fingerprints.set(article_id, fingerprint)
+    else:
+        # A stale fingerprint could match the row again and skip it
+        db.article_fingerprints.delete(article_id)
+    return article_id
+
 class DocumentGroupProcessor:
     _empty_extracted_document = ExtractedDocument('', (), '', '')
     
-    def __init__(self, configuration, db, venue, year, abstracts):
-        def set_title_extractor():
-            ts = configuration.title_source
-            if isinstance(ts, SpreadsheetPath):
-                self.sheet_names.add(ts.sheet)
-                self._set_title = SpreadsheetPropertyBinder(ts, 'title', '')
-            elif ts == 'extracted':
-                self._set_title = DocumentPropertyBinder.TITLE
-            else:
-                raise ValueError('Invalid title source')
-                
-        def set_abstract_extractor():
-            ab_src = configuration.abstract_source
-            if not ab_src:
-                self._set_abstract = ConstantPropertyBinder('abstract', '')
-            elif isinstance(ab_src, SpreadsheetPath):
-                self.sheet_names.add(ab_src.sheet)
-                self._set_abstract = \
-                    SpreadsheetPropertyBinder(ab_src, 'abstract', '')
-            elif ab_src == 'file':
-                self._set_abstract = self._set_abstract_from_map
-            elif ab_src == 'extracted':
-                self._set_abstract = DocumentPropertyBinder.ABSTRACT
-            else:
-                raise ValueError('Invalid abstract source')
-
-        def ss_constant_or_optional_extractor(source, property_name,
-                                              default_value):
+    def __init__(self, configuration, db, venue, year, abstracts,
+                 incremental = True, supervisor = None, metrics = None):
+        def ss_constant_or_optional_extractor(source, default_value):
             if not source:
                 return ConstantPropertyExtractor(default_value)
             elif isinstance(source, SpreadsheetPath):
-                self.sheet_names.add(source.sheet)
+                self._enum_sheet_names.add(source.sheet)
                 return SpreadsheetPropertyExtractor(source, default_value)
             else:
                 return ConstantPropertyExtractor(source)
 
-        def ss_constant_or_optional_binder(source, property_name,
-                                           default_value):
-            extractor = ss_constant_or_optional_extractor(source, default_value)
-            return PropertyBinder(property_name, extractor)
+        def bind(article_property, source, default_value, convert = None):
+            if isinstance(source, SpreadsheetPath):
+                self.sheet_names.add(source.sheet)
+            self._bindings.append((article_property, source, default_value,
+                                   convert))
 
-        def set_priority_extractor():
-            base_extractor =
-                ss_constant_or_optional_extractor(\
-                    configuration.priority_source, 0)
-            return IntPropertyBinder('priority', base_extractor)
-        
-        def set_article_type_extractor():
+        def bind_title():
+            ts = configuration.title_source
+            if not (isinstance(ts, SpreadsheetPath) or (ts == 'extracted')):
+                raise ValueError('Invalid title source')
+            bind('title', ts, '')
+
+        def bind_abstract():
+            ab_src = configuration.abstract_source
+            if ab_src == 'file':
+                self._abstract_from_map = True
+            elif (not ab_src) or isinstance(ab_src, SpreadsheetPath) or \
+                 (ab_src == 'extracted'):
+                bind('abstract', ab_src, '')
+            else:
+                raise ValueError('Invalid abstract source')
+
+        def bind_article_type():
             base_extractor = \
                 ss_constant_or_optional_extractor(\
-                    configuration.article_type_source, None)
-            self._set_article_type = \
-                DatabasePropertyBinder('article_type', db.article_types,
-                                       base_extractor, ArticleType)
-            
-        def set_category_extractor():
+                    configuration.article_type_source, '')
+            self._article_type_extractor = \
+                DatabasePropertyExtractor(db.article_types, base_extractor,
+                                          ArticleType)
+            bind('article_type', configuration.article_type_source, '',
+                 self._article_type_extractor.lookup)
+
+        def bind_category():
             base_extractor = \
                 ss_constant_or_optional_extractor(\
-                    configuration.category_source, None)
-            self._set_category = \
-                DatabasePropertyBinder('category', db.categories,
-                                       base_extractor, Category)
+                    configuration.category_source, '')
+            self._category_extractor = \
+                DatabasePropertyExtractor(db.categories, base_extractor,
+                                          Category)
+            bind('category', configuration.category_source, '',
+                 self._category_extractor.lookup)
 
-        def set_summary_extractor():
+        def bind_summary():
             content_source = configuration.summary_content_source
-            if not content_source:
-                self._set_summary = ConstantPropertyBinder('summary', '')
-            elif isinstance(content_source, SpreadsheetPath):
-                self.sheet_names.add(content_source.sheet)
-                self._set_summary = \
-                    SpreadsheetPropertyBinder(content_source, 'summary', '')
-            else:
+            if content_source and \
+               not isinstance(content_source, SpreadsheetPath):
                 raise ValueError('Invalid summary content source')
-        
-        def set_is_read_extractor():
-            base_extractor = \
-                ss_constant_or_optional_extractor(configuration.is_read_source,
-                                                  False)
-            self._set_is_read = BooleanPropertyBinder('is_read', base_extractor)
+            bind('summary', content_source, '')
 
         def set_document_extractor():
             doc_ext = configuration.article_extractor
             if not doc_ext:
                 self.document_extractor = None
+            elif supervisor:
+                self.document_extractor = supervisor.extractor_for(doc_ext)
             else:
                 try:
                     fac = DOCUMENT_EXTRACTOR_FACTORIES[doc_ext]
@@ -109,93 +161,243 @@ class DocumentGroupProcessor:
 
                 self.document_extractor = fac()
 
+        def set_join():
+            join_keys = configuration.join_keys
+            if not join_keys:
+                self._join = PositionalJoin()
+                return
+
+            keys_by_sheet = dict((k.sheet, k) for k in join_keys)
+            for name in sorted(self.sheet_names):
+                if name not in keys_by_sheet:
+                    msg = 'No JoinOn column for sheet "%s" in %s'
+                    raise ValueError(msg % (name, self.group_name))
+            primary_key = keys_by_sheet[self.downloaded_as_path.sheet]
+            # Joined on the title, rows match as the articles themselves do
+            if primary_key == configuration.title_source:
+                key_function = title_join_key
+            else:
+                key_function = join_key
+            self._join = KeyJoin(primary_key,
+                                 [ k for k in join_keys if k != primary_key ],
+                                 key_function)
+
         self.group_name = configuration.config_name
         self.content_dirs = configuration.content_dirs
+        if not isinstance(self.content_dirs, list):
+            self.content_dirs = [ self.content_dirs ]
         self.downloaded_as_path = configuration.downloaded_as_source
+        self.abstract_match_threshold = \
+            configuration.abstract_match_threshold or \
+            DEFAULT_ABSTRACT_MATCH_THRESHOLD
         self.sheet_names = set()
+        self._enum_sheet_names = set()
+        self._bindings = [ ]
+        self._abstract_from_map = False
 
         self.db = db
         self.venue = venue
         self.year = year
         self.abstracts = abstracts
+        self.metrics = metrics or ImportMetrics()
 
         set_document_extractor()
-        set_title_extractor()
-        set_abstract_extractor()
-        set_priority_extractor()
-        set_article_type_extractor()
-        set_category_extractor()
-        set_summary_extractor()
-        set_is_read_extractor()
-        self._get_downloaded_as = \
-            SpreadsheetPropertyExtractor(self.downloaded_as_path, None)
+        bind_title()
+        bind_abstract()
+        bind('priority', configuration.priority_source, 0, to_int)
+        bind_article_type()
+        bind_category()
+        bind_summary()
+        bind('is_read', configuration.is_read_source, False, to_bool)
+        self.sheet_names.add(self.downloaded_as_path.sheet)
+        set_join()
+
+        self._fingerprint = \
+            RowFingerprinter(group_digest(configuration, venue, year),
+                             self.sheet_names)
+        if incremental:
+            self._known_fingerprints = \
+                db.article_fingerprints.current(venue, year)
+        else:
+            self._known_fingerprints = set()
+
+    def open_sheets(self, workbook, enum_sheets_only = False):
+        """Opens the sheets of workbook the group reads, or only those
+        collect_enum_names() reads if enum_sheets_only.  For formats that
+        are not streamed, such as ODS, this is when the whole workbook is
+        loaded, so importers time it as the "workbook_load" stage.  Streamed
+        sheets are not opened until they are read."""
+        names = self._enum_sheet_names if enum_sheets_only \
+                    else self.sheet_names
+        for name in sorted(names):
+            workbook[name]
+
+    def compile(self, workbook):
+        """Compiles the group's bindings against the columns of workbook.
+        Returns a RowBindingPlan and the (sheet name, column accessor) of
+        the DownloadedAs column."""
+        def accessor(ss_path):
+            return workbook[ss_path.sheet].accessor(ss_path.column)
+
+        prototype = ArticleBuilder(self.db)
+        prototype.set_year(self.year)
+        prototype.set_venue(self.venue)
+        plan = RowBindingPlan(prototype)
+        for (article_property, source, default_value, convert) \
+                in self._bindings:
+            if isinstance(source, SpreadsheetPath):
+                plan.add_column(article_property, source.sheet,
+                                accessor(source), default_value, convert)
+            elif source == 'extracted':
+                plan.add_document_field(article_property, article_property)
+            elif (source is None) or (source == ''):
+                plan.add_constant(article_property, default_value, convert)
+            else:
+                plan.add_constant(article_property, source, convert)
+
+        downloaded_as_column = (self.downloaded_as_path.sheet,
+                                accessor(self.downloaded_as_path))
+        return (plan, downloaded_as_column)
+
+    def resolve_enum_values(self, workbook):
+        """Adds the article types and categories the group's rows refer to
+        that are not in the database yet, one batch per table, so binding a
+        row only has to look them up.  Each batch's ids are reserved and
+        committed first (see EnumTable.add_all()); the rows themselves are
+        left for the caller to commit together.  Returns the number of
+        values added."""
+        return self.add_enum_values(self.collect_enum_names(workbook))
+
+    def collect_enum_names(self, workbook):
+        """Returns the sets of article type and category names the group's
+        rows refer to."""
+        extractors = (self._article_type_extractor, self._category_extractor)
+        names = tuple(set() for e in extractors)
+        for rows in self._join.rows(workbook, self._enum_sheet_names):
+            for (extractor, seen) in zip(extractors, names):
+                seen.add(extractor.name_for(rows, None))
+        if not self._enum_sheet_names:
+            for (extractor, seen) in zip(extractors, names):
+                seen.add(extractor.name_for({ }, None))
+        return names
+
+    def add_enum_values(self, names):
+        """Adds the article types and category names in names, as returned
+        by collect_enum_names, that are not in the database yet.  Returns
+        the number of values added."""
+        extractors = (self._article_type_extractor, self._category_extractor)
+        return sum(e.add_missing(n) for (e, n) in zip(extractors, names))
 
     def process(self, workbook, db):
-        row_iterators = dict((n, iter(workbook[n])) for n in self._sheet_names)
-        self._next_row(row_iterators)  # Skip headers
-
-        row_index = 2
-        num_articles = 0
-        num_failed = 0
-        while row_iterators:
-            rows = self._next_row(row_iterators)
-            logging.debug('Process row %s from sheets %s' % (row_index,
-                                                             ', '.join(rows)))
-            
-            downloaded_as = self._get_downloaded_as(rows, None)
+        counts = ImportCounts()
+        for (article, fingerprint) in self.prepare(workbook, counts):
+            self.save(db, article, fingerprint, counts)
+        return counts
+
+    def prepare(self, workbook, counts):
+        """Reads the group's rows from workbook, extracts their documents
+        and builds their articles, without writing to the database.  Yields
+        an (article, fingerprint) pair for each article to save, and adds
+        the unchanged, failed and unmatched rows to counts.  The fingerprint
+        is None if the row's document could not be extracted or only a
+        degraded copy of it could be, so the next run tries again."""
+        # Checked once, so rows are not formatted for messages nobody sees
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        metrics = self.metrics
+        (plan, (downloaded_as_sheet, get_downloaded_as)) = \
+            self.compile(workbook)
+        joined_rows = self._join.rows(workbook, self.sheet_names)
+        for (row_index, rows) in \
+                enumerate(metrics.timed('sheet_read', joined_rows), 2):
+            if debug:
+                logging.debug('Process row %s from sheets %s', row_index,
+                              ', '.join(rows))
+
+            downloaded_as_row = rows.get(downloaded_as_sheet, None)
+            if downloaded_as_row is None:
+                downloaded_as = None
+            else:
+                downloaded_as = get_downloaded_as(downloaded_as_row)
             if not downloaded_as:
-                logging.debug('Row %s has no downloaded_as property' % row_index)
-                document = self._empty_extracted_document
+                if debug:
+                    logging.debug('Row %s has no downloaded_as property',
+                                  row_index)
+                pdf_path = None
             else:
-                pdf_path = self._find_article_pdf(downloaded_as)
-                if pdf_path:
-                    document = self._fetch_document(pdf_path)
-                else:
+                with metrics.stage('pdf_lookup'):
+                    pdf_path = self._find_article_pdf(downloaded_as)
+                if not pdf_path:
                     msg = 'Could not find PDF file for article downloaded ' + \
                           'as %s.pdf'
                     logging.error(msg % downloaded_as)
-                    document = self._empty_extracted_document
 
-            logging.debug('Build article')
-            builder = ArticleBuilder(db)
-            builder.set_ss_info(self.downloaded_as_path.sheet, row_index)
-            builder.set_year(self.year)
-            builder.set_downloaded_as(downloaded_as)
-            builder.set_pdf_file(pdf_path)
-            builder.set_venue(self.venue)
+            fingerprint = self._fingerprint(rows, pdf_path)
+            if fingerprint in self._known_fingerprints:
+                if debug:
+                    logging.debug('Row %s is unchanged', row_index)
+                counts.num_unchanged += 1
+                continue
+
+            if pdf_path:
+                with metrics.stage('extraction'):
+                    document = self._fetch_document(pdf_path)
+                if document is None:
+                    # Not fingerprinted, so the next run extracts it again
+                    document = self._empty_extracted_document
+                    fingerprint = None
+                elif document.degraded:
+                    fingerprint = None
+            else:
+                document = self._empty_extracted_document
 
             try:
-                self._set_title(row_index, rows, document, builder)
-                self._set_abstract(row_index, rows, document, builder)
-                self._set_priority(row_index, rows, document, builder)
-                self._set_article_type(row_index, rows, document, builder)
-                self._set_category(row_index, rows, document, builder)
-                self._set_summary(row_index, rows, document, builder)
-                self._set_is_read(row_index, rows, document, builder)
-                article = builder.build()
+                with metrics.stage('binding'):
+                    builder = plan.bind(rows, document)
+                    builder.set_ss_info(downloaded_as_sheet, row_index)
+                    builder.set_downloaded_as(downloaded_as)
+                    builder.set_pdf_file(pdf_path)
+                    if self._abstract_from_map:
+                        self._set_abstract_from_map(rows, document, builder)
+                    article = builder.build()
             except PropertyExtractionError as e:
                 msg = 'Could not construct article for %s, row %d (%s)'
                 logging.error(msg % (self.downloaded_as_path.sheet,
                                      row_index, e.reason))
-                article = None
+                counts.num_failed += 1
+                continue
 
-            if article:
-                self._save_article(db, article)
-                num_articles += 1
-            else:
-                num_failed += 1
-            row_index += 1
+            yield (article, fingerprint)
 
-        return (num_articles, num_failed)
+        counts.num_unmatched += self._report_unmatched()
 
-    def _next_row(self, row_iterators):
-        rows = { }
-        for (name, i) in iterators.iteritems():
-            try:
-                rows[name] = next(i)
-            except StopIteration:
-                del iterators[name]
-        return rows
+    def save(self, db, article, fingerprint, counts):
+        """Saves an article returned by prepare() and records its
+        fingerprint."""
+        with self.metrics.stage('db_save'):
+            saved = save_article(db, article, fingerprint)
+        if saved:
+            if fingerprint:
+                self._known_fingerprints.add(fingerprint)
+            counts.num_imported += 1
+        else:
+            counts.num_failed += 1
+
+    def _report_unmatched(self):
+        num_unmatched = 0
+        for (sheet_name, unmatched) in sorted(self._join.unmatched.items()):
+            for (row_number, key) in unmatched:
+                if key:
+                    msg = 'Row %d of sheet %s (key [%s]) has no matching ' + \
+                          'row in the other sheets of %s'
+                    logging.warn(msg % (row_number, sheet_name, key,
+                                        self.group_name))
+                else:
+                    msg = 'Row %d of sheet %s has no matching row in the ' + \
+                          'other sheets of %s'
+                    logging.warn(msg % (row_number, sheet_name,
+                                        self.group_name))
+            num_unmatched += len(unmatched)
+        return num_unmatched
 
     def _find_article_pdf(self, downloaded_as):
         if not downloaded_as.endswith('.pdf'):
@@ -206,82 +408,101 @@ class DocumentGroupProcessor:
                 return path
         return None
 
+    @span('fetch_document')
     def _fetch_document(self, path):
+        # Returns None if the document could not be extracted
         if not self.document_extractor:
             logging.debug('Document not loaded because no extractor is ' + \
                           'configured')
-            return _empty_extracted_document
+            return self._empty_extracted_document
         try:
-            logging.debug('Load document from %s' % path)
+            logging.debug('Load document from %s', path)
             return self.document_extractor.extract(path)
         except PdfExtractionError as e:
             logging.error(e.details)
-            return _empty_extracted_document
+            return None
     
     def _set_abstract_from_map(self, ss_rows, document, builder):
         key = normalize_title(builder.title)
         try:
             builder.set_abstract(self.abstracts[key])
+            return
         except KeyError:
-            msg = 'Could not find abstract for document [%s]'
-            logging.warn(msg % builder.title)
+            pass
 
-    def _save_article(self, db, article):
-        nt = normalize_title(article.title)
-        logging.debug('Save article with normalized title [%s]' % nt)
-        retrieved = db.articles.retrieve(normalized_title = nt,
-                                         year = article.year,
-                                         venue = article.venue)
-        if not retrieved:
-            logging.debug('Write new article to database')
-            db.articles.add(article)
-        elif len(retrieved) == 1:
-            logging.debug('Update existing article')
-            retrieved[0].update(article)
-            db.articles.update(retrieved[0])
+        match = self.abstracts.find_similar(key, self.abstract_match_threshold)
+        if match:
+            msg = 'Using the abstract titled [%s] for document [%s] ' + \
+                  '(similarity %.2f)'
+            logging.warn(msg % (match[0], builder.title, match[1]))
+            builder.set_abstract(self.abstracts[match[0]])
         else:
-            msg = 'Retrieved %d articles for %s %s with normalized title ' + \
-                  '[%s].  This should not have happened.  The article was ' + \
-                  'not updated.  Please investigate.'
-            logging.error(msg % (article.venue.abbreviation, article.year, nt))
+            msg = 'Could not find abstract for document [%s]'
+            logging.warn(msg % builder.title)
 
 class Director:
-    def __init__(self, configuration, db):
+    def __init__(self, configuration, db, incremental = True,
+                 abstract_cache = None, supervisor = None, metrics = None):
         venue = db.venues.with_abbreviation(configuration.venue)
         if not venue:
             raise ValueError('Unknown venue "%s"' % configuration.venue)
 
         self.venue = venue
         self.year = configuration.year
-        self.groups = configuration.groups
+        self.groups = configuration.document_groups
+        self.incremental = incremental
+        self.abstract_cache = abstract_cache or AbstractCache()
+        self.supervisor = supervisor or ExtractionSupervisor()
+        self.metrics = metrics or ImportMetrics()
 
     def process(self, workbook, db):
-        total_imported = 0
-        total_failed = 0
+        total = ImportCounts()
         for configuration in self.groups:
             config_name = configuration.config_name
             logging.info('Importing document group %s' % config_name)
-            if configuration.abstract_source == 'file':
-                abstract_map = \
-                    self._load_abstracts(configuration.abstracts_file_reader
-                                         configuration.abstracts_file_name)
-            else:
-                abstract_map = None
-            processor = DocumentGroupProcessor(configuration, db, self.venue,
-                                               self.year, abstract_map)
-            (num_imported, num_failed) = processor.process(workbook)
-            logging.info('Loaded %d articles (%d failed) from %s' % (num_imported, num_failed, config_name))
-
-            total_imported += num_imported
-            total_failed += num_failed
-
-        logging.info('Imported %d articles from %d groups with %d failures' % (total_imported, len(self.groups), total_failed))
-        return (total_imported, total_failed)
-
-    def _load_abstracts(self, reader_name, file_name):
-        reader = ABSTRACT_READER_FACTORIES[reader_name](file_name)
-        abstracts = dict((normalize_title(title), body) \
-                             for (title, body) in reader)
-        logging.info('Loaded abstracts from %s using %s' % (file_name,
-                                                            reader_name))
-        return abstracts
+            processor = self.processor_for(configuration, db)
+            with self.metrics.stage('workbook_load'):
+                processor.open_sheets(workbook)
+            num_created = processor.resolve_enum_values(workbook)
+            with self.metrics.stage('commit'):
+                db.commit()
+            logging.info('Created %d article types and categories for %s' % \
+                             (num_created, config_name))
+
+            counts = processor.process(workbook, db)
+            counts.num_enum_values_created = num_created
+            with self.metrics.stage('commit'):
+                db.commit()
+            msg = 'Loaded %d articles (%d unchanged, %d failed, %d ' + \
+                  'unmatched rows) from %s'
+            logging.info(msg % (counts.num_imported, counts.num_unchanged,
+                                counts.num_failed, counts.num_unmatched,
+                                config_name))
+            total.add(counts)
+
+        msg = 'Imported %d articles from %d groups with %d unchanged and ' + \
+              '%d failures'
+        logging.info(msg % (total.num_imported, len(self.groups),
+                            total.num_unchanged, total.num_failed))
+        logging.info(self.supervisor.stats.format())
+        self.supervisor.quarantine.save()
+        return total
+
+    def processor_for(self, configuration, db, enum_names_only = False):
+        """Returns the DocumentGroupProcessor for the document group with
+        the given configuration.  If enum_names_only, the processor will
+        only be asked to collect_enum_names(), so the abstracts and the
+        fingerprints of the rows already imported are not loaded."""
+        if enum_names_only:
+            abstract_map = None
+        elif configuration.abstract_source == 'file':
+            abstract_map = \
+                self.abstract_cache.get(configuration.abstracts_file_reader,
+                                        configuration.abstracts_file_name)
+        else:
+            abstract_map = None
+        return DocumentGroupProcessor(configuration, db, self.venue,
+                                      self.year, abstract_map,
+                                      self.incremental and \
+                                          not enum_names_only,
+                                      self.supervisor, self.metrics)
@@ -0,0 +1,126 @@
+"""Classes that combine the rows of a document group's sheets into the dicts
+of rows, keyed by sheet name, that the importers build articles from.
+
+Both joins yield one dict per row of the group and record the rows they
+could not pair up in their "unmatched" attribute, a dict from sheet name to
+a list of (row number, key) tuples.  Row numbers count the header as row 1,
+like the spreadsheet programs do."""
+
+from stupendous_cow.util import normalize_title
+
+class PositionalJoin:
+    """Pairs the n-th row of every sheet with the n-th row of the others, so
+    the sheets must be kept row-aligned.  When some sheets have fewer rows,
+    the remaining rows of the longer sheets are unmatched."""
+    def __init__(self):
+        self.unmatched = { }
+
+    def rows(self, workbook, sheet_names):
+        self.unmatched = dict((n, [ ]) for n in sheet_names)
+        row_iterators = dict((n, iter(workbook[n])) for n in sheet_names)
+        row_number = 2
+        while True:
+            rows = { }
+            for (name, i) in row_iterators.items():
+                try:
+                    rows[name] = next(i)
+                except StopIteration:
+                    del row_iterators[name]
+            if not rows:
+                break
+            if len(rows) < len(self.unmatched):
+                for name in rows:
+                    self.unmatched[name].append((row_number, None))
+            yield rows
+            row_number += 1
+
+class KeyJoin:
+    """Joins the rows of secondary sheets onto the rows of the primary sheet
+    whose key (see join_key) is the same.  Each secondary sheet is read once
+    into a table from key to row, then the primary sheet is streamed, so the
+    join takes one pass over each sheet and holds only the secondary sheets
+    in memory.
+
+    primary_key and secondary_keys are SpreadsheetPaths naming the key
+    column of each sheet, and key_function turns a cell into a key (see
+    join_key and title_join_key).  A primary row without a match in some secondary
+    sheet is still yielded, without a row for that sheet.  Rows with empty
+    keys never match, and when a secondary sheet has several rows with the
+    same key, only the first is joined.
+
+    The secondary sheets are buffered even when the primary sheet is
+    smaller, because rows are yielded in the primary sheet's order and a
+    streamed sheet's length is not known until it has been read.  In the
+    workbooks this is written for, the secondary sheets (summaries, notes)
+    are the smaller ones anyway."""
+    def __init__(self, primary_key, secondary_keys, key_function = None):
+        self.primary_key = primary_key
+        self.secondary_keys = dict((p.sheet, p) for p in secondary_keys)
+        self.key_function = key_function or join_key
+        self.unmatched = { }
+
+    def rows(self, workbook, sheet_names):
+        primary_name = self.primary_key.sheet
+        secondary_names = sorted(n for n in sheet_names if n != primary_name)
+        self.unmatched = dict((n, [ ]) for n in secondary_names)
+        self.unmatched[primary_name] = [ ]
+        unmatched_primary = self.unmatched[primary_name]
+
+        tables = [ (n, self._read_table(workbook, self.secondary_keys[n]))
+                   for n in secondary_names ]
+        primary_sheet = workbook[primary_name]
+        key_for = primary_sheet.accessor(self.primary_key.column)
+        to_key = self.key_function
+        for (row_number, row) in enumerate(primary_sheet, 2):
+            key = to_key(key_for(row))
+            rows = { primary_name : row }
+            for (name, table) in tables:
+                match = table.pop(key, None) if key else None
+                if match:
+                    rows[name] = match[1]
+            if len(rows) <= len(tables):
+                unmatched_primary.append((row_number, key))
+            yield rows
+
+        for (name, table) in tables:
+            self.unmatched[name].extend((row_number, key) \
+                                            for (key, (row_number, row)) \
+                                                in table.iteritems())
+            self.unmatched[name].sort()
+
+    def _read_table(self, workbook, key_path):
+        sheet = workbook[key_path.sheet]
+        key_for = sheet.accessor(key_path.column)
+        table = { }
+        unmatched = self.unmatched[key_path.sheet]
+        to_key = self.key_function
+        for (row_number, row) in enumerate(sheet, 2):
+            key = to_key(key_for(row))
+            if (not key) or (key in table):
+                unmatched.append((row_number, key))
+            else:
+                table[key] = (row_number, row)
+        return table
+
+def join_key(value):
+    """Returns the key a KeyJoin matches value by.  Numbers are compared by
+    value, so 17 and 17.0 match but 17.5 and 175 do not.  Strings match if
+    they differ only in case or spacing; punctuation is significant, so
+    "A-1" and "A1" do not match."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = int(value) if value == int(value) else repr(value)
+    if not (isinstance(value, str) or isinstance(value, unicode)):
+        value = unicode(value)
+    return u' '.join(value.split()).lower()
+
+def title_join_key(value):
+    """Returns the key a KeyJoin on titles matches value by.  Strings are
+    normalized with normalize_title(), as the importers do when they match
+    articles, so titles that differ only in case, spacing, punctuation or
+    accented letters match.  Other values are keyed as join_key() keys
+    them."""
+    if isinstance(value, str) or isinstance(value, unicode):
+        return normalize_title(value)
+    return join_key(value)
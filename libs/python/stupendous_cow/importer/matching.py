@@ -0,0 +1,82 @@
+"""Approximate matching of article titles, for when the title in a
+spreadsheet and the title in an abstracts file are not quite the same."""
+
+import math
+
+class TitleMatcher:
+    """Finds the title most similar to a query among a fixed set of titles.
+    Similarity is the Jaccard similarity of the titles' sets of character
+    trigrams, and only titles at least threshold similar are returned.
+
+    Candidates are found with prefix filtering: every title is indexed only
+    under its rarest few trigrams, as many as ensure that two titles whose
+    similarity reaches the threshold share at least one of them.  A lookup
+    therefore only visits the short lists of titles that contain the
+    query's rare trigrams, instead of every title, and still finds every
+    title that is similar enough."""
+    def __init__(self, titles, threshold):
+        if not (0.0 < threshold <= 1.0):
+            raise ValueError('Similarity threshold must be in (0, 1]')
+        self.threshold = threshold
+        self._titles = [ ]
+        self._grams = [ ]
+        self._frequency = { }
+
+        for title in titles:
+            grams = trigrams(title)
+            self._titles.append(title)
+            self._grams.append(grams)
+            for g in grams:
+                self._frequency[g] = self._frequency.get(g, 0) + 1
+
+        self._postings = { }
+        for (n, grams) in enumerate(self._grams):
+            for g in self._prefix(grams):
+                self._postings.setdefault(g, [ ]).append(n)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def best_match(self, title):
+        """Returns (title, similarity) for the indexed title most similar to
+        title, or None if none is at least threshold similar."""
+        grams = trigrams(title)
+        if not grams:
+            return None
+        min_size = self.threshold * len(grams)
+        max_size = len(grams) / self.threshold
+
+        best = None
+        seen = set()
+        for g in self._prefix(grams):
+            for n in self._postings.get(g, ()):
+                if n in seen:
+                    continue
+                seen.add(n)
+                other = self._grams[n]
+                if not (min_size <= len(other) <= max_size):
+                    continue
+                score = jaccard(grams, other)
+                if (score >= self.threshold) and \
+                       ((best is None) or (score > best[1])):
+                    best = (self._titles[n], score)
+        return best
+
+    def _prefix(self, grams):
+        # Rarest first; trigrams that are not indexed at all come first
+        frequency = self._frequency
+        ordered = sorted(grams, key = lambda g: (frequency.get(g, 0), g))
+        min_overlap = int(math.ceil(self.threshold * len(ordered) - 1e-9))
+        return ordered[:len(ordered) - min_overlap + 1]
+
+def trigrams(title):
+    """Returns the set of character trigrams of a normalized title, padded
+    with a space at each end so short words count too."""
+    text = ' %s ' % title
+    return frozenset(text[i:i + 3] for i in xrange(len(text) - 2))
+
+def jaccard(a, b):
+    if not (a or b):
+        return 1.0
+    common = len(a & b)
+    return float(common) / (len(a) + len(b) - common)
@@ -0,0 +1,95 @@
+"""Timing of the stages of an import, and the run reports made from it."""
+
+import time
+
+# The stages of an import, in the order they happen to a row
+STAGES = ('workbook_load', 'sheet_read', 'pdf_lookup', 'extraction',
+          'binding', 'db_save', 'commit')
+
+class ImportMetrics:
+    """Seconds spent in and number of calls to each stage of an import."""
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+
+    def stage(self, name):
+        """Returns a context manager that adds the time spent in it to the
+        stage called name."""
+        return _StageTimer(self, name)
+
+    def timed(self, name, iterable):
+        """Yields the items of iterable, adding the time spent producing
+        each one to the stage called name."""
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.time() - start, 0)
+                return
+            self.add_time(name, time.time() - start)
+            yield item
+
+    def add_time(self, name, seconds, calls = 1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def add(self, other):
+        for name in other.seconds:
+            self.add_time(name, other.seconds[name], other.calls[name])
+        return self
+
+    def take(self):
+        """Returns a copy of the metrics and clears them."""
+        taken = ImportMetrics().add(self)
+        self.__init__()
+        return taken
+
+    def to_dict(self):
+        return { 'stages' : dict((name, { 'seconds' : self.seconds[name],
+                                          'calls' : self.calls[name] }) \
+                                     for name in self.seconds) }
+
+    def format(self):
+        lines = [ '%-16s %10s %10s %12s' % ('Stage', 'Seconds', 'Calls',
+                                            'ms/call') ]
+        names = list(STAGES) + sorted(n for n in self.seconds \
+                                          if n not in STAGES)
+        for name in names:
+            calls = self.calls[name]
+            per_call = 1000.0 * self.seconds[name] / calls if calls else 0.0
+            lines.append('%-16s %10.3f %10d %12.3f' % \
+                             (name, self.seconds[name], calls, per_call))
+        return '\n'.join(lines)
+
+class _StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.metrics.add_time(self.name, time.time() - self.start)
+
+def run_report(importer, started_at, elapsed, counts, metrics,
+               extraction_stats, **details):
+    """Returns the report of an import run as a dict that can be written as
+    JSON.  counts is the run's ImportCounts and details are added to the
+    report as they are."""
+    num_rows = counts.num_imported + counts.num_unchanged + counts.num_failed
+    report = { 'importer' : importer,
+               'started_at' : started_at.replace(microsecond = 0).isoformat(),
+               'elapsed' : elapsed,
+               'num_rows' : num_rows,
+               'rows_per_second' : num_rows / elapsed if elapsed else 0.0,
+               'counts' : dict(vars(counts)),
+               'extraction' : extraction_stats.to_dict() }
+    report.update(metrics.to_dict())
+    report.update(details)
+    return report
@@ -1,6 +1,8 @@
 """Classes and functions for reading spreadsheets.  Currently a wrapper over
-pyexcel."""
+pyexcel and pyexcel-io."""
+import os.path
 import pyexcel
+import pyexcel_io
 
 class SpreadsheetPath:
     def __init__(self, sheet, column):
@@ -22,66 +24,75 @@ class SpreadsheetPath:
                (self.sheet != other.sheet) or (self.column != other.column)
 
 
-class Row:
-    def __init__(self, column_names, column_map, data):
-        self._column_names = column_names
-        self._column_map = column_map
-        self._length = len(column_names)
-        self._data = data
+class Row(tuple):
+    """One row of a worksheet: a tuple of the row's cells, padded to the
+    width of the header, that can also be indexed by column name.  Each
+    worksheet has its own subclass of Row (see Row.for_columns) holding the
+    column names, so a row is no bigger than the tuple of its cells."""
+    __slots__ = ()
+    _column_names = ()
+    _column_map = { }
+    _padding = ()
+
+    @staticmethod
+    def for_columns(column_names):
+        """Returns the subclass of Row for a sheet whose header row is
+        column_names."""
+        column_names = tuple(column_names)
+        attributes = {
+            '__slots__' : (),
+            '_column_names' : column_names,
+            '_column_map' : dict((x, n) for (n, x) in enumerate(column_names)),
+            '_padding' : ('',) * len(column_names)
+        }
+        return type('Row', (Row,), attributes)
+
+    @classmethod
+    def from_cells(cls, cells):
+        """Returns the row holding cells, padded with empty strings or
+        truncated to the number of columns."""
+        n = len(cells)
+        width = len(cls._padding)
+        if n < width:
+            return cls(tuple(cells) + cls._padding[n:])
+        elif n > width:
+            return cls(cells[:width])
+        return cls(cells)
 
     @property
     def columns(self):
         return self._column_names
 
-    def __len__(self):
-        return self._length
-
     def __getitem__(self, index):
-        if isinstance(index, str) or isinstance(index, unicode):
-            return self._value_at(self._name_to_column(index))
-        elif isinstance(index, int) or isinstance(index, long):
-            return self._get_by_position(index)
-        elif isinstance(index, slice):
-            raise TypeError('Row slices not supported yet')
-        else:
+        try:
+            return tuple.__getitem__(self, index)
+        except TypeError:
+            if isinstance(index, str) or isinstance(index, unicode):
+                return tuple.__getitem__(self, self._name_to_column(index))
             raise TypeError('Row index must be an int, long, str or unicode')
 
-    def _get_by_position(self, pos):
-        i = self._normalize_index(pos)
-        if (i < 0) or (i >= self._length):
-            msg = 'Index %d is out of range in a row of length %d'
-            raise IndexError(msg % (i, self._length))
-        return self._value_at(i)
-
-    def _normalize_index(self, i):
-        if i < 0:
-            return self._length + i
-        return i
-
-    def _value_at(self, index):
-        if index > len(self._data):
-            return None
-        return self._data[index]
-    
     def _name_to_column(self, name):
         try:
             return self._column_map[name]
         except KeyError:
             raise IndexError('No such column "%s"' % name)
 
+def _column_accessor(index, _get = tuple.__getitem__):
+    return lambda row: _get(row, index)
+
 class Worksheet:
+    """A sheet held in memory by pyexcel."""
     def __init__(self, sheet):
         self._sheet = sheet
         rows = iter(sheet)
         try:
-            self._column_names = next(rows)
+            column_names = list(next(rows))
         except StopIteration:
-            self._column_names = [ ]
-        self._column_map = \
-            dict((x, n) for (n, x) in enumerate(self._column_names))
-        if len(self._column_names) < self._sheet.number_of_columns():
-            missing = self._sheet.number_of_columns()
-            self._column_names += [ '' ] * missing
+            column_names = [ ]
+        if len(column_names) < self._sheet.number_of_columns():
+            missing = self._sheet.number_of_columns() - len(column_names)
+            column_names += [ '' ] * missing
+        self._set_columns(column_names)
 
     @property
     def name(self):
@@ -95,25 +106,155 @@ class Worksheet:
     def columns(self):
         return self._column_names
 
+    def column_index(self, column):
+        if isinstance(column, int) or isinstance(column, long):
+            return column
+        try:
+            return self._column_map[column]
+        except KeyError:
+            msg = 'No such column "%s" in sheet "%s"'
+            raise IndexError(msg % (column, self.name))
+
+    def accessor(self, column):
+        """Returns a function that takes one of this sheet's rows and returns
+        the value in column, which is a column name or index.  Cheaper than
+        indexing each row by name when reading the same column from many
+        rows."""
+        return _column_accessor(self.column_index(column))
+
     def __iter__(self):
         rows = iter(self._sheet)
+        next(rows, None)  # Skip header row
+        make_row = self._row_type.from_cells
+        for data in rows:
+            yield make_row(data)
+
+    def close(self):
+        pass
+
+    def _set_columns(self, column_names):
+        self._row_type = Row.for_columns(column_names)
+        self._column_names = self._row_type._column_names
+        self._column_map = self._row_type._column_map
+
+class StreamingWorksheet(Worksheet):
+    """A sheet whose rows are read from the file, one at a time, each time
+    it is iterated.  Only for formats whose pyexcel-io reader really streams
+    (see STREAMED_FORMATS).  The file is not opened until the sheet's
+    columns or rows are first asked for."""
+    def __init__(self, filename, name, **keywords):
+        self._filename = filename
+        self._name = name
+        self._keywords = keywords
+        self._pending = None
+
+    def __getattr__(self, name):
+        # The columns come from the header row, which is read on first use
+        if name in ('_row_type', '_column_names', '_column_map'):
+            self._read_header()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    @property
+    def name(self):
+        return self._name
+
+    def __iter__(self):
+        make_row = self._row_type.from_cells
+        if self._pending:
+            (rows, reader) = self._pending
+            self._pending = None
+        else:
+            (rows, reader) = self._open()
+            next(rows, None)  # Skip header row
+
+        try:
+            for data in rows:
+                yield make_row(data)
+        finally:
+            reader.close()
+
+    def close(self):
+        if self._pending:
+            self._pending[1].close()
+            self._pending = None
+
+    def _read_header(self):
+        # Keep the stream the header came from for the first iteration,
+        # so a worksheet that is read once only opens the file once.
+        self._pending = self._open()
+        self._set_columns(next(self._pending[0], [ ]))
+
+    def _open(self):
+        (data, reader) = pyexcel_io.iget_data(self._filename,
+                                              sheet_name = self._name,
+                                              **self._keywords)
+        return (iter(data[self._name]), reader)
+
+# The formats whose pyexcel-io readers hold one row at a time.  The ODS
+# reader, for one, parses the whole document however little of it is read.
+STREAMED_FORMATS = ('csv', 'tsv', 'xlsx', 'xlsm')
 
-        next(rows)  # Skip header row
-        while True:
-            yield Row(self._column_names, self._column_map, next(rows))
-        
 class Workbook:
-    def __init__(self, filename):
+    """A spreadsheet file.  Nothing is read until it is needed.  Sheets of
+    CSV, TSV and XLSX files are streamed (see StreamingWorksheet), so memory
+    does not grow with the size of the file.  Other formats, such as ODS,
+    cannot be streamed, so the first sheet asked for loads the whole file
+    with pyexcel.get_book() and every sheet is read from that one copy.
+    Call close() when done with it."""
+    def __init__(self, filename, **keywords):
         self._filename = filename
-        self._book = pyexcel.get_book(file_name = filename)
+        self._keywords = keywords
+        self._book = None
+        self._sheet_names = None
+        self._sheets = { }
+
+    @property
+    def is_streamed(self):
+        file_type = self._keywords.get('file_type') or \
+                        os.path.splitext(self._filename)[1][1:]
+        return file_type.lower() in STREAMED_FORMATS
 
     @property
     def num_sheets(self):
-        return self._book.number_of_sheets()
+        return len(self.sheet_names)
     
     @property
     def sheet_names(self):
-        return self._book.sheet_names()
+        if self._sheet_names is None:
+            if not self.is_streamed:
+                self._sheet_names = self._get_book().sheet_names()
+            else:
+                (data, reader) = pyexcel_io.iget_data(self._filename,
+                                                      **self._keywords)
+                try:
+                    self._sheet_names = list(data)
+                finally:
+                    reader.close()
+        return self._sheet_names
 
     def __getitem__(self, index):
-        return Worksheet(self._book[index])
+        if isinstance(index, int) or isinstance(index, long):
+            index = self.sheet_names[index]
+        try:
+            return self._sheets[index]
+        except KeyError:
+            if self.is_streamed:
+                sheet = StreamingWorksheet(self._filename, index,
+                                           **self._keywords)
+            else:
+                sheet = Worksheet(self._get_book()[index])
+            self._sheets[index] = sheet
+            return sheet
+
+    def close(self):
+        for sheet in self._sheets.itervalues():
+            sheet.close()
+        self._sheets = { }
+        self._book = None
+
+    def _get_book(self):
+        if self._book is None:
+            self._book = pyexcel.get_book(file_name = self._filename,
+                                          **self._keywords)
+        return self._book
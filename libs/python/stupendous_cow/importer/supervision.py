@@ -0,0 +1,268 @@
+"""Supervised extraction of documents.
+
+Every extraction gets a deadline, after which pdftotext is killed.  An
+extraction that timed out is retried, since the machine may just have been
+busy, and a document that still cannot be extracted may be handed to a
+fallback extractor.  Files that fail to extract in several runs are quarantined and
+skipped until they change.  The latency and outcome of every extraction is
+recorded in an ExtractionStats."""
+
+from stupendous_cow.importer.abstracts import default_cache_dir
+from stupendous_cow.importer.extractors import DEFAULT_EXTRACTION_TIMEOUT, \
+    DOCUMENT_EXTRACTOR_FACTORIES, PdfExtractionError, PdfExtractionTimeout
+from stupendous_cow.importer.fingerprints import file_identity
+import json
+import logging
+import math
+import os
+import os.path
+import tempfile
+import time
+
+class ExtractionStats:
+    """Latencies and failure counts of the extractions in one run."""
+    def __init__(self):
+        self.latencies = [ ]        # Seconds for each document, retries and
+                                    # fallback included
+        self.num_timeouts = 0       # Attempts killed at the deadline
+        self.num_crashes = 0        # Attempts that failed otherwise
+        self.num_retries = 0
+        self.num_fallbacks = 0      # Documents given to the fallback extractor
+        self.num_failed = 0         # Documents that could not be extracted
+        self.num_quarantined = 0    # Documents skipped because of quarantine
+
+    def add(self, other):
+        self.latencies.extend(other.latencies)
+        self.num_timeouts += other.num_timeouts
+        self.num_crashes += other.num_crashes
+        self.num_retries += other.num_retries
+        self.num_fallbacks += other.num_fallbacks
+        self.num_failed += other.num_failed
+        self.num_quarantined += other.num_quarantined
+        return self
+
+    def percentile(self, p):
+        """Returns the latency below which p percent of the latencies fall
+        (nearest rank), or None if there are none."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        rank = int(math.ceil(p / 100.0 * len(ordered)))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+    def to_dict(self):
+        return { 'num_documents' : len(self.latencies),
+                 'p50' : self.percentile(50), 'p95' : self.percentile(95),
+                 'p99' : self.percentile(99),
+                 'max' : max(self.latencies) if self.latencies else None,
+                 'num_timeouts' : self.num_timeouts,
+                 'num_crashes' : self.num_crashes,
+                 'num_retries' : self.num_retries,
+                 'num_fallbacks' : self.num_fallbacks,
+                 'num_failed' : self.num_failed,
+                 'num_quarantined' : self.num_quarantined }
+
+    def format(self):
+        lines = [ ]
+        if self.latencies:
+            lines.append('Extracted %d documents: p50 %.3f s, p95 %.3f s, ' \
+                         'p99 %.3f s, max %.3f s' % \
+                             (len(self.latencies), self.percentile(50),
+                              self.percentile(95), self.percentile(99),
+                              max(self.latencies)))
+        else:
+            lines.append('Extracted 0 documents')
+        lines.append('%d attempts timed out and %d failed; %d retries and ' \
+                     '%d fallbacks' % (self.num_timeouts, self.num_crashes,
+                                       self.num_retries, self.num_fallbacks))
+        lines.append('%d documents could not be extracted and %d were ' \
+                     'skipped because they are quarantined' % \
+                         (self.num_failed, self.num_quarantined))
+        return '\n'.join(lines)
+
+class Quarantine:
+    """Counts the runs in which each file failed to extract, in a JSON file.
+    A file that failed in max_failures runs is quarantined until its size
+    or modification time changes.  With no filename, nothing is kept
+    between runs.  Each run has a Quarantine of its own, which counts at
+    most one failure per file."""
+    def __init__(self, filename = None, max_failures = 2):
+        self.filename = filename
+        self.max_failures = max_failures
+        self._entries = self._load() if filename else { }
+        self._changed = set()
+        self._failed = set()        # Files whose failure in this run counted
+
+    def is_quarantined(self, path):
+        entry = self._entry(path)
+        return bool(entry) and (entry['failures'] >= self.max_failures)
+
+    def record_failure(self, path):
+        """Records that path failed to extract and returns True if it is
+        quarantined now."""
+        entry = self._entry(path)
+        if not entry:
+            identity = file_identity(path)
+            if not identity:
+                return False
+            entry = { 'size' : identity[1], 'mtime' : identity[2],
+                      'failures' : 0 }
+            self._entries[identity[0]] = entry
+            self._failed.discard(identity[0])
+        key = os.path.abspath(path)
+        if key not in self._failed:
+            entry['failures'] += 1
+            self._failed.add(key)
+            self._changed.add(key)
+        return entry['failures'] >= self.max_failures
+
+    def record_success(self, path):
+        key = os.path.abspath(path)
+        self._failed.discard(key)
+        if key in self._entries:
+            del self._entries[key]
+            self._changed.add(key)
+
+    def save(self):
+        """Writes the quarantine back to its file.  Entries other processes
+        changed since it was loaded are kept unless this one changed them
+        too."""
+        if not (self.filename and self._changed):
+            return
+        entries = self._load()
+        for key in self._changed:
+            if key in self._entries:
+                entries[key] = self._entries[key]
+            else:
+                entries.pop(key, None)
+
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        (fd, tmp_filename) = tempfile.mkstemp(dir = directory)
+        try:
+            with os.fdopen(fd, 'w') as output:
+                json.dump(entries, output, indent = 1, sort_keys = True)
+            os.rename(tmp_filename, self.filename)
+        except:
+            os.unlink(tmp_filename)
+            raise
+        self._entries = entries
+        self._changed = set()
+
+    def _entry(self, path):
+        # The entry for path, unless path has changed since it was made
+        identity = file_identity(path)
+        if not identity:
+            return None
+        entry = self._entries.get(identity[0])
+        if entry and ((entry['size'], entry['mtime']) != identity[1:]):
+            del self._entries[identity[0]]
+            self._changed.add(identity[0])
+            return None
+        return entry
+
+    def _load(self):
+        try:
+            with open(self.filename) as input:
+                entries = json.load(input)
+        except IOError:
+            return { }
+        except ValueError:
+            logging.warn('Ignoring invalid quarantine file %s' % self.filename)
+            return { }
+        return entries if isinstance(entries, dict) else { }
+
+def default_quarantine_filename():
+    return os.path.join(os.path.dirname(default_cache_dir()),
+                        'quarantine.json')
+
+class ExtractionSupervisor:
+    """Creates the extractors of an import, which share its deadline, retry
+    policy, fallback extractor, quarantine and statistics.  Documents that
+    time out are retried num_retries times; after that, or after any other
+    failure, the extractor named fallback, if any, gets one try.  What it
+    extracts is marked as degraded (see ExtractedDocument)."""
+    def __init__(self, deadline = DEFAULT_EXTRACTION_TIMEOUT,
+                 num_retries = 1, fallback = None, quarantine = None):
+        self.deadline = deadline
+        self.num_retries = num_retries
+        self.fallback = fallback
+        self.quarantine = quarantine or Quarantine()
+        self.stats = ExtractionStats()
+
+    def extractor_for(self, name):
+        """Returns a supervised extractor that uses the extractor named in
+        DOCUMENT_EXTRACTOR_FACTORIES."""
+        primary = self._create(name)
+        if self.fallback and (self.fallback != name):
+            fallback = self._create(self.fallback)
+        else:
+            fallback = None
+        return SupervisedExtractor(self, primary, fallback)
+
+    def _create(self, name):
+        try:
+            factory = DOCUMENT_EXTRACTOR_FACTORIES[name]
+        except KeyError:
+            raise ValueError('Unknown document extractor "%s"' % name)
+        return factory(timeout = self.deadline)
+
+class SupervisedExtractor:
+    def __init__(self, supervisor, extractor, fallback = None):
+        self.supervisor = supervisor
+        self.extractor = extractor
+        self.fallback = fallback
+
+    def extract(self, filename):
+        supervisor = self.supervisor
+        stats = supervisor.stats
+        if supervisor.quarantine.is_quarantined(filename):
+            stats.num_quarantined += 1
+            raise PdfExtractionError('Skipped %s because it is quarantined' % \
+                                         filename)
+
+        start = time.time()
+        try:
+            document = self._extract(filename, stats)
+        except PdfExtractionError:
+            stats.num_failed += 1
+            if supervisor.quarantine.record_failure(filename):
+                logging.warn('Quarantined %s' % filename)
+            raise
+        finally:
+            stats.latencies.append(time.time() - start)
+        supervisor.quarantine.record_success(filename)
+        return document
+
+    def _extract(self, filename, stats):
+        for attempt in xrange(self.supervisor.num_retries + 1):
+            if attempt:
+                stats.num_retries += 1
+                logging.info('Retrying extraction from %s' % filename)
+            try:
+                return self.extractor.extract(filename)
+            except PdfExtractionTimeout as e:
+                stats.num_timeouts += 1
+                logging.warn(e.details)
+                error = e
+            except PdfExtractionError as e:
+                stats.num_crashes += 1
+                logging.warn(e.details)
+                error = e
+                break
+
+        if not self.fallback:
+            raise error
+        stats.num_fallbacks += 1
+        logging.info('Extracting %s with the fallback extractor' % filename)
+        try:
+            document = self.fallback.extract(filename)
+        except PdfExtractionTimeout:
+            stats.num_timeouts += 1
+            raise
+        except PdfExtractionError:
+            stats.num_crashes += 1
+            raise
+        document.degraded = True
+        return document
@@ -0,0 +1,212 @@
+"""Optional profiling of the importers and the database layer.
+
+Profiling is started by start_profiling() or, in programs that call
+start_profiling_from_environment() (the importers in bin/importers do), by
+setting STUPENDOUS_COW_PROFILE to "cprofile" or "sample", optionally
+followed by ":" and the file to write the profile to.  Importing this module
+never starts profiling, so processes forked from a program do not inherit a
+profiler they would never write.  The profile is written when
+stop_profiling() is called or the program exits.
+
+  cprofile  Runs cProfile and writes its statistics, for pstats or
+            snakeviz.
+  sample    Samples the stack every few milliseconds of wall-clock time and
+            writes the samples as folded stacks ("frame;frame;... count"
+            lines), which flamegraph.pl and speedscope draw as flame graphs.
+            Its overhead is small enough to leave on for a whole import.
+
+Functions decorated with span() show up in both kinds of profile under the
+span's name, so the time spent in hot operations such as SQL statements is
+easy to find.  When profiling is off, a span costs one extra function call."""
+
+import atexit
+import cProfile
+import collections
+import logging
+import os
+import os.path
+import re
+import signal
+import sys
+import time
+
+PROFILE_ENVIRONMENT_VARIABLE = 'STUPENDOUS_COW_PROFILE'
+PROFILE_MODES = ('cprofile', 'sample')
+
+_profiler = None
+
+def span(name):
+    """Decorator that attributes the time spent in the decorated function to
+    a span called name when profiling is on."""
+    def decorate(f):
+        def spanned(*args, **kwargs):
+            if _profiler is None:
+                return f(*args, **kwargs)
+            return _profiler.run_span(name, f, args, kwargs)
+        spanned.__name__ = f.__name__
+        spanned.__doc__ = f.__doc__
+        return spanned
+    return decorate
+
+def start_profiling(mode, filename = None):
+    """Starts profiling in mode ("cprofile" or "sample").  The profile is
+    written to filename, which defaults to stupendous_cow.<pid>.prof or
+    .folded in the current directory."""
+    global _profiler
+    if _profiler is not None:
+        raise ValueError('Profiling has already started')
+    if mode == 'cprofile':
+        profiler = CProfileProfiler(filename or _default_filename('prof'))
+    elif mode == 'sample':
+        profiler = SamplingProfiler(filename or _default_filename('folded'))
+    else:
+        raise ValueError('Unknown profiling mode "%s" (must be one of %s)' % \
+                             (mode, ', '.join(PROFILE_MODES)))
+    profiler.start()
+    _profiler = profiler
+    return profiler
+
+def stop_profiling():
+    """Stops profiling and writes the profile.  Returns the name of the file
+    it was written to, or None if profiling was not on."""
+    global _profiler
+    profiler = _profiler
+    if profiler is None:
+        return None
+    _profiler = None
+    profiler.stop()
+    profiler.write()
+    return profiler.filename
+
+def start_profiling_from_environment():
+    """Starts profiling as STUPENDOUS_COW_PROFILE says and arranges for the
+    profile to be written when the program exits.  Returns the profiler, or
+    None if the variable is not set or is invalid, which is logged."""
+    setting = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, '').strip()
+    if not setting:
+        return None
+    (mode, _, filename) = setting.partition(':')
+    try:
+        profiler = start_profiling(mode, filename or None)
+    except ValueError as e:
+        logging.error('Ignoring %s: %s' % (PROFILE_ENVIRONMENT_VARIABLE, e))
+        return None
+    atexit.register(stop_profiling)
+    return profiler
+
+def discard_profiling():
+    """Stops profiling without writing the profile, for a process forked
+    from one that was profiling."""
+    global _profiler
+    profiler = _profiler
+    if profiler is not None:
+        _profiler = None
+        profiler.stop()
+
+def is_profiling():
+    return _profiler is not None
+
+def _default_filename(extension):
+    return os.path.abspath('stupendous_cow.%d.%s' % (os.getpid(), extension))
+
+class CProfileProfiler:
+    """Runs cProfile.  Spans run inside a function named after the span, so
+    they have their own entries in the statistics."""
+    def __init__(self, filename):
+        self.filename = filename
+        self._profile = cProfile.Profile()
+        self._span_runners = { }
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self):
+        self._profile.dump_stats(self.filename)
+
+    def run_span(self, name, f, args, kwargs):
+        try:
+            runner = self._span_runners[name]
+        except KeyError:
+            runner = _create_span_runner(name)
+            self._span_runners[name] = runner
+        return runner(f, args, kwargs)
+
+def _create_span_runner(name):
+    # A function whose name is the span's, for cProfile to report
+    function_name = 'span_' + re.sub('\\W', '_', name)
+    namespace = { }
+    code = compile('def %s(f, args, kwargs):\n' \
+                   '    return f(*args, **kwargs)\n' % function_name,
+                   '<span %s>' % name, 'exec')
+    exec code in namespace
+    return namespace[function_name]
+
+class SamplingProfiler:
+    """Samples the main thread's stack every interval seconds of wall-clock
+    time, using SIGALRM.  Python only runs signal handlers between
+    bytecodes, so a sample taken after a long call into C (such as a SQL
+    statement) is weighted by the time since the previous sample."""
+    def __init__(self, filename, interval = 0.005):
+        self.filename = filename
+        self.interval = interval
+        self.samples = collections.defaultdict(float)
+        self._spans = [ ]       # (name, frame of the span's caller)
+        self._last_sample = None
+        self._previous_handler = None
+
+    def start(self):
+        self._previous_handler = signal.signal(signal.SIGALRM, self._sample)
+        # Restart system calls the signal interrupts, rather than failing
+        signal.siginterrupt(signal.SIGALRM, False)
+        self._last_sample = time.time()
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0, 0)
+        signal.signal(signal.SIGALRM, self._previous_handler or signal.SIG_DFL)
+
+    def write(self):
+        with open(self.filename, 'w') as output:
+            for (stack, weight) in sorted(self.samples.iteritems()):
+                output.write('%s %d\n' % (stack, max(1, int(round(weight)))))
+
+    def run_span(self, name, f, args, kwargs):
+        self._spans.append((name, _caller_frame()))
+        try:
+            return f(*args, **kwargs)
+        finally:
+            self._spans.pop()
+
+    def _sample(self, signum, frame):
+        now = time.time()
+        weight = (now - self._last_sample) / self.interval
+        self._last_sample = now
+
+        frames = [ ]
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+
+        span_callers = { }
+        for (name, caller) in self._spans:
+            span_callers.setdefault(id(caller), [ ]).append(name)
+        stack = [ ]
+        for f in frames:
+            code = f.f_code
+            if code.co_filename == _THIS_FILE:
+                continue    # The span machinery
+            stack.append('%s:%s' % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            for name in span_callers.get(id(f), ()):
+                stack.append('[%s]' % name)
+        self.samples[';'.join(stack)] += weight
+
+def _caller_frame():
+    # The frame that called the function a span decorates
+    return sys._getframe(3)
+
+_THIS_FILE = _caller_frame.__code__.co_filename
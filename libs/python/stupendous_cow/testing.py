@@ -1,7 +1,14 @@
 """Classes and functions to help out with unit testing"""
+from stupendous_cow.db.tracing import SqlTracer, query_plan
+import atexit
+import contextlib
 import inspect
+import os
 import os.path
+import re
+import shutil
 import sqlite3
+import tempfile
 import unittest
 
 class DatabaseTestCase(unittest.TestCase):
@@ -42,8 +49,26 @@ class DatabaseTestCase(unittest.TestCase):
             return self._compute_item_diffs(left, right, ('id', 'name'))
         return self._verify_item_list(name, truth, items, compute_ec_diffs)
 
+    def _verify_no_full_scans(self, statements, *tables):
+        """Fails if any of the CapturedStatements reads one of tables
+        without an index."""
+        if not statements:
+            self.fail('No statements were captured')
+        for statement in statements:
+            scanned = [ t for t in tables if t in statement.full_scans ]
+            if scanned:
+                self.fail('Full scan of %s in %s\nQuery plan:\n%s' % \
+                              (', '.join(scanned), statement.sql,
+                               '\n'.join(statement.plan)))
+
+    # A TemplateDatabase to copy into db instead of calling setUpDatabase()
+    template = None
+
     @classmethod
     def setUpClass(cls):
+        if cls.template:
+            cls.db = cls.template.connect()
+            return
         cls.db = sqlite3.connect(':memory:')
         cursor = cls.db.cursor()
         try:
@@ -59,6 +84,184 @@ class DatabaseTestCase(unittest.TestCase):
     def setUpDatabase(cls, cursor):
         raise RuntimeError("DatabaseTestCase.setUpDatabase() not implemented")
 
+class CapturedStatement:
+    """A statement run inside QueryPlanCapture.capture() and its query
+    plan (a list of steps, empty if the statement has none)."""
+    _FULL_SCAN_REX = \
+        re.compile('^\\s*SCAN (?:TABLE )?(\\w+)(?: AS (\\w+))?$')
+    _TABLE_REX = re.compile('\\b(?:FROM|JOIN|UPDATE|INTO)\\s+(\\w+)' + \
+                            '(?:\\s+(?:AS\\s+)?(\\w+))?', re.IGNORECASE)
+    _NOT_ALIASES = set(('WHERE', 'JOIN', 'ON', 'LEFT', 'INNER', 'CROSS',
+                        'NATURAL', 'GROUP', 'ORDER', 'LIMIT', 'SET',
+                        'VALUES', 'USING', 'UNION', 'HAVING', 'SELECT'))
+
+    def __init__(self, sql, plan):
+        self.sql = sql
+        self.plan = plan or [ ]
+
+    @property
+    def full_scans(self):
+        """The tables the statement reads without an index."""
+        aliases = { }
+        for (table, alias) in self._TABLE_REX.findall(self.sql):
+            if alias and (alias.upper() not in self._NOT_ALIASES):
+                aliases[alias] = table
+        scanned = set()
+        for step in self.plan:
+            m = self._FULL_SCAN_REX.match(step)
+            if m:
+                name = m.group(1)
+                scanned.add(aliases.get(name, name))
+        return scanned
+
+    def __repr__(self):
+        return 'CapturedStatement(%r, %r)' % (self.sql, self.plan)
+
+class QueryPlanCapture(SqlTracer):
+    """A SqlTracer that keeps the statements run inside its capture() block,
+    with their query plans, so tests can check how SQLite runs them.  Pass
+    it to Database as its tracer."""
+    def __init__(self):
+        SqlTracer.__init__(self, slow_threshold = None)
+        self.statements = None
+
+    def record(self, connection, sql, variables, seconds, num_rows):
+        SqlTracer.record(self, connection, sql, variables, seconds, num_rows)
+        if self.statements is not None:
+            plan = query_plan(connection, sql, variables)
+            self.statements.append(CapturedStatement(sql, plan))
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Returns a context manager that yields the list the statements
+        run inside it are added to."""
+        self.statements = [ ]
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+
+class TemplateDatabase:
+    """A database that is built once per test run, the first time it is
+    needed, and copied for every test that uses it, which is much faster
+    than creating the tables and adding the default article types,
+    categories and venues again.  The database is created with
+    Database.create_new() and then handed to populate, if given, to add
+    more.  It is kept in a file on tmpfs if there is one."""
+    def __init__(self, name, populate = None):
+        self.name = name
+        self._populate = populate
+        self._filename = None
+
+    @property
+    def filename(self):
+        """The template's file, which must not be changed."""
+        if self._filename is None:
+            from stupendous_cow.db.main import Database
+            filename = os.path.join(_template_dir(), self.name + '.db')
+            db = Database.create_new(filename)
+            try:
+                if self._populate:
+                    self._populate(db)
+                db.commit()
+            finally:
+                db.close()
+            self._filename = filename
+        return self._filename
+
+    def connect(self):
+        """Returns a connection to a new copy of the template in memory."""
+        connection = sqlite3.connect(':memory:')
+        copy_database(self.filename, connection)
+        return connection
+
+    def open(self, tracer = None):
+        """Returns a Database on a new copy of the template in memory."""
+        from stupendous_cow.db.main import Database
+        return Database(':memory:', self.connect(), tracer = tracer)
+
+    def copy_to(self, filename):
+        """Copies the template to filename, for tests that need a database
+        file, and returns filename."""
+        shutil.copyfile(self.filename, filename)
+        return filename
+
+def copy_database(filename, connection):
+    """Copies the tables, indexes and triggers of the database in filename
+    and all of its rows into connection, which should be empty."""
+    source = sqlite3.connect(filename)
+    try:
+        if hasattr(source, 'backup'):
+            source.backup(connection)
+            return
+    finally:
+        source.close()
+
+    # No backup API before Python 3.7, so the template is attached and its
+    # tables copied with one INSERT each.  Indexes and triggers are created
+    # after the rows are in.
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None
+    try:
+        connection.execute('ATTACH DATABASE ? AS template', (filename, ))
+        try:
+            schema = connection.execute(\
+                "SELECT type, name, sql FROM template.sqlite_master " + \
+                "WHERE (sql IS NOT NULL) AND " + \
+                      "(substr(name, 1, 7) != 'sqlite_')").fetchall()
+            connection.execute('BEGIN')
+            for (kind, name, sql) in schema:
+                if kind == 'table':
+                    connection.execute(sql)
+                    connection.execute('INSERT INTO main.%s ' % name + \
+                                       'SELECT * FROM template.%s' % name)
+            for (kind, name, sql) in schema:
+                if kind != 'table':
+                    connection.execute(sql)
+            connection.execute('COMMIT')
+        finally:
+            connection.execute('DETACH DATABASE template')
+    finally:
+        connection.isolation_level = isolation_level
+
+_template_directory = None
+
+def _template_dir():
+    global _template_directory
+    if _template_directory is None:
+        tmpfs = '/dev/shm'
+        if not (os.path.isdir(tmpfs) and os.access(tmpfs, os.W_OK)):
+            tmpfs = None
+        _template_directory = tempfile.mkdtemp(prefix = 'stupendous_cow.',
+                                               dir = tmpfs)
+        atexit.register(shutil.rmtree, _template_directory, True)
+    return _template_directory
+
+# The database Database.create_new() makes, with the default article types,
+# categories and venues
+SEEDED_TEMPLATE = TemplateDatabase('seeded')
+
+_corpus_templates = { }
+
+def corpus_template(num_articles, **parameters):
+    """Returns the template of a seeded database with a synthetic corpus of
+    num_articles articles (see stupendous_cow.bench.corpus).  parameters are
+    passed on to CorpusParameters.  Each corpus is only generated once."""
+    key = (num_articles, ) + tuple(sorted(parameters.iteritems()))
+    try:
+        return _corpus_templates[key]
+    except KeyError:
+        # Imported here, so tests that use no corpus never load the
+        # benchmarks
+        from stupendous_cow.bench.corpus import CorpusParameters, \
+            generate_corpus
+        corpus = CorpusParameters(num_articles, **parameters)
+        name = 'corpus%d_%d' % (num_articles, len(_corpus_templates))
+        template = TemplateDatabase(name,
+                                    lambda db: generate_corpus(db, corpus))
+        _corpus_templates[key] = template
+        return template
+
 resource_dir = None
 
 def get_resource_dir():
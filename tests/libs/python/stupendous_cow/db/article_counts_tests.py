@@ -0,0 +1,168 @@
+"""Unit tests for the article_counts summary in stupendous_cow.db.main"""
+from stupendous_cow.data_model import Article
+from stupendous_cow.db.constraints import GreaterEqual, InRange
+from stupendous_cow.db.main import Database
+from stupendous_cow.testing import QueryPlanCapture, corpus_template
+import unittest
+
+class ArticleCountsTests(unittest.TestCase):
+    template = corpus_template(300, seed = 11, num_categories = 4)
+
+    def setUp(self):
+        self.capture = QueryPlanCapture()
+        self.db = self.template.open(tracer = self.capture)
+        self.plain_db = self.template.open()
+        self.assertFalse(self.db.article_counts.available)
+        self.db.article_counts.create()
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        self.plain_db.close()
+
+    def _rounded(self, rows):
+        return [ tuple(round(x, 9) if isinstance(x, float) else x \
+                           for x in row) for row in rows ]
+
+    def _verify_consistent(self):
+        self.assertEqual([ ], self.db.article_counts.check())
+
+    def _verify_uses_summary(self, statements):
+        self.assertTrue(statements)
+        for statement in statements:
+            self.assertIn('article_counts', statement.sql)
+            self.assertNotIn(' articles', statement.sql)
+
+    def test_create(self):
+        self.assertTrue(self.db.article_counts.available)
+        self._verify_consistent()
+        # Another Database on the same connection finds the summary
+        self.assertTrue(Database(':memory:', self.db._db).article_counts\
+                            .available)
+
+    def test_answers_from_summary(self):
+        venue = self.db.venues.all[0]
+        cases = [ ((), ('count', ), { }),
+                  (('venue', 'year'), ('count', 'sum(is_read)'), { }),
+                  (('category', ), ('count(category_id)', 'min(year)',
+                                    'max(year)', 'avg(year)'),
+                   { 'is_read' : False }),
+                  (('is_read', 'article_type'), ('total(year)', ),
+                   { 'year' : InRange(2012, 2016), 'venue' : venue }),
+                  (('year', ), ('count', ), { 'year' : 1999 }) ]
+        for (group_by, metrics, criteria) in cases:
+            with self.capture.capture() as statements:
+                result = self.db.articles.aggregate(group_by = group_by,
+                                                    metrics = metrics,
+                                                    **criteria)
+            self._verify_uses_summary(statements)
+            truth = self.plain_db.articles.aggregate(group_by = group_by,
+                                                     metrics = metrics,
+                                                     **criteria)
+            self.assertEqual([ tuple(getattr(x, 'id', x) for x in row) \
+                                   for row in self._rounded(truth) ],
+                             [ tuple(getattr(x, 'id', x) for x in row) \
+                                   for row in self._rounded(result) ])
+
+        for table in (self.db.article_types, self.db.categories,
+                      self.db.venues):
+            for item in table.all:
+                with self.capture.capture() as statements:
+                    n = table.count_references_to(item)
+                self._verify_uses_summary(statements)
+                plain_table = getattr(self.plain_db, table._table_name)
+                self.assertEqual(plain_table.count_references_to(item), n)
+
+        with self.capture.capture() as statements:
+            self.assertEqual(self.plain_db.articles.count(year = 2013,
+                                                          is_read = True),
+                             self.db.articles.count(year = 2013,
+                                                    is_read = True))
+        self._verify_uses_summary(statements)
+
+    def test_other_columns_read_articles(self):
+        with self.capture.capture() as statements:
+            self.assertEqual(self.plain_db.articles.count(priority = 3),
+                             self.db.articles.count(priority = 3))
+            self.db.articles.aggregate(group_by = 'venue',
+                                       metrics = 'avg(priority)')
+            self.db.articles.aggregate(group_by = 'year',
+                                       priority = GreaterEqual(5))
+        self.assertEqual(3, len(statements))
+        for statement in statements:
+            self.assertNotIn('article_counts', statement.sql)
+
+    def test_triggers(self):
+        articles = self.db.articles
+        venues = self.db.venues.all
+        article = articles.with_id(articles.ids[0])
+        added = articles.add(Article('Cows Count', 'Moo', 'Moo', 1999, 1,
+                                     None, None, None, None, venues[0]))
+        self._verify_consistent()
+        self.assertEqual(1, articles.count(year = 1999))
+
+        article.venue = venues[-1]
+        article.is_read = not article.is_read
+        article.category = None
+        articles.update(article)
+        self._verify_consistent()
+        article.summary = 'Unchanged counts'
+        articles.update(article)
+        self._verify_consistent()
+
+        articles.delete(added.id)
+        articles.delete(articles.ids[1])
+        self._verify_consistent()
+        self.assertEqual(0, articles.count(year = 1999))
+        self.assertEqual([ ], articles.aggregate(group_by = 'venue',
+                                                 year = 1999))
+
+        articles.add_all([ Article('Cows Count %d' % i, 'Moo', 'Moo', 2000,
+                                   1, None, None, None, None, venues[i % 2]) \
+                               for i in xrange(5) ])
+        self._verify_consistent()
+        self.assertEqual([ (venues[0], 3), (venues[1], 2) ],
+                         articles.aggregate(group_by = 'venue', year = 2000))
+
+    def test_check_and_rebuild(self):
+        cursor = self.db._db.cursor()
+        try:
+            cursor.execute('SELECT venue_id, year, category_id, ' \
+                           'article_type_id, is_read, num_articles ' \
+                           'FROM article_counts LIMIT 1')
+            row = cursor.fetchone()
+            cursor.execute('UPDATE article_counts SET num_articles = 999 ' \
+                           'WHERE (venue_id IS ?) AND (year IS ?) AND ' \
+                           '(category_id IS ?) AND (article_type_id IS ?) ' \
+                           'AND (is_read IS ?)', row[:-1])
+            cursor.execute("INSERT INTO article_counts " \
+                           "VALUES (NULL, 1999, NULL, NULL, 'N', 1)")
+        finally:
+            cursor.close()
+        self.assertEqual([ (None, 1999, None, None, 'N', 0, 1),
+                           row[:-1] + (row[-1], 999) ],
+                         self.db.article_counts.check())
+        self.assertTrue(self.db.article_counts.rebuild() > 0)
+        self._verify_consistent()
+
+    def test_drop(self):
+        self.db.article_counts.drop()
+        self.assertFalse(self.db.article_counts.available)
+        venue = self.db.venues.all[0]
+        self.assertEqual(self.plain_db.venues.count_references_to(venue),
+                         self.db.venues.count_references_to(venue))
+        self.db.articles.add(Article('No More Counts', 'Moo', 'Moo', 1999, 1,
+                                     None, None, None, None, venue))
+
+    def test_dropped_by_another_connection(self):
+        Database(':memory:', self.db._db).article_counts.drop()
+        self.assertTrue(self.db.article_counts.available)
+
+        self.assertEqual(self.plain_db.articles.count(year = 2013),
+                         self.db.articles.count(year = 2013))
+        self.assertFalse(self.db.article_counts.available)
+        self.assertEqual(self.plain_db.articles.aggregate(group_by = 'year'),
+                         self.db.articles.aggregate(group_by = 'year'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Unit tests for stupendous_cow.db.catalog"""
+from stupendous_cow.data_model import Article
+from stupendous_cow.db.catalog import numpy
+from stupendous_cow.db.constraints import GreaterEqual, GreaterThan, InRange, \
+    IsNull, LessThan, NotNull
+from stupendous_cow.testing import corpus_template
+import unittest
+
+class ArticleCatalogTests(unittest.TestCase):
+    use_numpy = False
+    template = corpus_template(300, seed = 5, num_categories = 4)
+
+    def setUp(self):
+        self.db = self.template.open()
+        self.catalog = self.db.article_catalog(use_numpy = self.use_numpy)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _verify_select(self, **criteria):
+        with self.db.articles.retrieve(**criteria) as rs:
+            truth = sorted(a.id for a in rs)
+        self.assertEqual(truth, sorted(self.catalog.select(**criteria)))
+        self.assertEqual(len(truth), self.catalog.count(**criteria))
+        return truth
+
+    def test_load(self):
+        self.assertEqual(self.use_numpy, self.catalog.uses_numpy)
+        self.assertEqual(300, len(self.catalog))
+        self.assertEqual(sorted(self.db.articles.ids), sorted(self.catalog.ids))
+        article = self.db.articles.with_id(self.catalog.ids[0])
+        self.assertEqual({ 'year' : article.year,
+                           'priority' : article.priority,
+                           'is_read' : article.is_read,
+                           'article_type_id' : article.article_type.id,
+                           'category_id' : article.category.id,
+                           'venue_id' : article.venue.id },
+                         self.catalog.get(article.id))
+        self.assertIsNone(self.catalog.get(-1))
+
+    def test_select(self):
+        venues = self.db.venues.all
+        self.assertEqual(300, len(self._verify_select()))
+        self.assertTrue(self._verify_select(year = 2012))
+        self.assertTrue(self._verify_select(year = InRange(2012, 2015),
+                                            is_read = False))
+        self.assertTrue(self._verify_select(priority = GreaterThan(6),
+                                            venue = venues[0]))
+        self.assertTrue(self._verify_select(priority = LessThan(3),
+                                            year = GreaterEqual(2016),
+                                            is_read = True))
+        self.assertTrue(self._verify_select(venue = venues[:2],
+                                            category_id = (1, 2, 3)))
+        self.assertTrue(self._verify_select(article_type_id = NotNull))
+        self.assertFalse(self._verify_select(category_id = IsNull))
+        self.assertFalse(self._verify_select(year = 1999))
+
+    def test_nulls(self):
+        venue = self.db.venues.all[0]
+        article = self.db.articles.add(\
+            Article('Null And Void', 'Nothing', 'Nothing', 2013, None, None,
+                    None, None, None, venue))
+        self.catalog.refresh()
+        self.assertEqual([ article.id ],
+                         self._verify_select(category_id = IsNull))
+        self.assertEqual([ article.id ],
+                         self._verify_select(priority = None, year = 2013))
+        self.assertNotIn(article.id,
+                         self._verify_select(priority = LessThan(5)))
+        self.assertNotIn(article.id, self._verify_select(priority = (None, 1)))
+
+    def test_refresh(self):
+        self.assertEqual(0, self.catalog.refresh())
+
+        article = self.db.articles.with_id(self.catalog.ids[0])
+        article.year = 1999
+        article.is_read = not article.is_read
+        self.db.articles.update(article)
+        deleted_id = self.catalog.ids[1]
+        self.db.articles.delete(deleted_id)
+        added = self.db.articles.add(\
+            Article('Cows In The Catalog', 'Moo', 'Moo', 1999, 3, None, None,
+                    article.article_type, article.category, article.venue))
+        self.db.commit()
+
+        self.assertEqual(3, self.catalog.refresh())
+        self.assertEqual(300, len(self.catalog))
+        self.assertNotIn(deleted_id, self.catalog)
+        self.assertIsNone(self.catalog.get(deleted_id))
+        self.assertEqual(sorted([ article.id, added.id ]),
+                         self._verify_select(year = 1999))
+        self.assertEqual(article.is_read,
+                         self.catalog.get(article.id)['is_read'])
+        self.assertEqual(0, self.catalog.refresh())
+
+    def test_invalid_criteria(self):
+        with self.assertRaises(ValueError):
+            self.catalog.select(title = 'Moo')
+        with self.assertRaises(ValueError):
+            self.catalog.select(year = 'Moo')
+        with self.assertRaises(ValueError):
+            self.catalog.select(venue = 'Moo')
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class NumpyArticleCatalogTests(ArticleCatalogTests):
+    use_numpy = True
+
+if __name__ == '__main__':
+    unittest.main()
@@ -425,6 +425,11 @@ class NextItemIdTests(DatabaseTestCase):
         self.assertEqual(2, next_item_id(self.db, 'cows'))
         self.assertEqual(1, next_item_id(self.db, 'penguins'))
 
+    def test_next_ids(self):
+        self.assertEqual(1, next_item_ids(self.db, 'ducks', 3))
+        self.assertEqual(4, next_item_ids(self.db, 'ducks', 2))
+        self.assertEqual(6, next_item_id(self.db, 'ducks'))
+
     @classmethod
     def setUpDatabase(cls, cursor):
         cursor.execute("""
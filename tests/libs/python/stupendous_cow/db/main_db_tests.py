@@ -5,7 +5,7 @@ from stupendous_cow.db.main import Database, _Articles, _ArticleTypes, \
                                    _Categories, _Venues
 from stupendous_cow.data_model import Article, ArticleType, Category, Venue
 from stupendous_cow.util import normalize_title
-from stupendous_cow.testing import DatabaseTestCase
+from stupendous_cow.testing import DatabaseTestCase, SEEDED_TEMPLATE
 import datetime
 import unittest
 
@@ -164,6 +164,31 @@ class ArticleTableTests(DatabaseTestCase):
         n = self.table.count(priority = None)
         self.assertEqual(0, n)
 
+    def test_aggregate(self):
+        self.assertEqual([ (self.venues[0], 2018, 1, 0, 9.0),
+                           (self.venues[1], 2016, 1, 1, 3.0),
+                           (self.venues[2], 2017, 1, 1, 11.0),
+                           (self.venues[2], 2018, 1, 0, 5.0) ],
+                         self.table.aggregate(group_by = ('venue', 'year'),
+                                              metrics = ('count',
+                                                         'sum(is_read)',
+                                                         'avg(priority)')))
+        self.assertEqual([ (False, 2), (True, 1) ],
+                         self.table.aggregate(group_by = 'is_read',
+                                              year = GreaterEqual(2017)))
+        self.assertEqual([ (self.categories[1], 2) ],
+                         self.table.aggregate(group_by = 'category',
+                                              article_type = \
+                                                  self.article_types[0]))
+        self.assertEqual([ (4, 2018) ],
+                         self.table.aggregate(metrics = ('count',
+                                                         'MAX(year)')))
+        for metric in ('median(year)', 'sum(*)', 'sum(moo)', 'year'):
+            with self.assertRaises(ValueError):
+                self.table.aggregate(metrics = metric)
+        with self.assertRaises(ValueError):
+            self.table.aggregate(group_by = 'moo')
+
     def test_retrieve(self):
         with self.table.retrieve(venue = self.venues[2], year = 2018) as rs:
             result = [ x for x in rs ]
@@ -454,13 +479,18 @@ class MainDatabaseTests(DatabaseTestCase):
                       'venue', 'summary', 'is_read', 'created_at',
                       'last_updated_at', 'last_indexed_at')
 
+    @classmethod
+    def setUpClass(cls):
+        pass    # Every test gets its own copy of the seeded database
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
     def setUp(self):
+        self.db = SEEDED_TEMPLATE.connect()
         self.main_db = Database(':memory:', self.db)
 
-        Database._populate_article_types(self.main_db)
-        Database._populate_categories(self.main_db)
-        Database._populate_venues(self.main_db)
-
         self.default_article_types = [ ArticleType('', 1),
                                        ArticleType('Poster', 2),
                                        ArticleType('Oral', 3),
@@ -488,16 +518,7 @@ class MainDatabaseTests(DatabaseTestCase):
         self.default_articles = [ ]
 
     def tearDown(self):
-        cursor = self.db.cursor()
-        try:
-            cursor.execute("DELETE FROM articles")
-            cursor.execute("DELETE FROM venues")
-            cursor.execute("DELETE FROM categories")
-            cursor.execute("DELETE FROM article_types")
-            cursor.execute("DELETE FROM id_sequence")
-            self.db.commit()
-        finally:
-            cursor.close()
+        self.main_db.close()
 
     def test_default_article_types(self):
         self._verify_article_types(self.default_article_types,
@@ -613,6 +634,130 @@ class MainDatabaseTests(DatabaseTestCase):
         n = self.main_db.venues.count_references_to(self.default_venues[1])
         self.assertEqual(1, n)
 
+    def test_reference_counts_and_delete_unreferenced(self):
+        categories = self.main_db.categories
+        cat1 = categories.add(Category('Architecture'))
+        cat2 = categories.add(Category('RL'))
+        for venue in self.default_venues[1:3]:
+            self.main_db.articles.add(\
+                Article('My Title', 'My Abstract', 'My Content', 2017, 4,
+                        None, None, self.default_article_types[3], cat2,
+                        venue))
+        self.main_db.articles.add(\
+            Article('Other Title', 'My Abstract', 'My Content', 2017, 4,
+                    None, None, None, None, self.default_venues[1]))
+        self.main_db.commit()
+
+        self.assertEqual({ 1 : 0, cat1.id : 0, cat2.id : 2 },
+                         categories.reference_counts())
+        venue_counts = self.main_db.venues.reference_counts()
+        self.assertEqual(len(self.default_venues), len(venue_counts))
+        self.assertEqual(2, venue_counts[self.default_venues[1].id])
+        self.assertEqual(1, venue_counts[self.default_venues[2].id])
+        self.assertEqual(3, sum(venue_counts.values()))
+
+        self.assertEqual([ cat1 ], categories.delete_unreferenced())
+        self.main_db.commit()
+        self.assertEqual([ self.default_categories[0], cat2 ], categories.all)
+        self.assertIsNone(categories.with_id(cat1.id))
+        self.assertEqual(self.default_categories[0], categories.with_name(''))
+        self.assertEqual([ self.default_categories[0], cat2 ],
+                         Database(':memory:', self.db).categories.all)
+        self.assertEqual([ ], categories.delete_unreferenced())
+
+        types = self.main_db.article_types
+        poster = self.default_article_types[1]
+        self.assertEqual(len(self.default_article_types) - 3,
+                         len(types.delete_unreferenced(\
+                             keep = lambda x: x.name == poster.name)))
+        self.assertEqual([ self.default_article_types[0], poster,
+                           self.default_article_types[3] ], types.all)
+
+        self.assertEqual([ ], self.main_db.venues.delete_unreferenced())
+        self.assertEqual(self.default_venues, self.main_db.venues.all)
+        venue = self.main_db.venues.add(Venue('Cow Conference', 'COW'))
+        self.assertEqual([ venue ],
+                         self.main_db.venues.delete_unreferenced())
+
+    def test_delete_unreferenced_keeps_seeded_defaults(self):
+        db = SEEDED_TEMPLATE.open()
+        try:
+            architecture = db.categories.add(Category('Architecture'))
+            self.assertEqual([ architecture ],
+                             db.categories.delete_unreferenced())
+            self.assertEqual(len(self.default_article_types) - 1,
+                             len(db.article_types.delete_unreferenced()))
+            self.assertEqual([ ], db.venues.delete_unreferenced())
+            db.commit()
+
+            reread = Database(':memory:', db._db)
+            self.assertEqual(self.default_article_types[0],
+                             reread.article_types.with_name(''))
+            self.assertEqual(self.default_categories, reread.categories.all)
+            self.assertEqual(self.default_venues, reread.venues.all)
+        finally:
+            db.close()
+
+    def test_article_fingerprints(self):
+        venue = self.default_venues[1]
+        articles = [ ]
+        for title in ('My Title', 'My Other Title'):
+            article = Article(title, 'My Abstract', 'My Content', 2017, 4,
+                              'MyDocument', None, self.default_article_types[3],
+                              None, venue, 'My summary')
+            articles.append(self.main_db.articles.add(article))
+        fingerprints = self.main_db.article_fingerprints
+        fingerprints.set(articles[0].id, 'abc')
+        fingerprints.set(articles[1].id, 'def')
+        self.main_db.commit()
+
+        self.assertEqual(set([ 'abc', 'def' ]), fingerprints.current(venue,
+                                                                     2017))
+        self.assertEqual(set(), fingerprints.current(venue, 2018))
+        self.assertEqual(set(), fingerprints.current(self.default_venues[0],
+                                                     2017))
+
+        fingerprints.set(articles[0].id, 'ghi')
+        self.assertEqual(set([ 'ghi', 'def' ]), fingerprints.current(venue,
+                                                                     2017))
+
+        self.main_db.articles.delete(articles[1].id)
+        self.assertEqual(set([ 'ghi' ]), fingerprints.current(venue, 2017))
+
+    def test_import_runs(self):
+        runs = self.main_db.import_runs
+        self.assertEqual([ ], runs.all)
+
+        for (n, elapsed) in enumerate((1.5, 2.5)):
+            runs.add({ 'importer' : 'generic_ss_importer',
+                       'started_at' : '2018-06-0%dT12:00:00' % (n + 1),
+                       'elapsed' : elapsed, 'num_rows' : 10 * (n + 1),
+                       'stages' : { 'db_save' : { 'seconds' : elapsed,
+                                                  'calls' : 10 } } })
+        self.main_db.commit()
+
+        reports = runs.all
+        self.assertEqual([ 1.5, 2.5 ], [ r['elapsed'] for r in reports ])
+        self.assertEqual([ 10, 20 ], [ r['num_rows'] for r in reports ])
+        self.assertEqual(2.5, reports[1]['stages']['db_save']['seconds'])
+        self.assertTrue(reports[0]['id'] < reports[1]['id'])
+
+    def test_upgrade_schema(self):
+        def has_import_runs():
+            cursor = self.db.cursor()
+            try:
+                cursor.execute("SELECT count(*) FROM sqlite_master " + \
+                               "WHERE name = 'import_runs'")
+                return bool(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+
+        self.db.execute('DROP TABLE import_runs')
+        Database(':memory:', self.db, upgrade_schema = False)
+        self.assertFalse(has_import_runs())
+        Database(':memory:', self.db)
+        self.assertTrue(has_import_runs())
+
     def _verify_articles(self, truth, articles):
         def compute_article_diffs(left, right):
             return self._compute_item_diffs(left, right, self.article_fields)
@@ -631,9 +776,5 @@ class MainDatabaseTests(DatabaseTestCase):
                                                           'abbreviation'))
         self._verify_item_list('venues', truth, venues, compute_venue_diffs)
 
-    @classmethod
-    def setUpDatabase(cls, cursor):
-        Database._create_tables(cursor)
-        
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+"""Checks that the statements the database and the importers run most often
+use an index rather than scanning the articles table."""
+from stupendous_cow.data_model import Article
+from stupendous_cow.importer.generic_ss.director import save_article
+from stupendous_cow.testing import CapturedStatement, DatabaseTestCase, \
+    QueryPlanCapture, TemplateDatabase
+from stupendous_cow.util import normalize_title
+import unittest
+
+def _add_articles(db):
+    article_types = db.article_types.all
+    venues = db.venues.all
+    for i in xrange(200):
+        db.articles.add(Article('Cows Are Cool, Part %d' % i, 'Moo', 'Moo',
+                                2015 + i % 4, 1, None, None,
+                                article_types[i % len(article_types)],
+                                db.categories.with_name(''),
+                                venues[i % len(venues)]))
+
+QUERY_PLAN_TEMPLATE = TemplateDatabase('query_plans', _add_articles)
+
+class QueryPlanTests(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        pass    # Every test gets its own copy of the template
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+    def setUp(self):
+        self.capture = QueryPlanCapture()
+        self.database = QUERY_PLAN_TEMPLATE.open(tracer = self.capture)
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_retrieve_by_natural_key(self):
+        venue = self.database.venues.with_abbreviation('ICML')
+        with self.capture.capture() as statements:
+            with self.database.articles.retrieve(\
+                    normalized_title = normalize_title('Cows Are Cool, Part 3'),
+                    year = 2018, venue = venue) as rs:
+                self.assertEqual([ 'Cows Are Cool, Part 3' ],
+                                 [ a.title for a in rs ])
+        self._verify_no_full_scans(statements, 'articles')
+
+    def test_count_references_to(self):
+        for table in (self.database.article_types, self.database.categories,
+                      self.database.venues):
+            with self.capture.capture() as statements:
+                self.assertTrue(table.count_references_to(table.all[0]) > 0)
+            self._verify_no_full_scans(statements, 'articles')
+
+    def test_reference_counts(self):
+        for table in (self.database.article_types, self.database.categories,
+                      self.database.venues):
+            with self.capture.capture() as statements:
+                self.assertEqual(200, sum(table.reference_counts().values()))
+            self.assertEqual(1, len(statements))
+            self._verify_no_full_scans(statements, 'articles')
+
+    def test_need_reindexing(self):
+        with self.capture.capture() as statements:
+            self.assertEqual(200, len(list(\
+                self.database.articles.need_reindexing())))
+        self._verify_no_full_scans(statements, 'articles')
+
+    def test_save_article(self):
+        venue = self.database.venues.with_abbreviation('NIPS')
+        article = Article('Penguins Are Cute', 'Squawk', 'Squawk', 2017, 1,
+                          None, None, self.database.article_types.all[0],
+                          self.database.categories.with_name(''), venue)
+        with self.capture.capture() as statements:
+            article_id = save_article(self.database, article, 'fp1')
+            article.title = 'Penguins are cute'
+            self.assertEqual(article_id,
+                             save_article(self.database, article, 'fp2'))
+            self.assertEqual(set([ 'fp2' ]),
+                             self.database.article_fingerprints.current(\
+                                 venue, 2017))
+        self._verify_no_full_scans(statements, 'articles',
+                                   'article_fingerprints')
+
+    def test_aggregate(self):
+        with self.capture.capture() as statements:
+            rows = self.database.articles.aggregate(group_by = ('venue',
+                                                                'year'))
+        self.assertEqual(200, sum(n for (venue, year, n) in rows))
+        self._verify_no_full_scans(statements, 'articles')
+
+    def test_catalog_refresh(self):
+        catalog = self.database.article_catalog()
+        with self.capture.capture() as statements:
+            self.assertEqual(0, catalog.refresh())
+        self._verify_no_full_scans(statements, 'articles')
+
+    def test_full_scans_are_caught(self):
+        with self.capture.capture() as statements:
+            self.database.articles.count(summary = 'Moo')
+        self.assertEqual(set([ 'articles' ]), statements[0].full_scans)
+        with self.assertRaises(AssertionError):
+            self._verify_no_full_scans(statements, 'articles')
+
+    def test_aliases(self):
+        statement = CapturedStatement(\
+            'SELECT f.x FROM fingerprints f JOIN articles AS a ON a.id = f.id',
+            [ 'SCAN a', 'SEARCH f USING INDEX fp (id=?)' ])
+        self.assertEqual(set([ 'articles' ]), statement.full_scans)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Unit tests for stupendous_cow.db.segment"""
+from stupendous_cow.data_model import Article
+from stupendous_cow.db.segment import MetadataSegment, segment_generation
+from stupendous_cow.testing import corpus_template
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class MetadataSegmentTests(unittest.TestCase):
+    template = corpus_template(100, seed = 7, num_categories = 3)
+
+    def setUp(self):
+        self.db = self.template.open()
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'metadata.seg')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_export_and_read(self):
+        self.assertEqual(0, segment_generation(self.filename))
+        self.assertEqual(1, self.db.export_segment(self.filename))
+        segment = MetadataSegment(self.filename)
+        self.assertEqual(1, segment.generation)
+        self.assertEqual(100, len(segment))
+        self.assertEqual(sorted(self.db.articles.ids), list(segment.ids))
+        self.assertEqual([ (v.id, v.name, v.abbreviation) \
+                               for v in self.db.venues.all ],
+                         [ (v.id, v.name, v.abbreviation) \
+                               for v in segment.venues ])
+        self.assertEqual([ (c.id, c.name) for c in self.db.categories.all ],
+                         [ (c.id, c.name) for c in segment.categories ])
+        self.assertEqual(len(self.db.article_types.all),
+                         len(segment.article_types))
+
+        for article in self.db.articles.all:
+            self.assertEqual({ 'title' : article.title,
+                               'year' : article.year,
+                               'priority' : article.priority,
+                               'is_read' : article.is_read,
+                               'article_type_id' : article.article_type.id,
+                               'category_id' : article.category.id,
+                               'venue_id' : article.venue.id },
+                             segment.get(article.id))
+        years = segment.column('year')
+        i = segment.position(segment.ids[-1])
+        self.assertEqual(99, i)
+        self.assertEqual(self.db.articles.with_id(segment.ids[-1]).year,
+                         years[-1])
+        self.assertIsNone(segment.get(-1))
+        self.assertNotIn(-1, segment)
+        with self.assertRaises(ValueError):
+            segment.column('title')
+
+    def test_refresh(self):
+        self.db.export_segment(self.filename)
+        segment = MetadataSegment(self.filename)
+        old_ids = segment.ids
+        self.assertFalse(segment.refresh())
+
+        venue = self.db.venues.all[0]
+        added = self.db.articles.add(\
+            Article(u'Cows \xe0 la Carte', 'Moo', 'Moo', 2011, None, None,
+                    None, None, None, venue))
+        self.db.commit()
+        self.assertEqual(2, self.db.export_segment(self.filename))
+        self.assertEqual([ self.filename ],
+                         [ os.path.join(self.directory, f) \
+                               for f in os.listdir(self.directory) ])
+
+        self.assertIsNone(segment.get(added.id))
+        self.assertTrue(segment.refresh())
+        self.assertEqual(2, segment.generation)
+        self.assertEqual(101, len(segment))
+        self.assertEqual({ 'title' : u'Cows \xe0 la Carte', 'year' : 2011,
+                           'priority' : None, 'is_read' : False,
+                           'article_type_id' : None, 'category_id' : None,
+                           'venue_id' : venue.id },
+                         segment.get(added.id))
+        # Columns of the old generation can still be read
+        self.assertEqual(100, len(old_ids))
+        self.assertEqual(sorted(old_ids), list(old_ids))
+        self.assertFalse(segment.refresh())
+
+    def test_invalid_segment(self):
+        with open(self.filename, 'w') as output:
+            output.write('Moo' * 100)
+        with self.assertRaises(ValueError):
+            MetadataSegment(self.filename)
+        self.assertEqual(0, segment_generation(self.filename))
+        self.assertEqual(1, self.db.export_segment(self.filename))
+
+if __name__ == '__main__':
+    unittest.main()
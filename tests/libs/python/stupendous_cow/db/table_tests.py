@@ -3,6 +3,7 @@
 from stupendous_cow.db.tables import *
 from stupendous_cow.db.core import ResultSet, OneColumnResultSet, execute_count
 from stupendous_cow.testing import DatabaseTestCase
+import stupendous_cow.db.tables as tables
 import unittest
 
 class Department:
@@ -148,6 +149,18 @@ class TableTests(DatabaseTestCase):
         self.assertEqual(2, self.table.count(department = cow_department,
                                              name = ('Tom', 'Cheryl', 'John')))
 
+    def test_aggregate(self):
+        self.assertEqual([ (1, 3, 'John'), (2, 2, 'Alan') ],
+                         self.table.aggregate(group_by = 'dept_id',
+                                              metrics = ('count',
+                                                         'min(name)')))
+        self.assertEqual([ (5, ) ], self.table.aggregate())
+        self.assertEqual([ (1, 2) ],
+                         self.table.aggregate(\
+                             group_by = ('dept_id', ),
+                             department = EmployeeTable.departments[0],
+                             name = ('Tom', 'Cheryl', 'John')))
+
     def test_retrieve(self):
         depts = EmployeeTable.departments
         emps = self.all_employees
@@ -195,6 +208,23 @@ class TableTests(DatabaseTestCase):
         self.assertEqual(EmployeeTable.departments[0], created.dept)
         self.assertEqual(self.all_employees + [ created ], self._retrieve_all())
 
+    def test_add_all(self):
+        depts = EmployeeTable.departments
+        created = self.table.add_all([ Employee(None, 'Margaret', depts[1]),
+                                       Employee(None, 'Marcus', None) ])
+
+        self.assertEqual([ 6, 7 ], [ x.id for x in created ])
+        self.assertEqual([ 'Margaret', 'Marcus' ], [ x.name for x in created ])
+        self.assertEqual([ depts[1], depts[0] ], [ x.dept for x in created ])
+        self.assertEqual(self.all_employees + created, self._retrieve_all())
+        self.assertEqual([ ], self.table.add_all([ ]))
+
+    def test_add_all_with_existing_employee(self):
+        with self.assertRaises(ValueError):
+            self.table.add_all([ Employee(None, 'Marcus', None),
+                                 self.all_employees[0] ])
+        self.assertEqual(self.all_employees, self._retrieve_all())
+
     def test_update(self):
         emp = self.all_employees[0]
         emp.name = 'Thomas'
@@ -326,6 +356,37 @@ class EnumTableTests(DatabaseTestCase):
         with self.assertRaises(ValueError):
             self.table.add(Department(None, self.all_depts[0].name))
 
+    def test_add_all(self):
+        new_depts = [ Department(None, 'USH'), Department(None, 'WRK') ]
+        created = self.table.add_all(new_depts)
+
+        self.assertEqual([ 4, 5 ], [ x.id for x in created ])
+        self.assertEqual([ 'USH', 'WRK' ], [ x.name for x in created ])
+        self.assertEqual(self.all_depts + created, self._retrieve_all())
+        self.assertEqual(self.all_depts + created, self.table.all)
+        for dept in created:
+            self.assertEqual(dept, self.table.with_id(dept.id))
+            self.assertEqual(dept, self.table.with_name(dept.name))
+
+        self.assertEqual(Department(6, 'NXT'),
+                         self.table.add(Department(None, 'NXT')))
+
+    def test_add_all_with_no_items(self):
+        self.assertEqual([ ], self.table.add_all([ ]))
+        self.assertEqual(self.all_depts, self._retrieve_all())
+
+    def test_add_all_with_existing_name(self):
+        with self.assertRaises(ValueError):
+            self.table.add_all([ Department(None, 'USH'),
+                                 Department(None, self.all_depts[0].name) ])
+        self.assertEqual(self.all_depts, self._retrieve_all())
+
+    def test_add_all_with_duplicate_names(self):
+        with self.assertRaises(ValueError):
+            self.table.add_all([ Department(None, 'USH'),
+                                 Department(None, 'USH') ])
+        self.assertEqual(self.all_depts, self._retrieve_all())
+
     def test_update(self):
         dept = self.all_depts[0]
         old_name = dept.name
@@ -360,6 +421,50 @@ class EnumTableTests(DatabaseTestCase):
         self.assertEqual(None, self.table.with_id(to_delete.id))
         self.assertEqual(None, self.table.with_name(to_delete.name))
 
+    def test_reference_counts(self):
+        self.assertEqual({ 1 : 1, 2 : 1, 3 : 0 },
+                         self.table.reference_counts())
+
+    def test_delete_unreferenced(self):
+        remaining = self.all_depts[:2]
+        self.assertEqual([ self.all_depts[2] ],
+                         self.table.delete_unreferenced())
+        self.assertEqual(remaining, self._retrieve_all())
+        self.assertEqual(remaining, sorted(self.table.all,
+                                           key = lambda x: x.id))
+        self.assertEqual(None, self.table.with_id(3))
+        self.assertEqual(None, self.table.with_name('ZZZ'))
+        self.assertEqual([ ], self.table.delete_unreferenced())
+
+    def test_delete_more_unreferenced_than_one_statement_can_hold(self):
+        new_depts = self.table.add_all([ Department(None, 'D%d' % n) \
+                                             for n in xrange(1200) ])
+        self.db.commit()
+        self.table._count_references_to = lambda item_id: item_id <= 2
+
+        num_ids = [ ]
+        def count_ids(db, table, criteria):
+            num_ids.append(len(criteria['id']))
+            original(db, table, criteria)
+        original = tables.execute_delete
+        tables.execute_delete = count_ids
+        try:
+            deleted = self.table.delete_unreferenced()
+        finally:
+            tables.execute_delete = original
+
+        self.assertEqual([ 500, 500, 201 ], num_ids)
+        self.assertEqual([ 3 ] + [ x.id for x in new_depts ],
+                         sorted(x.id for x in deleted))
+        self.db.commit()
+        self.assertEqual(self.all_depts[:2], self._retrieve_all())
+
+    def test_rollback_undoes_delete_unreferenced(self):
+        self.assertEqual([ self.all_depts[2] ],
+                         self.table.delete_unreferenced())
+        self.db.rollback()
+        self.assertEqual(self.all_depts, self._retrieve_all())
+
     def test_delete_item_with_no_id(self):
         with self.assertRaises(ValueError):
             self.table.delete(Department(None, 'ZZZ'))
@@ -0,0 +1,147 @@
+"""Unit tests for stupendous_cow.db.tracing"""
+from stupendous_cow.db.tracing import *
+from stupendous_cow.db.core import execute_count, execute_dml, \
+    execute_insert, execute_select, next_item_id, create_id_sequence_table
+from stupendous_cow.db.main import Database
+from stupendous_cow.data_model import Venue
+from stupendous_cow.testing import SEEDED_TEMPLATE
+import logging
+import os
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+class NormalizeStatementTests(unittest.TestCase):
+    def test_literals(self):
+        self.assertEqual('SELECT id FROM items WHERE (name = ?) AND (code = ?)',
+                         normalize_statement(\
+            "SELECT id FROM items\n  WHERE (name = 'It''s') AND (code = 12)"))
+        self.assertEqual('UPDATE t1 SET x = ?, y = NULL WHERE id = ?',
+                         normalize_statement(\
+            "UPDATE t1 SET x = 1.5e3, y = NULL WHERE id = ?;"))
+
+    def test_in_lists(self):
+        self.assertEqual('SELECT id FROM items WHERE id IN (...)',
+                         normalize_statement(\
+            'SELECT id FROM items WHERE id IN (1, 2, 3)'))
+        self.assertEqual(normalize_statement('SELECT a FROM b WHERE a IN (1)'),
+                         normalize_statement(\
+            "SELECT a FROM b WHERE a IN ('x', 'y')"))
+
+class SqlTracerTests(unittest.TestCase):
+    def setUp(self):
+        self.tracer = SqlTracer(slow_threshold = None)
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE items (id NUMBER, name VARCHAR(16))')
+        create_id_sequence_table(connection.cursor())
+        self.db = self.tracer.trace(connection)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_statistics(self):
+        for i in xrange(3):
+            execute_insert(self.db, 'items',
+                           { 'id' : i, 'name' : 'item%d' % i })
+        self.db.commit()
+        self.assertEqual(3, execute_count(self.db, 'items', { }))
+        items = list(execute_select(self.db, 'items', ('id', 'name'), { }))
+        self.assertEqual(3, len(items))
+        execute_dml(self.db, 'DELETE FROM items WHERE id > ?', (0, ))
+
+        shapes = self.tracer.shapes
+        [ insert ] = [ stats for (shape, stats) in shapes.iteritems() \
+                           if shape.startswith('INSERT INTO items') ]
+        self.assertEqual(3, insert.count)
+        self.assertEqual(3, insert.rows)
+        self.assertEqual(1, shapes['COMMIT'].count)
+        self.assertEqual((1, 1),
+                         self._count_and_rows('SELECT count(*) FROM items'))
+        self.assertEqual((1, 3),
+                         self._count_and_rows('SELECT id, name FROM items'))
+        self.assertEqual((1, 2),
+                         self._count_and_rows('DELETE FROM items WHERE id > ?'))
+        for stats in shapes.values():
+            self.assertTrue(stats.max <= stats.total)
+            self.assertTrue(stats.mean <= stats.max)
+
+    def test_cursor_with_several_statements(self):
+        self.assertEqual(1, next_item_id(self.db, 'items'))
+        self.assertEqual(2, next_item_id(self.db, 'items'))
+        self.assertEqual((2, 1), self._count_and_rows(\
+            'SELECT id FROM id_sequence WHERE table_name = ?'))
+        self.assertEqual((1, 1), self._count_and_rows(\
+            'INSERT INTO id_sequence VALUES(?, ?)'))
+        self.assertEqual((1, 1), self._count_and_rows(\
+            'UPDATE id_sequence SET id = id + ? WHERE table_name = ?'))
+
+    def test_format(self):
+        execute_insert(self.db, 'items', { 'id' : 1, 'name' : 'moo' })
+        list(execute_select(self.db, 'items', ('id', 'name'), { 'id' : 1 }))
+        lines = self.tracer.format(sort_by = 'count').splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].split()[-1] == 'Statement')
+        self.assertEqual(2, len(self.tracer.format(limit = 1).splitlines()))
+        with self.assertRaises(ValueError):
+            self.tracer.format(sort_by = 'moo')
+
+    def test_slow_statements_are_explained(self):
+        messages = [ ]
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+        handler = Handler()
+        logging.getLogger().addHandler(handler)
+        try:
+            self.tracer.slow_threshold = 0.0
+            list(execute_select(self.db, 'items', ('id', 'name'), { 'id' : 1 }))
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(1, len(messages))
+        self.assertTrue('Slow SQL statement' in messages[0])
+        self.assertTrue('SCAN' in messages[0], messages[0])
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.cursor().execute('SELECT moo FROM items')
+        self.assertTrue('SELECT moo FROM items' in self.tracer.shapes)
+
+    def _count_and_rows(self, shape):
+        stats = self.tracer.shapes[shape]
+        return (stats.count, stats.rows)
+
+class DatabaseTracingTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_trace_database(self):
+        filename = SEEDED_TEMPLATE.copy_to(os.path.join(self.dir, 'test.db'))
+
+        tracer = SqlTracer(slow_threshold = None)
+        db = Database(filename, tracer = tracer)
+        try:
+            self.assertIs(tracer, db.tracer)
+            db.venues.add(Venue('Moo Conference', 'MOO'))
+            db.commit()
+            venue = db.venues.with_name('Moo Conference')
+            self.assertEqual(0, db.articles.count(venue = venue))
+        finally:
+            db.close()
+        self.assertTrue('COMMIT' in tracer.shapes)
+        self.assertTrue(any(shape.startswith('INSERT INTO venues') \
+                                for shape in tracer.shapes))
+        self.assertTrue('SELECT count(*) FROM articles WHERE venue_id = ?' in \
+                            tracer.shapes)
+
+        output = os.path.join(self.dir, 'trace.txt')
+        tracer.dump(output)
+        with open(output) as f:
+            self.assertTrue('INSERT INTO venues' in f.read())
+
+if __name__ == '__main__':
+    unittest.main()
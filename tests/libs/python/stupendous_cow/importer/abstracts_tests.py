@@ -1,6 +1,9 @@
 from stupendous_cow.importer.abstracts import *
 from stupendous_cow.testing import get_resource_dir, set_resource_dir
+import os
 import os.path
+import shutil
+import tempfile
 import unittest
 
 class NipsAbstractFileReaderTests(unittest.TestCase):
@@ -36,12 +39,194 @@ class NipsAbstractFileReaderTests(unittest.TestCase):
         self._verify_abstract(true_abs_2, abstracts[1])
         self._verify_abstract(true_abs_3, abstracts[2])
 
+    def test_body_spans(self):
+        filename = os.path.join(get_resource_dir(), 'test_abstracts.txt')
+        with open(filename, 'rb') as f:
+            content = f.read()
+        for abstract in NipsAbstractFileReader(filename):
+            (offset, length) = abstract.span
+            self.assertEqual(abstract.body,
+                             content[offset:offset + length].decode('utf-8'))
+
+    def test_read_non_ascii_file(self):
+        (fd, filename) = tempfile.mkstemp()
+        try:
+            os.write(fd, u'\n#1 [Oral] Caf\xe9 Cows\n  J. M\xfcller\n' \
+                         u'  \xdcber cows \u2014 and more\n\n' \
+                         u'#2 Penguins\n  A. Author\n  Wark.\n'.encode('utf-8'))
+            os.close(fd)
+            abstracts = [ a for a in NipsAbstractFileReader(filename) ]
+            index = AbstractIndex.build(NipsAbstractFileReader(filename))
+        finally:
+            os.unlink(filename)
+
+        self.assertEqual([ (2, u'Caf\xe9 Cows',
+                            u'\xdcber cows \u2014 and more'),
+                           (6, u'Penguins', u'Wark.') ],
+                         [ (a.start, a.title, a.body) for a in abstracts ])
+        self.assertEqual(2, len(index))
+
     def _verify_abstract(self, truth, abstract):
         self.assertEqual(truth.start, abstract.start)
         self.assertEqual(truth.title, abstract.title)
         self.assertEqual(truth.authors, abstract.authors)
         self.assertEqual(truth.body, abstract.body)
-        
+
+class NipsAbstractReaderComparisonTests(unittest.TestCase):
+    """NipsAbstractFileReader must read exactly what NipsAbstractLineReader
+    does."""
+    def setUp(self):
+        (fd, self.filename) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_resource_file(self):
+        filename = os.path.join(get_resource_dir(), 'test_abstracts.txt')
+        self._compare(filename, 1)
+        self._compare(filename, 2)
+
+    def test_unusual_layouts(self):
+        self._write(u'\n  \n#1 [Oral] Cows\n  A. Cow\n  Moo.\r\n' \
+                    u'\xa0 indented with a no-break space\n\n' \
+                    u'#2 Title only\n' \
+                    u'#3 [Poster]   Authors only  \n  A. Penguin\n' \
+                    u'#4 Caf\xe9\n  B. M\xfcller\n  \u2014 body\n\n\n' \
+                    u'#5 No final newline\n  C. Bun\n  Buns.')
+        abstracts = self._compare(self.filename, 1)
+        self.assertEqual([ 3, 8, 9, 11, 16 ], [ a.start for a in abstracts ])
+        for n in (2, 3, 5, 8):
+            self._compare(self.filename, n)
+
+    def test_empty_file(self):
+        self.assertEqual([ ], self._compare(self.filename, 1))
+
+    def test_missing_title(self):
+        self._write(u'#1 Cows\n  A. Cow\n  Moo.\nNot a title\n')
+        self._compare_errors(1)
+
+    def test_text_before_first_title(self):
+        self._write(u'\n  Not a title\n#1 Cows\n  A. Cow\n  Moo.\n')
+        self._compare_errors(1)
+
+    def test_missing_title_in_later_chunk(self):
+        self._write(u'#1 Cows\n  A. Cow\n  Moo.\n' * 50 + u'#2\n  A.\n')
+        self._compare_errors(4)
+
+    def _write(self, text):
+        with open(self.filename, 'wb') as f:
+            f.write(text.encode('utf-8'))
+
+    def _compare(self, filename, num_processes):
+        def fields(abstracts):
+            return [ (a.start, a.title, a.authors, a.body, a.span) \
+                         for a in abstracts ]
+        truth = [ a for a in NipsAbstractLineReader(filename) ]
+        abstracts = [ a for a in NipsAbstractFileReader(filename,
+                                                        num_processes) ]
+        self.assertEqual(fields(truth), fields(abstracts))
+        return abstracts
+
+    def _compare_errors(self, num_processes):
+        with self.assertRaises(IOError) as truth:
+            [ a for a in NipsAbstractLineReader(self.filename) ]
+        with self.assertRaises(IOError) as context:
+            [ a for a in NipsAbstractFileReader(self.filename, num_processes) ]
+        self.assertEqual(str(truth.exception), str(context.exception))
+
+class CountingReader(NipsAbstractFileReader):
+    num_files_read = 0
+
+    def __iter__(self):
+        CountingReader.num_files_read += 1
+        return NipsAbstractFileReader.__iter__(self)
+
+class AbstractCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(get_resource_dir(), 'test_abstracts.txt')
+        ABSTRACT_READER_FACTORIES['counting'] = CountingReader
+        CountingReader.num_files_read = 0
+
+    def tearDown(self):
+        del ABSTRACT_READER_FACTORIES['counting']
+        shutil.rmtree(self.cache_dir)
+
+    def test_lookup(self):
+        index = AbstractCache(self.cache_dir).get('counting', self.filename)
+
+        self.assertEqual(3, len(index))
+        title = 'diversitydriven exploration strategy for deep ' + \
+                'reinforcement learning'
+        self.assertTrue(title in index)
+        self.assertEqual('Efficient exploration remains a challenging ' + \
+                         'research problem in reinforcement learning...',
+                         index[title])
+        with self.assertRaises(KeyError):
+            index['cows are cool']
+        self.assertIsNone(index.get('cows are cool'))
+
+    def test_file_is_read_once_per_cache(self):
+        cache = AbstractCache(self.cache_dir)
+        first = cache.get('counting', self.filename)
+        second = cache.get('counting', self.filename)
+
+        self.assertIs(first, second)
+        self.assertEqual(1, CountingReader.num_files_read)
+
+    def test_saved_index_is_reused(self):
+        first = AbstractCache(self.cache_dir).get('counting', self.filename)
+        second = AbstractCache(self.cache_dir).get('counting', self.filename)
+
+        self.assertEqual(1, CountingReader.num_files_read)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        for title in ('memory augmented policy optimization for program ' + \
+                      'synthesis and semantic parsing',
+                      'fast deep reinforcement learning using online ' + \
+                      'adjustments from the past'):
+            self.assertEqual(first[title], second[title])
+
+    def test_changed_file_is_read_again(self):
+        filename = os.path.join(self.cache_dir, 'abstracts.txt')
+        shutil.copy(self.filename, filename)
+        AbstractCache(self.cache_dir).get('counting', filename)
+        with open(filename, 'a') as f:
+            f.write('#1 Cows Are Cool\n  Cow\n  Moo.\n')
+
+        index = AbstractCache(self.cache_dir).get('counting', filename)
+
+        self.assertEqual(2, CountingReader.num_files_read)
+        self.assertEqual('Moo.', index['cows are cool'])
+
+    def test_file_changed_within_a_second_is_read_again(self):
+        filename = os.path.join(self.cache_dir, 'abstracts.txt')
+        with open(filename, 'w') as f:
+            f.write('#1 Cows Are Cool\n  Cow\n  Moo.\n')
+        os.utime(filename, (1500000000, 1500000000))
+        AbstractCache(self.cache_dir).get('counting', filename)
+
+        # Same size and same whole second, but a new inode
+        replacement = filename + '.new'
+        with open(replacement, 'w') as f:
+            f.write('#1 Cows Are Cool\n  Cow\n  Baa.\n')
+        os.utime(replacement, (1500000000, 1500000000))
+        os.rename(replacement, filename)
+        index = AbstractCache(self.cache_dir).get('counting', filename)
+        self.assertEqual('Baa.', index['cows are cool'])
+
+        # Rewritten in place half a second later
+        with open(filename, 'w') as f:
+            f.write('#1 Cows Are Cool\n  Cow\n  Oink\n')
+        os.utime(filename, (1500000000.5, 1500000000.5))
+        index = AbstractCache(self.cache_dir).get('counting', filename)
+        self.assertEqual('Oink', index['cows are cool'])
+        self.assertEqual(3, CountingReader.num_files_read)
+
+    def test_unknown_reader(self):
+        with self.assertRaises(ValueError):
+            AbstractCache(self.cache_dir).get('cows', self.filename)
+
 
 if __name__ == '__main__':
     set_resource_dir('importer')
@@ -3,6 +3,7 @@ from stupendous_cow.importer.extractors import ExtractedDocument
 from stupendous_cow.importer.spreadsheets import SpreadsheetPath
 from stupendous_cow.data_model import ArticleType, Category, Venue
 import logging
+import operator
 import unittest
 
 class MockTable:
@@ -28,6 +29,9 @@ class MockTable:
         self._name_to_item[new_item.name] = new_item
         return new_item
 
+    def add_all(self, items):
+        return [ self.add(item) for item in items ]
+
     def __getitem__(self, i):
         return self._items[i]
 
@@ -232,6 +236,24 @@ class PropertyExtractorTests(unittest.TestCase):
         self.assertEqual('RL', category.name)
         self.assertEqual(db.categories[2], category)
 
+    def test_database_property_extractor_add_missing(self):
+        db = MockDatabase()
+        base_extractor = ConstantPropertyExtractor('RL')
+        extractor = DatabasePropertyExtractor(db.categories, base_extractor,
+                                              Category)
+        self.assertEqual('RL', extractor.name_for(self.ss_rows,
+                                                  self.document))
+
+        n = extractor.add_missing([ 'RL', 'Architecture', 'GANs', 'RL' ])
+        self.assertEqual(2, n)
+        self.assertEqual([ 'GANs', 'RL' ],
+                         [ c.name for c in db.categories._items[2:] ])
+        self.assertEqual(0, extractor.add_missing([ 'RL', 'GANs' ]))
+
+        category = extractor(self.ss_rows, self.document)
+        self.assertEqual(4, len(db.categories._items))
+        self.assertEqual(db.categories[3], category)
+
     def test_extract_int_from_int_or_long(self):
         extractor = IntPropertyExtractor(ConstantPropertyExtractor(5))
         self.assertEqual(5, extractor(self.ss_rows, self.document))
@@ -336,6 +358,72 @@ class PropertyBinderTests(unittest.TestCase):
         builder = ArticleBuilder(self.db)
         binder(self.ss_rows, self.document, builder)
         self.assertEqual('qqq', builder.summary)
+
+class RowBindingPlanTests(unittest.TestCase):
+    def setUp(self):
+        self.ss_rows = { 'alpha' : MockRow(('a', '3', 'Architecture', 'y')),
+                         'beta' : MockRow(('qqq', 'zzz', 'aaa')) }
+        self.document = \
+            ExtractedDocument('Cows Are Cool', (),
+                              'The authors investigate why cows are cool.',
+                              'Cows are really cool.  Everyone knows this.')
+
+        self.db = MockDatabase()
+        prototype = ArticleBuilder(self.db)
+        prototype.set_year(2018)
+        prototype.set_venue(self.db.venues.with_name('ICML'))
+        self.plan = RowBindingPlan(prototype)
+
+    def test_bind(self):
+        categories = DatabasePropertyExtractor(self.db.categories,
+                                               ConstantPropertyExtractor(''),
+                                               Category)
+        self.plan.add_document_field('title', 'title')
+        self.plan.add_column('priority', 'alpha', operator.itemgetter(1),
+                             0, to_int)
+        self.plan.add_column('category', 'alpha', operator.itemgetter(2),
+                             '', categories.lookup)
+        self.plan.add_column('is_read', 'alpha', operator.itemgetter(3),
+                             False, to_bool)
+        self.plan.add_column('summary', 'beta', operator.itemgetter(1), '')
+        self.plan.add_column('abstract', 'gamma', operator.itemgetter(0),
+                             'No abstract')
+        self.plan.add_constant('article_type', 'Oral',
+                               self.db.article_types.with_name)
+
+        builder = self.plan.bind(self.ss_rows, self.document)
+        self.assertEqual('Cows Are Cool', builder.title)
+        self.assertEqual(3, builder.priority)
+        self.assertEqual(self.db.categories[1], builder.category)
+        self.assertTrue(builder.is_read)
+        self.assertEqual('zzz', builder.summary)
+        self.assertEqual('No abstract', builder.abstract)
+        self.assertEqual(self.db.article_types[1], builder.article_type)
+        self.assertEqual(2018, builder.year)
+        self.assertEqual(self.db.venues[1], builder.venue)
+
+    def test_bind_gives_each_row_its_own_builder(self):
+        self.plan.add_column('summary', 'beta', operator.itemgetter(0), '')
+        first = self.plan.bind(self.ss_rows, self.document)
+        first.set_title('Cows Are Cool')
+
+        self.ss_rows['beta'] = MockRow(('rrr', 'zzz', 'aaa'))
+        second = self.plan.bind(self.ss_rows, self.document)
+        self.assertEqual('qqq', first.summary)
+        self.assertEqual('rrr', second.summary)
+        self.assertIsNone(second.title)
+
+    def test_bind_invalid_value(self):
+        self.plan.add_column('priority', 'beta', operator.itemgetter(0),
+                             0, to_int)
+        with self.assertRaises(PropertyExtractionError) as context:
+            self.plan.bind(self.ss_rows, self.document)
+        self.assertTrue(context.exception.reason.startswith(\
+            'Failed to extract value for priority'))
+
+    def test_add_invalid_constant(self):
+        with self.assertRaises(PropertyExtractionError):
+            self.plan.add_constant('is_read', 'bad', to_bool)
         
 if __name__ == '__main__':
     logging.basicConfig(level = logging.CRITICAL)
@@ -1,6 +1,13 @@
 from stupendous_cow.importer.extractors import *
 from stupendous_cow.testing import get_resource_dir, set_resource_dir
+import os
 import os.path
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
 import unittest
 
 class DefaultPdfExtractorTests(unittest.TestCase):
@@ -17,6 +24,141 @@ class DefaultPdfExtractorTests(unittest.TestCase):
         self.assertEqual(true_doc.abstract, doc.abstract)
         self.assertEqual(true_doc.body, doc.body)        
 
+class FirstPagesPdfExtractorTests(unittest.TestCase):
+    def test_extract(self):
+        extractor = DOCUMENT_EXTRACTOR_FACTORIES['first_pages_pdf']()
+        filename = os.path.join(get_resource_dir(), 'test_pdf.pdf')
+        doc = extractor.extract(filename)
+
+        self.assertEqual('This is line one. This is line two.', doc.title)
+        self.assertEqual((), doc.authors)
+        self.assertEqual('', doc.abstract)
+        self.assertEqual('This is line one.\nThis is line two.\n\n', doc.body)
+
+class WhitespaceNormalizerTests(unittest.TestCase):
+    def test_normalize(self):
+        text = '  Cows   are\tcool. \n  Moo  \n\n\n\n\nPenguins \n\n'
+        self.assertEqual('Cows are cool.\nMoo\n\nPenguins\n\n',
+                         self._normalize([ text ]))
+        self.assertEqual('Cows moo',
+                         self._normalize([ ' ', '\t Cows ', 'moo' ]))
+
+    def test_chunks_do_not_matter(self):
+        rng = random.Random(1)
+        text = ''.join(rng.choice('ab \t\n') for i in xrange(2000))
+        expected = self._normalize([ text ])
+        for n in xrange(20):
+            splits = sorted(rng.sample(xrange(len(text)), 30))
+            chunks = [ text[i:j] for (i, j) in zip([ 0 ] + splits,
+                                                   splits + [ len(text) ]) ]
+            self.assertEqual(expected, self._normalize(chunks))
+
+    def _normalize(self, chunks):
+        normalizer = WhitespaceNormalizer()
+        return ''.join(normalizer.feed(c) for c in chunks) + \
+               normalizer.finish()
+
+class ExecutePdftotextTests(unittest.TestCase):
+    """Runs execute_pdftotext() with a fake pdftotext on the PATH."""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.dir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir)
+
+    def test_normalize_output(self):
+        self._write_pdftotext('sys.stdout.write("Moo   moo\\n\\n\\n\\nCows")')
+        self.assertEqual('Moo moo\n\nCows', execute_pdftotext('cows.pdf'))
+
+    def test_max_size(self):
+        self._write_pdftotext('while True: sys.stdout.write("Moo " * 1000)')
+        output = execute_pdftotext('cows.pdf', max_size = 100000)
+        self.assertEqual(100000, len(output))
+        self.assertTrue(output.startswith('Moo Moo '))
+
+    def test_max_size_keeps_utf8_sequences_whole(self):
+        self._write_pdftotext(\
+            'sys.stdout.write("\\xc3\\xa9" * 100000)')
+        output = execute_pdftotext('cows.pdf', max_size = 1001)
+        self.assertEqual(u'\xe9' * 500, output.decode('utf-8'))
+
+    def test_timeout(self):
+        self._write_pdftotext('time.sleep(30)')
+        start = time.time()
+        with self.assertRaises(PdfExtractionError):
+            execute_pdftotext('cows.pdf', timeout = 0.5)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_timeout_after_output_is_read(self):
+        # The deadline passes while pdftotext exits, after its output is
+        # complete
+        self._write_pdftotext('import os\nsys.stdout.write("Moo")\n' + \
+                              'sys.stdout.flush()\nos.close(1)\n' + \
+                              'time.sleep(2)')
+        self.assertEqual('Moo', execute_pdftotext('cows.pdf', timeout = 1))
+
+    def test_failure(self):
+        self._write_pdftotext('sys.stderr.write("Bad PDF")\nsys.exit(3)')
+        with self.assertRaises(PdfExtractionError) as context:
+            execute_pdftotext('cows.pdf')
+        self.assertTrue('code 3' in context.exception.details)
+        self.assertTrue('Bad PDF' in context.exception.details)
+
+    def _write_pdftotext(self, code):
+        filename = os.path.join(self.dir, 'pdftotext')
+        with open(filename, 'w') as f:
+            f.write('#!%s\nimport sys, time\n%s\n' % (sys.executable, code))
+        os.chmod(filename, stat.S_IRWXU)
+
+PAPER = u"""Published as a conference paper at ICLR 2018
+
+Cows Are Cool: Bovine Models
+of Deep Learning
+
+Alice Cow\u2217 , Bob van der Bull\u2020 and Carol Calf
+Department of Dairy Science
+University of Pasture
+{alice,bob}@moo.edu
+
+Abstract
+We show that cows are cool. Our exper-
+iments confirm it.
+
+Penguins are cute, too.
+1 Introduction
+Cows have been studied for a long time.
+\f2
+More text.
+"""
+
+class ParseFrontMatterTests(unittest.TestCase):
+    def test_parse(self):
+        (title, authors, abstract) = parse_front_matter(PAPER)
+
+        self.assertEqual(u'Cows Are Cool: Bovine Models of Deep Learning',
+                         title)
+        self.assertEqual((u'Alice Cow', u'Bob van der Bull', u'Carol Calf'),
+                         authors)
+        self.assertEqual(u'We show that cows are cool. Our experiments ' + \
+                         u'confirm it.\n\nPenguins are cute, too.', abstract)
+
+    def test_abstract_on_heading_line(self):
+        text = u'Moo\n\nA. Cow\n\nAbstract\u2014Cows moo.\n\nIntroduction\n'
+        self.assertEqual((u'Moo', (u'A. Cow', ), u'Cows moo.'),
+                         parse_front_matter(text))
+
+    def test_no_abstract(self):
+        text = u'arXiv:1801.00001v1 [cs.LG] 1 Jan 2018\nMoo\n\n' + \
+               u'Alice Cow and Bob Bull\n\nCows are cool.\n'
+        self.assertEqual((u'Moo', (u'Alice Cow', u'Bob Bull'), u''),
+                         parse_front_matter(text))
+
+    def test_empty(self):
+        self.assertEqual((u'', (), u''), parse_front_matter(u''))
+
 if __name__ == '__main__':
     set_resource_dir('importer')
     unittest.main()
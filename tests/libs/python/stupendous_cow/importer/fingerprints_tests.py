@@ -0,0 +1,76 @@
+from stupendous_cow.importer.fingerprints import *
+from stupendous_cow.importer.generic_ss.configuration import \
+    DocumentGroupConfiguration
+from stupendous_cow.importer.spreadsheets import SpreadsheetPath
+from stupendous_cow.data_model import Venue
+import os
+import os.path
+import tempfile
+import unittest
+
+class MockRow:
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+class FingerprintTests(unittest.TestCase):
+    def setUp(self):
+        (fd, self.pdf_path) = tempfile.mkstemp(suffix = '.pdf')
+        os.write(fd, 'Cows are cool')
+        os.close(fd)
+        self.venue = Venue('International Conference on Machine Learning',
+                           'ICML', 4)
+
+    def tearDown(self):
+        os.unlink(self.pdf_path)
+
+    def test_file_identity(self):
+        identity = file_identity(self.pdf_path)
+        self.assertEqual(os.path.abspath(self.pdf_path), identity[0])
+        self.assertEqual(13, identity[1])
+        self.assertIsNone(file_identity(self.pdf_path + '.missing'))
+        self.assertIsNone(file_identity(None))
+
+    def test_group_digest(self):
+        digest = group_digest(self._create_group(), self.venue, 2018)
+        self.assertEqual(digest,
+                         group_digest(self._create_group(), self.venue, 2018))
+        self.assertNotEqual(digest,
+                            group_digest(self._create_group(), self.venue,
+                                         2017))
+        self.assertNotEqual(digest,
+                            group_digest(self._create_group(priority = 4),
+                                         self.venue, 2018))
+
+    def test_row_fingerprint(self):
+        fingerprint = RowFingerprinter('abc', ('Papers', 'Summaries'))
+        rows = { 'Papers' : MockRow([ 'Cows Are Cool', 'Y' ]),
+                 'Summaries' : MockRow([ 'Cows Are Cool', 'Very cool' ]) }
+        fp = fingerprint(rows, self.pdf_path)
+
+        self.assertEqual(fp, fingerprint(dict(rows), self.pdf_path))
+        self.assertNotEqual(fp, fingerprint(rows, None))
+        self.assertNotEqual(fp, RowFingerprinter('abd', ('Papers',
+                                                         'Summaries'))(\
+                                    rows, self.pdf_path))
+
+        rows['Summaries'] = MockRow([ 'Cows Are Cool', 'Very, very cool' ])
+        self.assertNotEqual(fp, fingerprint(rows, self.pdf_path))
+
+        del rows['Summaries']
+        self.assertNotEqual(fp, fingerprint(rows, self.pdf_path))
+
+    def _create_group(self, priority = 3):
+        return DocumentGroupConfiguration(\
+            'DocumentGroup_1', SpreadsheetPath('Papers', 'TITLE'), None,
+            [ '/home/tomault/conferences' ], priority,
+            SpreadsheetPath('Papers', 'DOWNLOADED_AS'), None, None, None, None,
+            None, None, None, 'default_pdf')
+
+if __name__ == '__main__':
+    unittest.main()
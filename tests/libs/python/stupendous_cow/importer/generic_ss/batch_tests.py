@@ -0,0 +1,122 @@
+from stupendous_cow.importer.generic_ss.batch import *
+from stupendous_cow.db.main import Database
+from stupendous_cow.testing import SEEDED_TEMPLATE
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+CONFIGURATION = """Venue: %s
+Year: %d
+DocumentGroup_1:
+  Title: "@%s[TITLE]"
+  ContentDir: %s
+  DownloadedAs: "@%s[DOWNLOADED_AS]"
+  ArticleType: "@%s[TYPE]"
+  Category: "@%s[AREA]"
+  IsRead: "@%s[IS_READ]"
+"""
+
+class BatchImporterTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_filename = os.path.join(self.dir, 'articles.db')
+        SEEDED_TEMPLATE.copy_to(self.db_filename)
+
+        self._write_workbook('icml.csv',
+                             [ 'Cows Are Cool,Oral,Cows,Y,CowsAreCool',
+                               'Penguins Are Cute,Poster,Birds,N,' ])
+        self._write_configuration('icml.yaml', 'ICML', 2018, 'icml.csv')
+        self._write_workbook('nips.csv',
+                             [ 'Fun On A Bun,Demo,Buns,N,',
+                               'Moo Moo You You,Oral,Cows,N,',
+                               'Wark Wark,Oral,Birds,Y,' ])
+        self._write_configuration('nips.yaml', 'NIPS', 2017, 'nips.csv')
+        with open(os.path.join(self.dir, 'manifest.yaml'), 'w') as f:
+            f.write('- Config: icml.yaml\n  Workbook: icml.csv\n' + \
+                    '- Config: nips.yaml\n  Workbook: nips.csv\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_load_manifest(self):
+        entries = load_manifest(os.path.join(self.dir, 'manifest.yaml'))
+        self.assertEqual([ (os.path.join(self.dir, 'icml.yaml'),
+                            os.path.join(self.dir, 'icml.csv')),
+                           (os.path.join(self.dir, 'nips.yaml'),
+                            os.path.join(self.dir, 'nips.csv')) ],
+                         [ (e.configuration_filename, e.workbook_filename) \
+                               for e in entries ])
+
+    def test_load_invalid_manifest(self):
+        filename = os.path.join(self.dir, 'bad_manifest.yaml')
+        with open(filename, 'w') as f:
+            f.write('- Config: icml.yaml\n')
+        with self.assertRaises(IOError):
+            load_manifest(filename)
+
+    def test_import(self):
+        report = self._import()
+
+        self.assertEqual([ (2, 0, 0), (3, 0, 0) ],
+                         [ self._counts(c) for c in report.counts ])
+        self.assertEqual(4, report.num_enum_values_created)
+        self.assertEqual(0, report.num_groups_failed)
+        self.assertTrue('Total' in report.format())
+        self.assertEqual(5, report.metrics.calls['db_save'])
+        self.assertEqual(5, report.metrics.calls['sheet_read'])
+        self.assertEqual(2, report.metrics.calls['workbook_load'])
+
+        db = Database(self.db_filename)
+        try:
+            articles = sorted(db.articles.all, key = lambda a: a.title)
+            self.assertEqual([ ('Cows Are Cool', 'ICML', 2018, 'Cows'),
+                               ('Fun On A Bun', 'NIPS', 2017, 'Buns'),
+                               ('Moo Moo You You', 'NIPS', 2017, 'Cows'),
+                               ('Penguins Are Cute', 'ICML', 2018, 'Birds'),
+                               ('Wark Wark', 'NIPS', 2017, 'Birds') ],
+                             [ (a.title, a.venue.abbreviation, a.year,
+                                a.category.name) for a in articles ])
+            self.assertEqual('Demo', articles[1].article_type.name)
+        finally:
+            db.close()
+
+    def test_reimport(self):
+        self._import()
+        report = self._import()
+
+        self.assertEqual([ (0, 2, 0), (0, 3, 0) ],
+                         [ self._counts(c) for c in report.counts ])
+        self.assertEqual(0, report.num_enum_values_created)
+
+    def test_failed_group(self):
+        os.unlink(os.path.join(self.dir, 'nips.csv'))
+
+        report = self._import()
+
+        self.assertEqual(1, report.num_groups_failed)
+        self.assertEqual([ (2, 0, 0), (0, 0, 0) ],
+                         [ self._counts(c) for c in report.counts ])
+
+    def _import(self):
+        entries = load_manifest(os.path.join(self.dir, 'manifest.yaml'))
+        return BatchImporter(self.db_filename, entries, num_workers = 2,
+                             batch_size = 2).run()
+
+    def _counts(self, counts):
+        return (counts.num_imported, counts.num_unchanged, counts.num_failed)
+
+    def _write_workbook(self, name, rows):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write('TITLE,TYPE,AREA,IS_READ,DOWNLOADED_AS\n')
+            for row in rows:
+                f.write(row + '\n')
+
+    def _write_configuration(self, name, venue, year, sheet_name):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(CONFIGURATION % ((venue, year, sheet_name, self.dir) + \
+                                     (sheet_name, ) * 4))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,45 @@ class ConfigurationParserTests(unittest.TestCase):
 
         config = self.parser.load(stream = self._create_stream(true_config))
         self._verify_config(true_config, config)
+
+    def test_parse_join_on(self):
+        dg = self._create_document_group()
+        dg['JoinOn'] = [ SpreadsheetPath('Papers', 'TITLE'),
+                         SpreadsheetPath('Summaries', 'TITLE') ]
+        true_config = self._create_config_map(document_groups = [ dg ])
+
+        config = self.parser.load(stream = self._create_stream(true_config))
+        self.assertEqual((SpreadsheetPath('Papers', 'TITLE'),
+                          SpreadsheetPath('Summaries', 'TITLE')),
+                         config.document_groups[0].join_keys)
+
+    def test_parse_join_on_same_sheet_twice(self):
+        dg = self._create_document_group()
+        dg['JoinOn'] = [ SpreadsheetPath('Papers', 'TITLE'),
+                         SpreadsheetPath('Papers', 'DOWNLOADED_AS') ]
+        true_config = self._create_config_map(document_groups = [ dg ])
+
+        with self.assertRaises(IOError):
+            self.parser.load(stream = self._create_stream(true_config))
     
+    def test_parse_abstract_match_threshold(self):
+        dg = self._create_document_group()
+        dg['AbstractMatchThreshold'] = 0.75
+        true_config = self._create_config_map(document_groups = [ dg ])
+
+        config = self.parser.load(stream = self._create_stream(true_config))
+        self.assertEqual(0.75,
+                         config.document_groups[0].abstract_match_threshold)
+
+    def test_parse_invalid_abstract_match_threshold(self):
+        for threshold in (-0.5, 1.5, 'cows'):
+            dg = self._create_document_group()
+            dg['AbstractMatchThreshold'] = threshold
+            true_config = self._create_config_map(document_groups = [ dg ])
+
+            with self.assertRaises(IOError):
+                self.parser.load(stream = self._create_stream(true_config))
+
     def _create_config_map(self, venue = 'NIPS', year = 2018,
                            document_groups = ()):
         config_map = { 'Venue' : venue, 'Year' : year }
@@ -81,6 +119,11 @@ class ConfigurationParserTests(unittest.TestCase):
                            'IsRead' : s(dg['IsRead']),
                            'AbstractsFileReader' : abstract_reader,
                            'Extractor' : dg['Extractor'] }
+            if 'JoinOn' in dg:
+                serialized['JoinOn'] = [ s(x) for x in dg['JoinOn'] ]
+            if 'AbstractMatchThreshold' in dg:
+                serialized['AbstractMatchThreshold'] = \
+                    dg['AbstractMatchThreshold']
             tmp[dg_name] = serialized
 
         return cStringIO.StringIO(yaml.dump(tmp, default_flow_style = False))
@@ -110,6 +153,9 @@ class ConfigurationParserTests(unittest.TestCase):
                          dg.abstracts_file_reader)
         self.assertEqual(true_dg['AbstractsFileName'], dg.abstracts_file_name)
         self.assertEqual(true_dg['Extractor'], dg.article_extractor)
+        self.assertEqual(tuple(true_dg.get('JoinOn', ())), dg.join_keys)
+        self.assertEqual(true_dg.get('AbstractMatchThreshold'),
+                         dg.abstract_match_threshold)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,319 @@
+from stupendous_cow.importer.generic_ss.director import *
+from stupendous_cow.importer.abstracts import AbstractCache
+from stupendous_cow.importer.extractors import ExtractedDocument, \
+    PdfExtractionError
+from stupendous_cow.importer.generic_ss.configuration import \
+    DocumentGroupConfiguration
+from stupendous_cow.importer.metrics import ImportMetrics
+from stupendous_cow.importer.spreadsheets import SpreadsheetPath, Worksheet
+from stupendous_cow.importer.supervision import ExtractionSupervisor
+from stupendous_cow.testing import SEEDED_TEMPLATE
+import os
+import os.path
+import pyexcel
+import shutil
+import tempfile
+import unittest
+
+class MockWorkbook:
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def __getitem__(self, name):
+        return Worksheet(pyexcel.Sheet(self._sheets[name], name = name))
+
+class MockConfiguration:
+    def __init__(self, venue, year, document_groups):
+        self.venue = venue
+        self.year = year
+        self.document_groups = document_groups
+
+class MockExtractor:
+    def __init__(self, failing, degraded = ()):
+        self.failing = failing
+        self.degraded = degraded
+
+    def extract(self, filename):
+        name = os.path.basename(filename)
+        if name in self.failing:
+            raise PdfExtractionError('Could not extract %s' % filename)
+        return ExtractedDocument('', (), '', 'Moo',
+                                 degraded = name in self.degraded)
+
+class MockSupervisor(ExtractionSupervisor):
+    def __init__(self, extractor):
+        ExtractionSupervisor.__init__(self, fallback = None)
+        self.extractor = extractor
+
+    def _create(self, name):
+        return self.extractor
+
+class DirectorTests(unittest.TestCase):
+    def setUp(self):
+        self.content_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        for name in ('CowsAreCool', 'PenguinsAreCute', 'FunOnABun'):
+            with open(os.path.join(self.content_dir, name + '.pdf'), 'w') as f:
+                f.write(name)
+
+        self.db = SEEDED_TEMPLATE.open()
+
+        self.papers = [ [ 'TITLE', 'TYPE', 'AREA', 'IS_READ',
+                          'DOWNLOADED_AS' ],
+                        [ 'Cows Are Cool', 'Oral', 'Cows', 'Y',
+                          'CowsAreCool' ],
+                        [ 'Penguins Are Cute', 'Poster', 'Birds', 'N',
+                          'PenguinsAreCute' ],
+                        [ 'Fun On A Bun', 'Oral', 'Cows', 'N', 'FunOnABun' ] ]
+        self.summaries = None
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.content_dir)
+        shutil.rmtree(self.cache_dir)
+
+    def test_import(self):
+        counts = self._import()
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        self.assertEqual(2, counts.num_enum_values_created)
+        articles = sorted(self.db.articles.all, key = lambda a: a.id)
+        self.assertEqual([ 'Cows Are Cool', 'Penguins Are Cute',
+                           'Fun On A Bun' ], [ a.title for a in articles ])
+        self.assertEqual([ 'Oral', 'Poster', 'Oral' ],
+                         [ a.article_type.name for a in articles ])
+        self.assertEqual([ 'Cows', 'Birds', 'Cows' ],
+                         [ a.category.name for a in articles ])
+        self.assertEqual([ True, False, False ],
+                         [ a.is_read for a in articles ])
+        self.assertEqual(os.path.join(self.content_dir, 'FunOnABun.pdf'),
+                         articles[2].pdf_file)
+        self.assertEqual(1, self.metrics.calls['workbook_load'])
+
+    def test_reimport_unchanged_workbook(self):
+        self._import()
+        changes_before = self.db._db.total_changes
+
+        counts = self._import()
+
+        self.assertEqual((0, 3, 0), self._counts(counts))
+        self.assertEqual(0, counts.num_enum_values_created)
+        self.assertEqual(changes_before, self.db._db.total_changes)
+        with self.db.articles.need_reindexing() as rs:
+            self.assertEqual(3, len([ x for x in rs ]))
+
+    def test_reimport_changed_row(self):
+        self._import()
+        self.papers[2][3] = 'Y'
+
+        counts = self._import()
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        self.assertEqual(3, self.db.articles.count())
+        self.assertEqual(2, self.db.articles.count(is_read = True))
+
+    def test_enum_values_created_before_rows(self):
+        self.papers.append([ 'Moo Moo You You', 'Demo', 'Cows', 'N', '' ])
+
+        counts = self._import()
+
+        self.assertEqual(3, counts.num_enum_values_created)
+        self.assertEqual([ 'Birds', 'Cows' ],
+                         sorted(c.name for c in self.db.categories.all[1:]))
+        with self.db.articles.retrieve(normalized_title = 'moo moo you you') \
+                 as rs:
+            self.assertEqual('Demo', next(rs).article_type.name)
+
+    def test_reimport_changed_pdf(self):
+        self._import()
+        pdf_path = os.path.join(self.content_dir, 'PenguinsAreCute.pdf')
+        with open(pdf_path, 'w') as f:
+            f.write('Penguins are very cute')
+
+        counts = self._import()
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+
+    def test_reimport_deleted_article(self):
+        self._import()
+        with self.db.articles.retrieve(normalized_title = 'fun on a bun') as rs:
+            article = next(rs)
+        self.db.articles.delete(article.id)
+        self.db.commit()
+
+        counts = self._import()
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        self.assertEqual(3, self.db.articles.count())
+
+    def test_full_reimport(self):
+        self._import()
+
+        counts = self._import(incremental = False)
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        self.assertEqual(3, self.db.articles.count())
+
+    def test_reimport_failed_extraction(self):
+        extractor = MockExtractor(set([ 'PenguinsAreCute.pdf' ]))
+        supervisor = MockSupervisor(extractor)
+
+        counts = self._import(supervisor = supervisor)
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        self.assertEqual(1, supervisor.stats.num_failed)
+        extractor.failing = set()
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((0, 3, 0), self._counts(counts))
+
+    def test_reimport_reverted_row_after_failed_extraction(self):
+        extractor = MockExtractor(set())
+        self._import(supervisor = MockSupervisor(extractor))
+        self.papers[2][3] = 'Y'
+        extractor.failing = set([ 'PenguinsAreCute.pdf' ])
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        self.papers[2][3] = 'N'
+        extractor.failing = set()
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        self.assertEqual(1, self.db.articles.count(is_read = True))
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((0, 3, 0), self._counts(counts))
+
+    def test_reimport_degraded_extraction(self):
+        extractor = MockExtractor(set(), set([ 'PenguinsAreCute.pdf' ]))
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        with self.db.articles.retrieve(normalized_title = \
+                                           'penguins are cute') as rs:
+            article = next(rs)
+        article.content = 'Penguins are very cute'
+        self.db.articles.update(article)
+        self.db.commit()
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        self.assertEqual('Penguins are very cute',
+                         self.db.articles.with_id(article.id).content)
+        extractor.degraded = set()
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((1, 2, 0), self._counts(counts))
+        counts = self._import(supervisor = MockSupervisor(extractor))
+
+        self.assertEqual((0, 3, 0), self._counts(counts))
+
+    def test_join_summaries_by_title(self):
+        self.summaries = [ [ 'TITLE', 'SUMMARY' ],
+                           [ 'Fun on a bun', 'Buns' ],
+                           [ 'Moo Moo You You', 'Moo' ],
+                           [ 'Cows are  COOL!', 'Cows' ] ]
+        join_keys = (SpreadsheetPath('Papers', 'TITLE'),
+                     SpreadsheetPath('Summaries', 'TITLE'))
+
+        counts = self._import(join_keys = join_keys)
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        self.assertEqual(2, counts.num_unmatched)
+        articles = sorted(self.db.articles.all, key = lambda a: a.id)
+        self.assertEqual([ 'Cows', '', 'Buns' ],
+                         [ a.summary for a in articles ])
+
+    def test_join_requires_key_for_every_sheet(self):
+        self.summaries = [ [ 'TITLE', 'SUMMARY' ] ]
+        with self.assertRaises(ValueError):
+            self._import(join_keys = (SpreadsheetPath('Papers', 'TITLE'), ))
+
+    def test_abstracts_from_file(self):
+        abstracts_file = os.path.join(self.content_dir, 'abstracts.txt')
+        with open(abstracts_file, 'w') as f:
+            f.write('#1 [Oral] Cows are cool!\n  A. Cow\n  Moo.\n\n' + \
+                    '#2 [Oral] Fun On A Bun\n  A. Bun\n  Buns.\n  Yum.\n')
+
+        counts = self._import(abstracts_file = abstracts_file)
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        articles = sorted(self.db.articles.all, key = lambda a: a.id)
+        self.assertEqual([ 'Moo.', '', 'Buns.\n  Yum.' ],
+                         [ a.abstract for a in articles ])
+
+    def test_abstracts_matched_by_similar_title(self):
+        abstracts_file = os.path.join(self.content_dir, 'abstracts.txt')
+        with open(abstracts_file, 'w') as f:
+            f.write('#1 [Oral] Cows Are Kool!\n  A. Cow\n  Moo.\n\n' + \
+                    '#2 [Oral] Penguins\n  A. Penguin\n  Wark.\n')
+
+        counts = self._import(abstracts_file = abstracts_file,
+                              abstract_match_threshold = 0.6)
+
+        self.assertEqual((3, 0, 0), self._counts(counts))
+        articles = sorted(self.db.articles.all, key = lambda a: a.id)
+        self.assertEqual([ 'Moo.', '', '' ],
+                         [ a.abstract for a in articles ])
+
+    def test_processor_for_enum_names_only(self):
+        abstracts_file = os.path.join(self.content_dir, 'abstracts.txt')
+        with open(abstracts_file, 'w') as f:
+            f.write('#1 [Oral] Cows are cool!\n  A. Cow\n  Moo.\n')
+        self._import(abstracts_file = abstracts_file)
+        (director, workbook) = self._director(abstracts_file = abstracts_file)
+        group = director.groups[0]
+
+        processor = director.processor_for(group, self.db,
+                                           enum_names_only = True)
+
+        self.assertIsNone(processor.abstracts)
+        self.assertEqual(set(), processor._known_fingerprints)
+        self.assertEqual((set([ 'Oral', 'Poster' ]), set([ 'Cows', 'Birds' ])),
+                         processor.collect_enum_names(workbook))
+        processor = director.processor_for(group, self.db)
+        self.assertIsNotNone(processor.abstracts)
+        self.assertEqual(3, len(processor._known_fingerprints))
+
+    def _import(self, **keywords):
+        (director, workbook) = self._director(**keywords)
+        return director.process(workbook, self.db)
+
+    def _director(self, incremental = True, join_keys = (),
+                  abstracts_file = None, abstract_match_threshold = None,
+                  supervisor = None):
+        if self.summaries:
+            summary_source = SpreadsheetPath('Summaries', 'SUMMARY')
+        else:
+            summary_source = None
+        if abstracts_file:
+            (abstract_source, abstracts_reader) = ('file', 'nips')
+        else:
+            (abstract_source, abstracts_reader) = (None, None)
+        group = DocumentGroupConfiguration(\
+            'DocumentGroup_1', SpreadsheetPath('Papers', 'TITLE'),
+            abstract_source, [ self.content_dir ], 3,
+            SpreadsheetPath('Papers', 'DOWNLOADED_AS'),
+            SpreadsheetPath('Papers', 'TYPE'),
+            SpreadsheetPath('Papers', 'AREA'), None, summary_source,
+            SpreadsheetPath('Papers', 'IS_READ'), abstracts_reader,
+            abstracts_file, 'mock' if supervisor else None, join_keys,
+            abstract_match_threshold)
+        configuration = MockConfiguration('ICML', 2018, [ group ])
+        workbook = MockWorkbook({ 'Papers' : self.papers,
+                                  'Summaries' : self.summaries })
+        self.metrics = ImportMetrics()
+        director = Director(configuration, self.db, incremental,
+                            AbstractCache(self.cache_dir), supervisor,
+                            self.metrics)
+        return (director, workbook)
+
+    def _counts(self, counts):
+        return (counts.num_imported, counts.num_unchanged, counts.num_failed)
+
+if __name__ == '__main__':
+    unittest.main()
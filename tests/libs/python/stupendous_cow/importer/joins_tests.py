@@ -0,0 +1,98 @@
+from stupendous_cow.importer.joins import *
+from stupendous_cow.importer.spreadsheets import SpreadsheetPath, Worksheet
+from stupendous_cow.util import normalize_title
+import pyexcel
+import unittest
+
+class MockWorkbook:
+    def __init__(self, sheets):
+        self._sheets = sheets
+
+    def __getitem__(self, name):
+        return Worksheet(pyexcel.Sheet(self._sheets[name], name = name))
+
+class JoinTests(unittest.TestCase):
+    def setUp(self):
+        papers = [ [ 'TITLE', 'TYPE' ],
+                   [ 'Cows Are Cool', 'Oral' ],
+                   [ 'Penguins Are Cute', 'Poster' ],
+                   [ 'Fun On A Bun', 'Oral' ] ]
+        summaries = [ [ 'PAPER', 'SUMMARY' ],
+                      [ 'penguins  are CUTE', 'Wark' ],
+                      [ 'Moo Moo You You', 'Moo' ],
+                      [ 'Cows are  cool', 'Moo moo' ],
+                      [ 'Cows Are Cool', 'Moo again' ] ]
+        self.workbook = MockWorkbook({ 'Papers' : papers,
+                                       'Summaries' : summaries })
+
+    def test_key_join(self):
+        join = KeyJoin(SpreadsheetPath('Papers', 'TITLE'),
+                       [ SpreadsheetPath('Summaries', 'PAPER') ])
+        joined = [ self._values(rows) for rows in \
+                       join.rows(self.workbook, ('Papers', 'Summaries')) ]
+
+        self.assertEqual([ ('Cows Are Cool', 'Moo moo'),
+                           ('Penguins Are Cute', 'Wark'),
+                           ('Fun On A Bun', None) ], joined)
+        self.assertEqual({ 'Papers' : [ (4, 'fun on a bun') ],
+                           'Summaries' : [ (3, 'moo moo you you'),
+                                           (5, 'cows are cool') ] },
+                         join.unmatched)
+
+    def test_key_join_on_titles(self):
+        self.workbook._sheets['Summaries'][1][0] = u'Penguins: Are Cute!'
+        join = KeyJoin(SpreadsheetPath('Papers', 'TITLE'),
+                       [ SpreadsheetPath('Summaries', 'PAPER') ],
+                       title_join_key)
+        joined = [ self._values(rows) for rows in \
+                       join.rows(self.workbook, ('Papers', 'Summaries')) ]
+
+        self.assertEqual([ ('Cows Are Cool', 'Moo moo'),
+                           ('Penguins Are Cute', 'Wark'),
+                           ('Fun On A Bun', None) ], joined)
+
+    def test_key_join_primary_only(self):
+        join = KeyJoin(SpreadsheetPath('Papers', 'TITLE'),
+                       [ SpreadsheetPath('Summaries', 'PAPER') ])
+        joined = [ self._values(rows) for rows in \
+                       join.rows(self.workbook, ('Papers', )) ]
+
+        self.assertEqual(3, len(joined))
+        self.assertEqual({ 'Papers' : [ ] }, join.unmatched)
+
+    def test_positional_join(self):
+        join = PositionalJoin()
+        joined = [ self._values(rows) for rows in \
+                       join.rows(self.workbook, ('Papers', 'Summaries')) ]
+
+        self.assertEqual([ ('Cows Are Cool', 'Wark'),
+                           ('Penguins Are Cute', 'Moo'),
+                           ('Fun On A Bun', 'Moo moo'),
+                           (None, 'Moo again') ], joined)
+        self.assertEqual({ 'Papers' : [ ], 'Summaries' : [ (5, None) ] },
+                         join.unmatched)
+
+    def test_join_key(self):
+        self.assertEqual('cows are cool', join_key(' Cows\t are COOL '))
+        self.assertEqual(join_key(17), join_key(17.0))
+        self.assertEqual(join_key(17), join_key('17'))
+        self.assertNotEqual(join_key(17.5), join_key(175))
+        self.assertNotEqual(join_key('A-1'), join_key('A1'))
+        self.assertNotEqual(join_key('Cows!'), join_key('Cows'))
+        self.assertIsNone(join_key(None))
+
+    def test_title_join_key(self):
+        self.assertEqual(normalize_title(u'Caf\xe9 Cows: A-1!'),
+                         title_join_key(u'caf\xe9  cows A1'))
+        self.assertEqual(title_join_key('Cows!'), title_join_key('cows'))
+        self.assertEqual(join_key(17.5), title_join_key(17.5))
+        self.assertIsNone(title_join_key(None))
+
+    def _values(self, rows):
+        paper = rows.get('Papers', None)
+        summary = rows.get('Summaries', None)
+        return (paper['TITLE'] if paper else None,
+                summary['SUMMARY'] if summary else None)
+
+if __name__ == '__main__':
+    unittest.main()
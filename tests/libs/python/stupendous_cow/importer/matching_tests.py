@@ -0,0 +1,56 @@
+from stupendous_cow.importer.matching import *
+import random
+import unittest
+
+TITLES = ( 'cows are cool', 'penguins are cute', 'fun on a bun',
+           'deep learning for cows', 'deep learning for penguins',
+           'a bayesian view of cows' )
+
+class TitleMatcherTests(unittest.TestCase):
+    def test_exact_match(self):
+        matcher = TitleMatcher(TITLES, 0.8)
+        self.assertEqual(('fun on a bun', 1.0),
+                         matcher.best_match('fun on a bun'))
+
+    def test_similar_match(self):
+        matcher = TitleMatcher(TITLES, 0.6)
+        (title, score) = matcher.best_match('deep learning for cow')
+        self.assertEqual('deep learning for cows', title)
+        self.assertTrue(0.6 <= score < 1.0)
+
+    def test_no_match_below_threshold(self):
+        matcher = TitleMatcher(TITLES, 0.8)
+        self.assertIsNone(matcher.best_match('cows'))
+        self.assertIsNone(matcher.best_match('moo moo you you'))
+        self.assertIsNone(matcher.best_match(''))
+
+    def test_invalid_threshold(self):
+        for threshold in (0.0, -0.5, 1.5):
+            with self.assertRaises(ValueError):
+                TitleMatcher(TITLES, threshold)
+
+    def test_same_as_exhaustive_search(self):
+        rng = random.Random(1)
+        words = ('cows', 'penguins', 'deep', 'learning', 'the', 'of', 'bun',
+                 'graph', 'sparse', 'networks', 'moo', 'wark')
+        def title():
+            return ' '.join(rng.choice(words) \
+                                for i in xrange(rng.randint(1, 6)))
+        titles = list(set(title() for i in xrange(300)))
+        queries = [ title() for i in xrange(300) ]
+
+        for threshold in (0.3, 0.6, 0.9):
+            matcher = TitleMatcher(titles, threshold)
+            for q in queries:
+                grams = trigrams(q)
+                scores = [ jaccard(grams, trigrams(t)) for t in titles ]
+                best = max(scores) if grams else 0.0
+                match = matcher.best_match(q)
+                if best >= threshold:
+                    self.assertIsNotNone(match, q)
+                    self.assertAlmostEqual(best, match[1])
+                else:
+                    self.assertIsNone(match, q)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+from stupendous_cow.importer.metrics import *
+from stupendous_cow.importer.generic_ss.director import ImportCounts
+from stupendous_cow.importer.supervision import ExtractionStats
+import datetime
+import json
+import time
+import unittest
+
+class ImportMetricsTests(unittest.TestCase):
+    def test_stage(self):
+        metrics = ImportMetrics()
+        for i in xrange(3):
+            with metrics.stage('binding'):
+                time.sleep(0.01)
+
+        self.assertEqual(3, metrics.calls['binding'])
+        self.assertTrue(metrics.seconds['binding'] >= 0.03)
+        self.assertEqual(0, metrics.calls['db_save'])
+
+    def test_stage_records_time_on_error(self):
+        metrics = ImportMetrics()
+        with self.assertRaises(ValueError):
+            with metrics.stage('extraction'):
+                raise ValueError()
+        self.assertEqual(1, metrics.calls['extraction'])
+
+    def test_timed(self):
+        def rows():
+            for i in xrange(4):
+                time.sleep(0.01)
+                yield i
+
+        metrics = ImportMetrics()
+        self.assertEqual([ 0, 1, 2, 3 ],
+                         list(metrics.timed('sheet_read', rows())))
+        self.assertEqual(4, metrics.calls['sheet_read'])
+        self.assertTrue(metrics.seconds['sheet_read'] >= 0.04)
+
+    def test_add(self):
+        metrics = ImportMetrics()
+        other = ImportMetrics()
+        other.add_time('db_save', 1.5, 3)
+        metrics.add(other).add(other)
+
+        self.assertEqual(3.0, metrics.seconds['db_save'])
+        self.assertEqual(6, metrics.calls['db_save'])
+        self.assertTrue('db_save' in metrics.format())
+
+    def test_run_report(self):
+        metrics = ImportMetrics()
+        metrics.add_time('commit', 0.25)
+        report = run_report('generic_ss_importer',
+                            datetime.datetime(2018, 6, 1, 12, 0, 0, 5),
+                            2.0, ImportCounts(3, 1, 0), metrics,
+                            ExtractionStats(), workbook = 'nips.ods')
+        report = json.loads(json.dumps(report))
+
+        self.assertEqual('2018-06-01T12:00:00', report['started_at'])
+        self.assertEqual(4, report['num_rows'])
+        self.assertEqual(2.0, report['rows_per_second'])
+        self.assertEqual(3, report['counts']['num_imported'])
+        self.assertEqual({ 'seconds' : 0.25, 'calls' : 1 },
+                         report['stages']['commit'])
+        self.assertEqual(0, report['extraction']['num_documents'])
+        self.assertEqual('nips.ods', report['workbook'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 from stupendous_cow.importer.spreadsheets import *
 import inspect
+import os
 import os.path
+import pyexcel
+import shutil
+import tempfile
 import unittest
 
 resource_dir = None
@@ -23,6 +27,14 @@ class WorkbookTests(unittest.TestCase):
         self.assertEqual(3, sheet.num_columns)
         self.assertEqual(('TYPE', 'TITLE', 'RATING'), tuple(sheet.columns))
 
+    def test_column_index(self):
+        workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
+        sheet = workbook['beta']
+        self.assertEqual(1, sheet.column_index('TITLE'))
+        self.assertEqual(2, sheet.column_index(2))
+        with self.assertRaises(IndexError):
+            sheet.column_index('SUMMARY')
+
     def test_read_row_by_position(self):
         workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
         sheet = workbook['alpha']
@@ -54,8 +66,116 @@ class WorkbookTests(unittest.TestCase):
         self.assertEqual([ 10, 'abc', 1.5, 'cows' ], data[0])
         self.assertEqual([ 20, 'def', 2.25, 'penguins' ], data[1])
         self.assertEqual([ 30, 'ghi', 3.5, 'love' ], data[2])
-        
-        
+
+    def test_accessor(self):
+        workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
+        sheet = workbook['beta']
+        get_title = sheet.accessor('TITLE')
+        get_rating = sheet.accessor(2)
+
+        self.assertEqual([ ('Cows Are Cool', 3), ('Penguins Are Cute', 4) ],
+                         [ (get_title(row), get_rating(row)) for row in sheet ])
+        with self.assertRaises(IndexError):
+            sheet.accessor('SUMMARY')
+
+    def test_read_sheet_by_index(self):
+        workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
+        sheet = workbook[1]
+        self.assertEqual('beta', sheet.name)
+        self.assertIs(sheet, workbook['beta'])
+
+    def test_read_rows_twice(self):
+        workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
+        sheet = workbook['beta']
+
+        first = [ [ row[x] for x in row.columns ] for row in sheet ]
+        second = [ [ row[x] for x in row.columns ] for row in sheet ]
+        self.assertEqual([ [ 'Oral', 'Cows Are Cool', 3 ],
+                           [ 'Spotlight', 'Penguins Are Cute', 4 ] ], first)
+        self.assertEqual(first, second)
+
+    def test_read_short_rows(self):
+        (fd, filename) = tempfile.mkstemp(suffix = '.csv')
+        try:
+            os.write(fd, 'TITLE,TYPE,AREA\nCows Are Cool,Oral\n' + \
+                         'Penguins Are Cute,Poster,Birds\n')
+            os.close(fd)
+            workbook = Workbook(filename)
+            self.assertEqual([ os.path.basename(filename) ],
+                             workbook.sheet_names)
+
+            data = [ [ row[x] for x in row.columns ] for row in workbook[0] ]
+            self.assertEqual([ [ 'Cows Are Cool', 'Oral', '' ],
+                               [ 'Penguins Are Cute', 'Poster', 'Birds' ] ],
+                             data)
+        finally:
+            os.unlink(filename)
+
+    def test_sheets_of_unstreamed_formats_share_one_book(self):
+        calls = [ ]
+        get_book = pyexcel.get_book
+        def counting_get_book(**keywords):
+            calls.append(keywords)
+            return get_book(**keywords)
+        pyexcel.get_book = counting_get_book
+        try:
+            workbook = Workbook(os.path.join(resource_dir, 'test_ss.ods'))
+            self.assertFalse(workbook.is_streamed)
+            self.assertEqual(('alpha', 'beta'), tuple(workbook.sheet_names))
+            self.assertEqual(3, len(list(workbook['alpha'])))
+            self.assertEqual(2, len(list(workbook['beta'])))
+            self.assertEqual(2, len(list(workbook['beta'])))
+            workbook.close()
+        finally:
+            pyexcel.get_book = get_book
+        self.assertEqual(1, len(calls))
+
+    def test_streamed_sheet_is_opened_on_first_use(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'papers.csv')
+            workbook = Workbook(filename)
+            self.assertTrue(workbook.is_streamed)
+            sheet = workbook['papers.csv']
+            with open(filename, 'w') as output:
+                output.write('TITLE,TYPE\nCows Are Cool,Oral\n')
+            self.assertEqual(('TITLE', 'TYPE'), tuple(sheet.columns))
+            self.assertEqual([ ('Cows Are Cool', 'Oral') ],
+                             [ tuple(row) for row in sheet ])
+            workbook.close()
+        finally:
+            shutil.rmtree(directory)
+
+class RowTests(unittest.TestCase):
+    def setUp(self):
+        self.row_type = Row.for_columns([ 'TITLE', 'TYPE', 'AREA' ])
+
+    def test_short_row_is_padded(self):
+        row = self.row_type.from_cells([ 'Cows Are Cool' ])
+        self.assertEqual(3, len(row))
+        self.assertEqual('', row['AREA'])
+        self.assertEqual('', row[-1])
+
+    def test_long_row_is_truncated(self):
+        row = self.row_type.from_cells([ 'Cows Are Cool', 'Oral', 'Cows', 3 ])
+        self.assertEqual(('Cows Are Cool', 'Oral', 'Cows'), tuple(row))
+        with self.assertRaises(IndexError):
+            row[3]
+
+    def test_invalid_index(self):
+        row = self.row_type.from_cells([ 'Cows Are Cool', 'Oral', 'Cows' ])
+        with self.assertRaises(IndexError):
+            row['SUMMARY']
+        with self.assertRaises(TypeError):
+            row[1.5]
+
+    def test_rows_do_not_share_columns_across_sheets(self):
+        other_type = Row.for_columns([ 'A', 'B' ])
+        self.assertEqual(('TITLE', 'TYPE', 'AREA'),
+                         self.row_type.from_cells([ ]).columns)
+        self.assertEqual(('A', 'B'), other_type.from_cells([ ]).columns)
+
+
 def set_resource_dir():
     global resource_dir
     (path, _) = os.path.split(os.path.abspath(inspect.stack()[0][1]))
@@ -0,0 +1,167 @@
+from stupendous_cow.importer.supervision import *
+from stupendous_cow.importer.extractors import PdfExtractionError, \
+    PdfExtractionTimeout
+import os
+import os.path
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+# A fake pdftotext that hangs on files named hang*.pdf unless only the first
+# pages are extracted, crashes on files named crash*.pdf and logs every call
+FAKE_PDFTOTEXT = """#!%s
+import os.path, sys, time
+filename = sys.argv[-2]
+name = os.path.basename(filename)
+with open(os.path.join(os.path.dirname(filename), 'calls.log'), 'a') as log:
+    log.write(name + '\\n')
+if name.startswith('hang') and ('-l' not in sys.argv):
+    time.sleep(30)
+if name.startswith('crash'):
+    sys.stderr.write('Crashed')
+    sys.exit(2)
+sys.stdout.write('Text of ' + name)
+"""
+
+class SupervisedExtractorTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        pdftotext = os.path.join(self.dir, 'pdftotext')
+        with open(pdftotext, 'w') as f:
+            f.write(FAKE_PDFTOTEXT % sys.executable)
+        os.chmod(pdftotext, stat.S_IRWXU)
+        for name in ('cows.pdf', 'hang.pdf', 'crash.pdf'):
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(name)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.dir + os.pathsep + self.path
+        self.quarantine_filename = os.path.join(self.dir, 'quarantine.json')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir)
+
+    def test_extract(self):
+        supervisor = self._supervisor()
+        document = supervisor.extractor_for('default_pdf').extract(\
+            self._pdf('cows.pdf'))
+
+        self.assertEqual('Text of cows.pdf', document.body)
+        self.assertFalse(document.degraded)
+        self.assertEqual(1, len(supervisor.stats.latencies))
+        self.assertEqual((0, 0, 0, 0, 0), self._failures(supervisor.stats))
+
+    def test_retry_and_fall_back_after_timeout(self):
+        supervisor = self._supervisor('first_pages_pdf')
+        document = supervisor.extractor_for('default_pdf').extract(\
+            self._pdf('hang.pdf'))
+
+        self.assertEqual('Text of hang.pdf', document.body)
+        self.assertTrue(document.degraded)
+        self.assertEqual([ 'hang.pdf' ] * 3, self._calls())
+        stats = supervisor.stats
+        self.assertEqual(2, stats.num_timeouts)
+        self.assertEqual(1, stats.num_retries)
+        self.assertEqual(1, stats.num_fallbacks)
+        self.assertEqual(0, stats.num_failed)
+        self.assertTrue(stats.percentile(50) < 5)
+
+    def test_no_fallback_by_default(self):
+        supervisor = self._supervisor()
+        with self.assertRaises(PdfExtractionTimeout):
+            supervisor.extractor_for('default_pdf').extract(\
+                self._pdf('hang.pdf'))
+
+        self.assertEqual([ 'hang.pdf' ] * 2, self._calls())
+        self.assertEqual((2, 0, 1, 0, 1), self._failures(supervisor.stats))
+
+    def test_crash_is_not_retried(self):
+        supervisor = self._supervisor('first_pages_pdf')
+        with self.assertRaises(PdfExtractionError):
+            supervisor.extractor_for('default_pdf').extract(\
+                self._pdf('crash.pdf'))
+
+        self.assertEqual([ 'crash.pdf' ] * 2, self._calls())
+        self.assertEqual((0, 2, 0, 1, 1), self._failures(supervisor.stats))
+
+    def test_quarantine(self):
+        for run in xrange(2):
+            supervisor = self._supervisor()
+            with self.assertRaises(PdfExtractionError):
+                supervisor.extractor_for('default_pdf').extract(\
+                    self._pdf('crash.pdf'))
+            supervisor.quarantine.save()
+
+        supervisor = self._supervisor()
+        with self.assertRaises(PdfExtractionError):
+            supervisor.extractor_for('default_pdf').extract(\
+                self._pdf('crash.pdf'))
+        self.assertEqual(2, len(self._calls()))
+        self.assertEqual(1, supervisor.stats.num_quarantined)
+
+        # A file that changes gets another chance
+        with open(self._pdf('crash.pdf'), 'w') as f:
+            f.write('A new version of crash.pdf')
+        self.assertFalse(self._supervisor().quarantine.is_quarantined(\
+            self._pdf('crash.pdf')))
+
+    def test_one_failure_per_run(self):
+        quarantine = Quarantine(self.quarantine_filename, max_failures = 2)
+        self.assertFalse(quarantine.record_failure(self._pdf('cows.pdf')))
+        self.assertFalse(quarantine.record_failure(self._pdf('cows.pdf')))
+        self.assertFalse(quarantine.is_quarantined(self._pdf('cows.pdf')))
+        quarantine.save()
+
+        quarantine = Quarantine(self.quarantine_filename, max_failures = 2)
+        self.assertTrue(quarantine.record_failure(self._pdf('cows.pdf')))
+
+    def test_success_clears_failures(self):
+        quarantine = Quarantine(self.quarantine_filename, max_failures = 2)
+        quarantine.record_failure(self._pdf('cows.pdf'))
+        quarantine.record_success(self._pdf('cows.pdf'))
+        self.assertFalse(quarantine.record_failure(self._pdf('cows.pdf')))
+
+    def test_unknown_extractor(self):
+        with self.assertRaises(ValueError):
+            self._supervisor().extractor_for('moo')
+
+    def _supervisor(self, fallback = None):
+        quarantine = Quarantine(self.quarantine_filename, max_failures = 2)
+        return ExtractionSupervisor(deadline = 0.5, fallback = fallback,
+                                    quarantine = quarantine)
+
+    def _pdf(self, name):
+        return os.path.join(self.dir, name)
+
+    def _calls(self):
+        with open(os.path.join(self.dir, 'calls.log')) as f:
+            return f.read().split()
+
+    def _failures(self, stats):
+        return (stats.num_timeouts, stats.num_crashes, stats.num_retries,
+                stats.num_fallbacks, stats.num_failed)
+
+class ExtractionStatsTests(unittest.TestCase):
+    def test_percentile(self):
+        stats = ExtractionStats()
+        self.assertIsNone(stats.percentile(50))
+        stats.latencies = [ float(x) for x in xrange(100, 0, -1) ]
+        self.assertEqual(50.0, stats.percentile(50))
+        self.assertEqual(95.0, stats.percentile(95))
+        self.assertEqual(99.0, stats.percentile(99))
+        self.assertEqual(1.0, stats.percentile(0))
+
+    def test_add(self):
+        stats = ExtractionStats()
+        other = ExtractionStats()
+        other.latencies = [ 1.0, 2.0 ]
+        other.num_timeouts = 3
+        stats.add(other).add(other)
+        self.assertEqual([ 1.0, 2.0, 1.0, 2.0 ], stats.latencies)
+        self.assertEqual(6, stats.num_timeouts)
+        self.assertTrue('p99' in stats.format())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from stupendous_cow.profiling import *
+import os
+import os.path
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+@span('moo')
+def moo(x, y = 1):
+    return x + y
+
+@span('busy')
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return 'done'
+
+def call_busy():
+    return busy(0.2)
+
+class ProfilingTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        stop_profiling()
+        shutil.rmtree(self.dir)
+
+    def test_span_when_not_profiling(self):
+        self.assertFalse(is_profiling())
+        self.assertEqual(3, moo(1, y = 2))
+        self.assertEqual('moo', moo.__name__)
+
+    def test_cprofile(self):
+        filename = os.path.join(self.dir, 'out.prof')
+        start_profiling('cprofile', filename)
+        self.assertTrue(is_profiling())
+        self.assertEqual(3, moo(2))
+        self.assertEqual(filename, stop_profiling())
+        self.assertFalse(is_profiling())
+
+        stats = pstats.Stats(filename)
+        calls = dict((name, value[1]) \
+                         for ((f, line, name), value) in stats.stats.items())
+        self.assertEqual(1, calls['span_moo'])
+        self.assertEqual(1, calls['moo'])
+
+    def test_sample(self):
+        filename = os.path.join(self.dir, 'out.folded')
+        start_profiling('sample', filename)
+        self.assertEqual('done', call_busy())
+        stop_profiling()
+
+        with open(filename) as f:
+            lines = [ line.rsplit(' ', 1) for line in f.read().splitlines() ]
+        self.assertTrue(lines)
+        busy_samples = [ (stack, int(n)) for (stack, n) in lines \
+                             if stack.endswith(':busy') ]
+        self.assertTrue(busy_samples)
+        for (stack, n) in busy_samples:
+            self.assertTrue(stack.endswith(\
+                'profiling_tests.py:call_busy;[busy];profiling_tests.py:busy'),
+                            stack)
+        # About 40 samples for 0.2 seconds at one every 5 ms
+        self.assertTrue(sum(n for (stack, n) in busy_samples) >= 20)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            start_profiling('moo')
+        self.assertFalse(is_profiling())
+
+    def test_already_profiling(self):
+        start_profiling('cprofile', os.path.join(self.dir, 'out.prof'))
+        with self.assertRaises(ValueError):
+            start_profiling('sample', os.path.join(self.dir, 'out.folded'))
+
+    def test_environment_variable(self):
+        filename = os.path.join(self.dir, 'env.folded')
+        env = dict(os.environ)
+        env[PROFILE_ENVIRONMENT_VARIABLE] = 'sample:' + filename
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        code = 'from stupendous_cow.profiling import *\n' + \
+               'import time\n' + \
+               'assert not is_profiling()\n' + \
+               'start_profiling_from_environment()\n' + \
+               'end = time.time() + 0.1\n' + \
+               'while time.time() < end: pass\n'
+        subprocess.check_call([ sys.executable, '-c', code ], env = env)
+        self.assertTrue(os.path.getsize(filename) > 0)
+
+    def test_discard_profiling(self):
+        filename = os.path.join(self.dir, 'out.prof')
+        start_profiling('cprofile', filename)
+        discard_profiling()
+        self.assertFalse(is_profiling())
+        self.assertIsNone(stop_profiling())
+        self.assertFalse(os.path.exists(filename))
+
+if __name__ == '__main__':
+    unittest.main()
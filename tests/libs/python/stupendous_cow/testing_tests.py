@@ -0,0 +1,83 @@
+"""Unit tests for the template databases in stupendous_cow.testing"""
+from stupendous_cow.testing import *
+from stupendous_cow.data_model import Venue
+from stupendous_cow.db.main import Database
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+class TemplateDatabaseTests(unittest.TestCase):
+    def test_copies_are_independent(self):
+        first = SEEDED_TEMPLATE.open()
+        second = SEEDED_TEMPLATE.open()
+        try:
+            first.venues.add(Venue('Moo Conference', 'MOO'))
+            first.commit()
+            self.assertIsNotNone(first.venues.with_abbreviation('MOO'))
+            self.assertIsNone(second.venues.with_abbreviation('MOO'))
+            self.assertEqual(8, len(second.venues.all))
+        finally:
+            first.close()
+            second.close()
+        third = SEEDED_TEMPLATE.open()
+        try:
+            self.assertIsNone(third.venues.with_abbreviation('MOO'))
+        finally:
+            third.close()
+
+    def test_copy_has_schema_and_ids(self):
+        sql = "SELECT type, name FROM sqlite_master ORDER BY name"
+        template = sqlite3.connect(SEEDED_TEMPLATE.filename)
+        try:
+            schema = template.execute(sql).fetchall()
+        finally:
+            template.close()
+
+        connection = SEEDED_TEMPLATE.connect()
+        try:
+            self.assertEqual(schema, connection.execute(sql).fetchall())
+            self.assertTrue(('index', 'articles_by_venue_year_title') in \
+                                schema)
+            db = Database(':memory:', connection)
+            self.assertEqual(9, db.venues.add(Venue('Moo Conference',
+                                                    'MOO')).id)
+        finally:
+            connection.close()
+
+    def test_populate_and_copy_to_file(self):
+        calls = [ ]
+        def populate(db):
+            calls.append(db)
+            db.venues.add(Venue('Moo Conference', 'MOO'))
+        template = TemplateDatabase('moo', populate)
+        directory = tempfile.mkdtemp()
+        try:
+            for i in xrange(2):
+                filename = template.copy_to(os.path.join(directory,
+                                                         'moo%d.db' % i))
+                db = Database(filename)
+                try:
+                    self.assertIsNotNone(db.venues.with_abbreviation('MOO'))
+                finally:
+                    db.close()
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(1, len(calls))
+
+    def test_corpus_template(self):
+        template = corpus_template(50, seed = 3, num_categories = 2)
+        self.assertIs(template,
+                      corpus_template(50, num_categories = 2, seed = 3))
+        self.assertIsNot(template, corpus_template(50, seed = 4,
+                                                   num_categories = 2))
+        db = template.open()
+        try:
+            self.assertEqual(50, db.articles.count())
+            self.assertEqual(3, len(db.categories.all))
+        finally:
+            db.close()
+
+if __name__ == '__main__':
+    unittest.main()